@@ -0,0 +1,77 @@
+"""
+生成产物访问API - 经存储后端提供 /generated 与 /static/generated 下的文件
+本地后端直接返回文件，S3后端转发对象流或重定向到预签名URL，服务实例无需共享磁盘。
+非内容寻址的文件（编码服务的工作目录、单次截图等直接落盘的产物）先在本机生成目录中查找。
+"""
+
+import logging
+import os
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+
+from ..storage import get_storage
+from ..storage.base import normalize_key
+from ..storage.content_store import CAS_PREFIX
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# proxy: 由服务转发对象内容；redirect: 302跳转到存储的预签名URL（减少服务带宽）
+SERVE_MODE = os.getenv("STORAGE_SERVE_MODE", "proxy")
+SIGNED_URL_TTL = int(os.getenv("STORAGE_SIGNED_URL_TTL", "3600"))
+# 编码服务（Claude工作目录）与直接落盘产物所在的本机目录
+LOCAL_GENERATED_DIR = os.getenv("GENERATED_LOCAL_DIR", "/app/app/static/generated")
+
+# 内容寻址对象永不变化，可长期缓存
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+
+def _local_generated_path(key: str) -> Optional[str]:
+    path = os.path.join(LOCAL_GENERATED_DIR, normalize_key(key))
+    return path if os.path.isfile(path) else None
+
+
+async def _serve(key: str, request: Request):
+    storage = get_storage()
+    content_addressed = key.startswith(f"{CAS_PREFIX}/")
+    cache_control = IMMUTABLE_CACHE if content_addressed else "public, max-age=3600"
+
+    try:
+        local_path = storage.local_path(key)
+        if local_path is None and not content_addressed:
+            # 远端存储后端：未经存储层写入的本机文件直接返回
+            fallback = _local_generated_path(key)
+            if fallback:
+                return FileResponse(fallback, headers={"Cache-Control": cache_control})
+    except ValueError:
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    if local_path is not None:
+        if not os.path.isfile(local_path):
+            raise HTTPException(status_code=404, detail="文件不存在")
+        return FileResponse(local_path, headers={"Cache-Control": cache_control})
+
+    if SERVE_MODE == "redirect":
+        return RedirectResponse(storage.signed_url(key, SIGNED_URL_TTL), status_code=302)
+
+    stat = await storage.stat(key)
+    if stat is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    headers = {"Cache-Control": cache_control, "Content-Length": str(stat["size"])}
+    if request.method == "HEAD":
+        return StreamingResponse(iter(()), media_type=stat["content_type"], headers=headers)
+    return StreamingResponse(storage.stream(key), media_type=stat["content_type"], headers=headers)
+
+
+@router.api_route("/generated/{key:path}", methods=["GET", "HEAD"])
+async def get_generated_file(key: str, request: Request):
+    return await _serve(key, request)
+
+
+@router.api_route("/static/generated/{key:path}", methods=["GET", "HEAD"])
+async def get_static_generated_file(key: str, request: Request):
+    return await _serve(key, request)
@@ -4,10 +4,11 @@ HTML转图片API - 为小程序提供HTML内容的图片渲染服务
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Dict, Optional
 import logging
 
 from ..services.html_to_image import HTMLToImageService
+from ..services.render_scheduler import RenderRejected, get_render_scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -18,8 +19,19 @@ class HTMLToImageRequest(BaseModel):
     width: Optional[int] = 375
     height: Optional[int] = 600
     format: Optional[str] = "png"
+    device_scale: Optional[float] = 1
+    quality: Optional[int] = None
     filename: Optional[str] = None
 
+class CardImageRequest(BaseModel):
+    layout: str = "postcard"
+    data: Dict[str, Any]
+    width: Optional[int] = 375
+    height: Optional[int] = 600
+    format: Optional[str] = "png"
+    device_scale: Optional[float] = 1
+    quality: Optional[int] = None
+
 class HTMLToImageResponse(BaseModel):
     success: bool
     image_url: Optional[str] = None
@@ -29,6 +41,7 @@ class HTMLToImageResponse(BaseModel):
     height: Optional[int] = None
     format: Optional[str] = None
     fallback: Optional[bool] = False
+    cached: Optional[bool] = False
     error: Optional[str] = None
 
 # 初始化HTML转图片服务
@@ -48,7 +61,9 @@ async def convert_html_to_image(request: HTMLToImageRequest):
             output_filename=request.filename,
             width=request.width,
             height=request.height,
-            format=request.format
+            format=request.format,
+            device_scale=request.device_scale,
+            quality=request.quality
         )
         
         if result:
@@ -58,6 +73,10 @@ async def convert_html_to_image(request: HTMLToImageRequest):
             logger.error("❌ HTML转图片失败")
             raise HTTPException(status_code=500, detail="HTML转图片失败")
             
+    except RenderRejected as e:
+        # 渲染过载：明确返回503，客户端稍后重试
+        logger.warning(f"⚠️ HTML转图片被拒绝: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"❌ HTML转图片API异常: {e}")
         return HTMLToImageResponse(
@@ -65,6 +84,49 @@ async def convert_html_to_image(request: HTMLToImageRequest):
             error=str(e)
         )
 
+@router.post("/card-image", response_model=HTMLToImageResponse)
+async def render_card_image(request: CardImageRequest):
+    """
+    固定版式卡片（签体挂件/默认明信片）直接合成图片，不经过浏览器
+    """
+    from ..services.card_compositor import LAYOUTS, get_card_compositor
+
+    if request.layout not in LAYOUTS:
+        raise HTTPException(status_code=400, detail=f"不支持的卡片版式: {request.layout}")
+    if not get_card_compositor().background_allowed(request.data.get("image_url")):
+        # 接口无需鉴权：背景图只接受内容存储中的图片或允许的来源，不代为请求任意URL
+        raise HTTPException(status_code=400, detail="不支持的背景图来源")
+
+    logger.info(f"🎴 卡片合成请求: {request.layout} {request.width}x{request.height}")
+    result = await html_to_image_service.render_card(
+        layout=request.layout,
+        data=request.data,
+        width=request.width,
+        height=request.height,
+        format=request.format,
+        device_scale=request.device_scale,
+        quality=request.quality
+    )
+    if not result:
+        return HTMLToImageResponse(success=False, error="卡片合成失败")
+    return HTMLToImageResponse(**result)
+
+@router.get("/html-to-image/stats")
+async def get_render_stats():
+    """渲染调度、常驻渲染进程与截图缓存的运行指标"""
+    from ..services.html_renderer import get_html_renderer
+    from ..services.render_cache import get_render_cache
+
+    try:
+        cache_stats = await get_render_cache().get_stats()
+    except Exception as e:
+        cache_stats = {"error": str(e)}
+    return {
+        "scheduler": get_render_scheduler().get_stats(),
+        "renderer": await get_html_renderer().get_stats(),
+        "cache": cache_stats
+    }
+
 @router.get("/html-to-image/{filename}")
 async def get_image_info(filename: str):
     """获取图片信息"""
@@ -82,8 +144,8 @@ async def get_image_info(filename: str):
 async def cleanup_old_images(max_age_hours: int = 24):
     """清理旧图片文件"""
     try:
-        await html_to_image_service.cleanup_old_images(max_age_hours)
-        return {"message": f"已清理超过{max_age_hours}小时的旧图片"}
+        deleted = await html_to_image_service.cleanup_old_images(max_age_hours)
+        return {"message": f"已清理超过{max_age_hours}小时的旧图片", "deleted": deleted}
     except Exception as e:
         logger.error(f"清理旧图片失败: {e}")
         raise HTTPException(status_code=500, detail="清理旧图片失败")
@@ -1,27 +1,34 @@
 """
 上传API - 处理情绪图片上传
 """
-from fastapi import APIRouter, File, UploadFile, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import asyncio
+import hashlib
 import logging
 import os
-import uuid
-from typing import Dict, Any
-import aiofiles
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
 from PIL import Image
 import io
 
+try:
+    import python_multipart as multipart
+except ImportError:  # python-multipart < 0.0.13
+    import multipart
+
+from ..services.image_normalizer import InvalidImage, get_image_normalizer
+from ..storage import UploadTooLarge, get_content_store
+
 router = APIRouter()
 logger = logging.getLogger(__name__)
 security = HTTPBearer()
 
-# 配置上传目录
-UPLOAD_DIR = "/app/app/static/generated/emotions"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
 # 支持的图片格式
 ALLOWED_FORMATS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
+# multipart边界与其他表单字段的余量（仅用于按Content-Length提前拒绝）
+MULTIPART_OVERHEAD = 64 * 1024
 
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """简单的token验证（实际项目中应该验证JWT）"""
@@ -52,60 +59,45 @@ async def upload_emotion_image_base64(request: dict, user_info: Dict = Depends(v
         # 获取base64数据
         image_base64 = request.get('image_base64')
         image_format = request.get('format', 'png').lower()
-        estimated_size = request.get('size', 0)
         
         if not image_base64:
             raise HTTPException(status_code=400, detail="缺少base64图片数据")
         
-        # 验证base64数据
-        try:
-            import base64
-            image_bytes = base64.b64decode(image_base64)
-        except Exception as e:
-            logger.error(f"base64解码失败: {e}")
-            raise HTTPException(status_code=400, detail="无效的base64数据")
-        
-        # 检查文件大小
-        actual_size = len(image_bytes)
-        if actual_size > MAX_FILE_SIZE:
+        # 检查文件大小（base64长度约为原始字节的4/3，先按长度拒绝明显超限的数据）
+        if len(image_base64) > MAX_FILE_SIZE * 4 // 3 + 4:
             raise HTTPException(status_code=400, detail=f"文件大小超过限制({MAX_FILE_SIZE/1024/1024}MB)")
         
-        # 验证是否为有效图片
+        # 解码一次并规范化（进程池中执行：摆正方向、缩放、去元数据、转WebP），按内容哈希保存
         try:
-            image = Image.open(io.BytesIO(image_bytes))
-            image.verify()  # 验证图片完整性
-        except Exception as e:
+            raw = get_image_normalizer().decode_base64(image_base64)
+            raw_hash = await asyncio.get_event_loop().run_in_executor(None, lambda: hashlib.sha256(raw).hexdigest())
+            stored = await get_image_normalizer().normalize_and_store(get_content_store(), raw_hash, raw)
+        except InvalidImage as e:
             logger.error(f"图片验证失败: {e}")
             raise HTTPException(status_code=400, detail="无效的图片数据")
         
-        # 生成唯一文件名
-        unique_filename = f"emotion_{uuid.uuid4().hex[:12]}.{image_format}"
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
-        
-        # 保存文件
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(image_bytes)
-        
-        # 构建可访问的URL  
-        base_url = os.getenv("AI_AGENT_PUBLIC_URL", "http://ai-agent-service:8000")
-        image_url = f"{base_url}/static/generated/emotions/{unique_filename}"
-        
-        # 获取图片基本信息
-        image = Image.open(io.BytesIO(image_bytes))
-        width, height = image.size
+        unique_filename = os.path.basename(stored["key"])
+        image_url = stored["url"]
         
         result = {
             "success": True,
             "data": {
                 "image_url": image_url,
                 "filename": unique_filename,
-                "size": actual_size,
+                "size": stored["size"],
+                "original_size": stored["original_size"],
                 "dimensions": {
-                    "width": width,
-                    "height": height
+                    "width": stored["width"],
+                    "height": stored["height"]
                 },
-                "format": image_format.upper(),
-                "upload_time": "2025-08-30T16:00:00Z",  # 实际项目中使用当前时间
+                "original_dimensions": {
+                    "width": stored["original_width"],
+                    "height": stored["original_height"]
+                },
+                "format": "WEBP",
+                "original_format": stored["original_format"] or image_format.upper(),
+                "deduplicated": stored["deduplicated"],
+                "upload_time": datetime.now(timezone.utc).isoformat(),
                 "source": "base64_upload"
             }
         }
@@ -119,79 +111,166 @@ async def upload_emotion_image_base64(request: dict, user_info: Dict = Depends(v
         logger.error(f"上传base64情绪图片时发生错误: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="服务器内部错误")
 
+class _MultipartFileStream:
+    """从请求体流中解析multipart，只按块产出指定字段的文件内容，不缓存整个请求"""
+
+    def __init__(self, request: Request, field_name: str):
+        content_type, params = multipart.multipart.parse_options_header(request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise HTTPException(status_code=400, detail="需要multipart/form-data格式的文件上传")
+
+        self.field_name = field_name
+        self._body = request.stream()
+        self.filename: Optional[str] = None
+        self._pending: List[bytes] = []
+        self._in_target = False
+        self._finished = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._parser = multipart.MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = multipart.multipart.parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        self._in_target = name == self.field_name and filename is not None and self.filename is None
+        if self._in_target:
+            self.filename = filename.decode("utf-8", "replace")
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_target:
+            self._pending.append(data[start:end])
+
+    def _on_part_end(self):
+        if self._in_target:
+            self._in_target = False
+            self._finished = True
+
+    async def start(self) -> str:
+        """读取请求体直到目标文件字段的头部解析完成，返回文件名"""
+        async for body in self._body:
+            self._parser.write(body)
+            if self.filename is not None:
+                return self.filename
+        raise HTTPException(status_code=400, detail=f"缺少上传文件字段: {self.field_name}")
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """按块产出文件内容（需先调用 start）"""
+        while True:
+            if self._pending:
+                data = b"".join(self._pending)
+                self._pending = []
+                yield data
+            if self._finished:
+                # 目标文件已读完，剩余表单字段不再读取
+                return
+            try:
+                body = await self._body.__anext__()
+            except StopAsyncIteration:
+                # 请求体提前结束：已写入的部分由图片校验拒绝
+                return
+            self._parser.write(body)
+
+
+def _check_extension(filename: str) -> str:
+    if not filename:
+        raise HTTPException(status_code=400, detail="文件名不能为空")
+    file_extension = filename.split('.')[-1].lower()
+    if file_extension not in ALLOWED_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的文件格式，支持格式: {ALLOWED_FORMATS}")
+    return file_extension
+
+
 @router.post("/emotion-image")
 async def upload_emotion_image(
-    emotion_image: UploadFile = File(...),
+    request: Request,
     user_info: Dict = Depends(verify_token)
 ) -> Dict[str, Any]:
     """
-    上传情绪墨迹图片
+    上传情绪墨迹图片（multipart字段 emotion_image）
+    
+    请求体按块流式读取：边读边写入暂存文件，超过大小上限立即中止；
+    随后在进程池中一次解码并规范化为WebP（摆正方向、缩放、去元数据），相同内容已存在时不再写入存储。
     
     Args:
-        emotion_image: 上传的图片文件
+        request: 包含 emotion_image 文件字段的 multipart/form-data 请求
         user_info: 用户信息（通过token验证获取）
     
     Returns:
         包含图片URL和元信息的字典
     """
     try:
-        logger.info(f"开始处理情绪图片上传, 文件名: {emotion_image.filename}")
-        
-        # 验证文件
-        if not emotion_image.filename:
-            raise HTTPException(status_code=400, detail="文件名不能为空")
-        
-        # 检查文件大小
-        content = await emotion_image.read()
-        if len(content) > MAX_FILE_SIZE:
+        # 声明的请求体长度已超过上限时不读取请求体
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_FILE_SIZE + MULTIPART_OVERHEAD:
             raise HTTPException(status_code=400, detail=f"文件大小超过限制({MAX_FILE_SIZE/1024/1024}MB)")
         
-        # 检查文件格式
-        file_extension = emotion_image.filename.split('.')[-1].lower()
-        if file_extension not in ALLOWED_FORMATS:
-            raise HTTPException(status_code=400, detail=f"不支持的文件格式，支持格式: {ALLOWED_FORMATS}")
+        upload = _MultipartFileStream(request, "emotion_image")
+        filename = await upload.start()
+        file_extension = _check_extension(filename)
+        logger.info(f"开始处理情绪图片上传（流式）, 文件名: {filename}")
         
-        # 验证是否为有效图片
+        store = get_content_store()
         try:
-            image = Image.open(io.BytesIO(content))
-            image.verify()  # 验证图片完整性
-        except Exception as e:
+            # 暂存原始内容后在进程池中解码一次并规范化，只保存规范化后的WebP
+            async with store.stage_stream(upload.chunks(), MAX_FILE_SIZE) as staged:
+                stored = await get_image_normalizer().normalize_and_store(store, staged["hash"], staged["path"])
+        except UploadTooLarge:
+            raise HTTPException(status_code=400, detail=f"文件大小超过限制({MAX_FILE_SIZE/1024/1024}MB)")
+        except InvalidImage as e:
             logger.error(f"图片验证失败: {e}")
             raise HTTPException(status_code=400, detail="无效的图片文件")
         
-        # 生成唯一文件名
-        unique_filename = f"emotion_{uuid.uuid4().hex[:12]}.{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
-        
-        # 保存文件
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(content)
-        
-        # 构建可访问的URL
-        base_url = os.getenv("AI_AGENT_PUBLIC_URL", "http://ai-agent-service:8000")
-        image_url = f"{base_url}/static/generated/emotions/{unique_filename}"
-        
-        # 获取图片基本信息
-        image = Image.open(io.BytesIO(content))
-        width, height = image.size
+        image_url = stored["url"]
         
         result = {
             "success": True,
             "data": {
                 "image_url": image_url,
-                "filename": unique_filename,
-                "original_name": emotion_image.filename,
-                "size": len(content),
+                "filename": os.path.basename(stored["key"]),
+                "original_name": filename,
+                "size": stored["size"],
+                "original_size": stored["original_size"],
                 "dimensions": {
-                    "width": width,
-                    "height": height
+                    "width": stored["width"],
+                    "height": stored["height"]
+                },
+                "original_dimensions": {
+                    "width": stored["original_width"],
+                    "height": stored["original_height"]
                 },
-                "format": file_extension.upper(),
-                "upload_time": "2024-08-30T12:00:00Z"  # 实际项目中使用当前时间
+                "format": "WEBP",
+                "original_format": file_extension.upper(),
+                "deduplicated": stored["deduplicated"],
+                "upload_time": datetime.now(timezone.utc).isoformat()
             }
         }
         
-        logger.info(f"情绪图片上传成功: {image_url}")
+        logger.info(f"情绪图片上传成功: {image_url} ({stored['size']} 字节{', 复用已有内容' if stored['deduplicated'] else ''})")
         return result
         
     except HTTPException:
@@ -200,6 +279,72 @@ async def upload_emotion_image(
         logger.error(f"上传情绪图片时发生错误: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="服务器内部错误")
 
+@router.post("/emotion-blob")
+async def upload_emotion_blob(
+    request: Request,
+    user_info: Dict = Depends(verify_token)
+) -> Dict[str, Any]:
+    """
+    上传情绪墨迹图片（请求体为图片原始字节，Content-Type: image/* 或 application/octet-stream）
+    
+    不经过base64与multipart编码；图片规范化后存储，返回不透明引用 blob_ref，
+    创建明信片任务时只传该引用，worker从存储读取图片字节。
+    
+    Args:
+        request: 请求体为图片二进制内容的请求
+        user_info: 用户信息（通过token验证获取）
+    
+    Returns:
+        包含 blob_ref 和图片元信息的字典
+    """
+    try:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        if not (content_type.startswith("image/") or content_type == "application/octet-stream"):
+            raise HTTPException(status_code=400, detail="请求体需为图片二进制数据（Content-Type: image/*）")
+        
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_FILE_SIZE:
+            raise HTTPException(status_code=400, detail=f"文件大小超过限制({MAX_FILE_SIZE/1024/1024}MB)")
+        
+        store = get_content_store()
+        try:
+            async with store.stage_stream(request.stream(), MAX_FILE_SIZE) as staged:
+                if not staged["size"]:
+                    raise HTTPException(status_code=400, detail="缺少图片数据")
+                stored = await get_image_normalizer().normalize_and_store(store, staged["hash"], staged["path"])
+        except UploadTooLarge:
+            raise HTTPException(status_code=400, detail=f"文件大小超过限制({MAX_FILE_SIZE/1024/1024}MB)")
+        except InvalidImage as e:
+            logger.error(f"图片验证失败: {e}")
+            raise HTTPException(status_code=400, detail="无效的图片数据")
+        
+        blob_ref = store.blob_ref(stored["key"])
+        
+        logger.info(f"情绪图片二进制上传成功: {blob_ref} ({stored['original_size']} -> {stored['size']} 字节)")
+        return {
+            "success": True,
+            "data": {
+                "blob_ref": blob_ref,
+                "image_url": stored["url"],
+                "size": stored["size"],
+                "original_size": stored["original_size"],
+                "dimensions": {
+                    "width": stored["width"],
+                    "height": stored["height"]
+                },
+                "format": "WEBP",
+                "original_format": stored["original_format"],
+                "deduplicated": stored["deduplicated"],
+                "upload_time": datetime.now(timezone.utc).isoformat()
+            }
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"上传情绪图片二进制数据时发生错误: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="服务器内部错误")
+
 @router.get("/emotion-image/{filename}")
 async def get_emotion_image_info(filename: str) -> Dict[str, Any]:
     """
@@ -212,37 +357,40 @@ async def get_emotion_image_info(filename: str) -> Dict[str, Any]:
         图片信息
     """
     try:
-        file_path = os.path.join(UPLOAD_DIR, filename)
+        # 新上传按内容哈希存放于分片目录，旧文件仍在平铺目录中
+        store = get_content_store()
+        try:
+            key = store.key_for_name(filename) or f"emotions/{filename}"
+            data = await store.get_bytes(key)
+        except ValueError:
+            data = None
         
-        if not os.path.exists(file_path):
+        if data is None:
             raise HTTPException(status_code=404, detail="图片不存在")
         
-        # 获取文件信息
-        stat = os.stat(file_path)
-        
         # 获取图片尺寸
         try:
-            with Image.open(file_path) as img:
+            with Image.open(io.BytesIO(data)) as img:
                 width, height = img.size
                 format_name = img.format
         except Exception:
             width, height, format_name = None, None, None
         
-        base_url = os.getenv("AI_AGENT_PUBLIC_URL", "http://ai-agent-service:8000")
-        image_url = f"{base_url}/static/generated/emotions/{filename}"
+        stat = await store.backend.stat(key)
+        image_url = store.url_for(key)
         
         return {
             "success": True,
             "data": {
                 "filename": filename,
                 "image_url": image_url,
-                "size": stat.st_size,
+                "size": len(data),
                 "dimensions": {
                     "width": width,
                     "height": height
                 } if width and height else None,
                 "format": format_name,
-                "created_time": stat.st_ctime
+                "created_time": stat["modified"] if stat else None
             }
         }
         
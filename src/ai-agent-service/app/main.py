@@ -5,6 +5,7 @@ AI Agent Service - AI明信片项目的核心AI服务
 from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+from typing import Any, Dict, Optional
 import os
 import logging
 import logging.config
@@ -27,6 +28,9 @@ from .api.html_image import router as html_image_router
 # 导入上传API
 from .api.upload import router as upload_router
 
+# 导入生成产物访问API
+from .api.generated_files import router as generated_files_router
+
 # 导入WebSearch测试服务
 from .services.claude_websearch_test import ClaudeWebSearchTest
 
@@ -118,12 +122,22 @@ async def initialize_services():
         main_logger.error(f"❌ 服务初始化失败: {e}")
         # 不抛出异常，让服务继续启动，Worker进程会处理这个问题
 
+async def shutdown_services():
+    """关闭服务依赖"""
+    from .services.render_scheduler import close_render_scheduler
+    await close_render_scheduler()
+    from .services.html_renderer import close_html_renderer
+    await close_html_renderer()
+    from .services.image_normalizer import get_image_normalizer
+    get_image_normalizer().shutdown()
+
 # 创建应用实例
 app = FastAPI(
     title="AI Agent Service",
     description="AI 明信片项目 - AI Agent 服务",
     version="1.0.0",
-    on_startup=[initialize_services]
+    on_startup=[initialize_services],
+    on_shutdown=[shutdown_services]
 )
 
 # 集成编码服务API路由
@@ -211,11 +225,11 @@ if os.path.exists(assets_dir):
 else:
     main_logger.warning("前端assets目录不存在，请先构建前端")
 
-# 挂载AI生成的文件（用于预览，需要避免与前端文件冲突）
+# AI生成的文件（用于预览，需要避免与前端文件冲突）经存储后端提供，
+# /generated 与 /static/generated 两个前缀均可访问；本地后端时目录即 generated_dir
 generated_dir = os.path.join(static_dir, "generated")
 os.makedirs(generated_dir, exist_ok=True)
-app.mount("/generated", StaticFiles(directory=generated_dir), name="generated")
-app.mount("/static/generated", StaticFiles(directory=generated_dir), name="static_generated")
+app.include_router(generated_files_router, tags=["生成产物访问"])
 
 # 挂载HTML转图片生成的图片文件
 images_dir = os.path.join(generated_dir, "images")
@@ -260,6 +274,7 @@ class HealthResponse(BaseModel):
     status: str
     service: str
     environment: str
+    providers: Optional[Dict[str, Any]] = None
 
 @app.get("/health-check")
 async def root():
@@ -272,13 +287,22 @@ async def root():
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """详细健康检查"""
+    """详细健康检查（提供商状态来自worker后台探测的缓存，不发起上游调用）"""
+    from .providers.health_monitor import get_provider_health_monitor
+    provider_status = await get_provider_health_monitor().get_status()
     return HealthResponse(
         status="healthy",
         service="ai-agent-service",
-        environment=os.getenv("APP_ENV", "development")
+        environment=os.getenv("APP_ENV", "development"),
+        providers=provider_status
     )
 
+@app.get("/health/providers")
+async def provider_health():
+    """AI提供商健康状态（后台探测缓存）"""
+    from .providers.health_monitor import get_provider_health_monitor
+    return await get_provider_health_monitor().get_status()
+
 @app.get("/info")
 async def service_info():
     """服务信息"""
@@ -298,6 +322,7 @@ async def service_info():
         "endpoints": [
             "/",
             "/health", 
+            "/health/providers",
             "/info",
             "/docs",
             "/lovart-sim",  # lovart.ai模拟器入口
@@ -95,7 +95,8 @@ class FrontendCoder:
                 self.logger.error(f"❌ Claude代码生成异常: {str(e)}")
                 frontend_code = None
             
-            if not frontend_code:
+            templated = not frontend_code
+            if templated:
                 frontend_code = self._get_default_frontend_code(content_data, image_url)
             
             # 保存HTML源码（用于持久化）
@@ -103,16 +104,20 @@ class FrontendCoder:
             context["results"]["card_html"] = frontend_code
             context["results"]["preview_url"] = f"/generated/postcard_{task.get('task_id')}.html"
 
-            # 将HTML转换为图片，供小程序直接展示
+            # 将HTML转换为图片，供小程序直接展示（默认模板直接用Pillow合成，无需浏览器）
             try:
                 html2img = HTMLToImageService()
-                convert_result = await html2img.convert_html_to_image(
-                    html_content=frontend_code,
-                    output_filename=f"postcard_{task.get('task_id')}.png",
-                    width=375,
-                    height=600,
-                    format="png"
-                )
+                if templated:
+                    convert_result = await html2img.render_card("postcard", self._get_default_card_data(content_data, image_url))
+                else:
+                    convert_result = await html2img.convert_html_to_image(
+                        html_content=frontend_code,
+                        output_filename=f"postcard_{task.get('task_id')}.png",
+                        width=375,
+                        height=600,
+                        format="png",
+                        priority="batch"
+                    )
                 if convert_result and convert_result.get("success"):
                     context["results"]["card_image_url"] = convert_result.get("image_url")
                     self.logger.info(f"✅ 卡片图片生成成功: {convert_result.get('image_url')}")
@@ -136,19 +141,23 @@ class FrontendCoder:
             # 兜底尝试转图片
             try:
                 html2img = HTMLToImageService()
-                convert_result = await html2img.convert_html_to_image(
-                    html_content=default_html,
-                    output_filename=f"postcard_{task.get('task_id')}.png",
-                    width=375,
-                    height=600,
-                    format="png"
-                )
+                convert_result = await html2img.render_card("postcard", self._get_default_card_data(content_data, image_url))
                 if convert_result and convert_result.get("success"):
                     context["results"]["card_image_url"] = convert_result.get("image_url")
             except Exception:
                 pass
             return context
     
+    def _get_default_card_data(self, content_data, image_url):
+        """默认模板卡片的合成数据（与默认前端代码展示相同内容）"""
+        return {
+            "title": content_data.get('主标题', '温馨祝福'),
+            "subtitle": content_data.get('副标题', '来自心底的真诚'),
+            "body": content_data.get('正文内容', '愿美好与你同在'),
+            "signature": content_data.get('署名建议', '致亲爱的你'),
+            "image_url": image_url
+        }
+    
     def _get_default_frontend_code(self, content_data, image_url):
         """获取默认前端代码（兜底方案）"""
         return f"""<!DOCTYPE html>
@@ -9,9 +9,13 @@ class ImageGenerator:
     """图片生成器 - 第3步：基于心象签概念生成自然祝福图"""
     
     def __init__(self):
-        # 根据环境变量选择图片生成provider
+        # 根据环境变量选择图片生成provider；开启路由时按健康度在多个provider间选路
         provider_type = os.getenv("IMAGE_PROVIDER_TYPE", "gemini")
-        self.provider = ProviderFactory.create_image_provider(provider_type)
+        if os.getenv("IMAGE_PROVIDER_ROUTER", "off") == "on":
+            self.provider = ProviderFactory.create_image_router()
+            provider_type = f"router({provider_type})"
+        else:
+            self.provider = ProviderFactory.create_image_provider(provider_type)
         self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.info(f"✅ 图片生成器初始化，使用provider: {provider_type}")
     
@@ -42,28 +46,22 @@ class ImageGenerator:
         oracle_theme = structured_data.get("oracle_theme", {})
         natural_scene = oracle_theme.get("title", "晨光照进窗") if isinstance(oracle_theme, dict) else "晨光照进窗"
         
-        # 构建心象签自然祝福图生成提示词（完整专业版本）
-        image_prompt = f"""Create a high-quality watercolor background image for a heart oracle postcard:
-
-Scene: "{natural_scene}"
-Color Palette: {palette[0]}, {palette[1]}, {palette[2]} 
-Lighting Effect: {animation_hint}
-
-Style Requirements:
-- Abstract watercolor technique with soft, flowing edges
-- Harmonious and artistic color blending
-- Atmospheric and elegant composition
-- Suitable for text overlay placement
-- Positive and peaceful mood
-- Resolution: 1024x1024 pixels
-
-Important Constraints:
-- NO TEXT, NO WORDS, NO LETTERS, NO CHARACTERS of any kind
-- NO symbols, logos, or written content
-- Focus purely on visual elements: landscapes, nature, abstract patterns
-- Create pure artistic background without textual elements
-
-Generate a beautiful, serene watercolor background that captures the essence of "{natural_scene}" using the specified colors and lighting."""
+        image_prompt = self._build_image_prompt(natural_scene, palette, animation_hint)
+        
+        # 场景图缓存：相同视觉参数（规范化后）已有足够变体时按比例直接复用
+        from ...services.scene_image_cache import get_scene_image_cache
+        scene_cache = get_scene_image_cache()
+        visual_params = scene_cache.visual_params(natural_scene, palette, animation_hint)
+        cached = await scene_cache.lookup(visual_params)
+        if cached:
+            self._apply_cached_image(context, cached, {
+                "purpose": "natural_blessing",
+                "oracle_scene": natural_scene,
+                "palette": palette,
+                "animation_hint": animation_hint,
+                "art_style": "abstract_watercolor"
+            })
+            return context
         
         try:
             # 调用Gemini图片生成
@@ -86,6 +84,16 @@ Generate a beautiful, serene watercolor background that captures the essence of
             })
             context["results"]["image_metadata"] = metadata
             
+            # 真实生成的图片：在进程池中生成多尺寸派生图，与image_url一并记录
+            await self._attach_derivatives(context, metadata)
+            
+            if metadata.get("storage_key") and not metadata.get("fallback"):
+                await scene_cache.store(visual_params, {
+                    "image_url": image_result["image_url"],
+                    "storage_key": metadata["storage_key"],
+                    "image_variants": metadata.get("image_variants")
+                })
+            
             self.logger.info(f"✅ 心象签自然祝福图生成完成: {image_result['image_url']}")
             
             return context
@@ -102,6 +110,93 @@ Generate a beautiful, serene watercolor background that captures the essence of
             }
             return context
     
+    def _build_image_prompt(self, natural_scene, palette, animation_hint):
+        """构建心象签自然祝福图生成提示词（完整专业版本）"""
+        return f"""Create a high-quality watercolor background image for a heart oracle postcard:
+
+Scene: "{natural_scene}"
+Color Palette: {palette[0]}, {palette[1]}, {palette[2]} 
+Lighting Effect: {animation_hint}
+
+Style Requirements:
+- Abstract watercolor technique with soft, flowing edges
+- Harmonious and artistic color blending
+- Atmospheric and elegant composition
+- Suitable for text overlay placement
+- Positive and peaceful mood
+- Resolution: 1024x1024 pixels
+
+Important Constraints:
+- NO TEXT, NO WORDS, NO LETTERS, NO CHARACTERS of any kind
+- NO symbols, logos, or written content
+- Focus purely on visual elements: landscapes, nature, abstract patterns
+- Create pure artistic background without textual elements
+
+Generate a beautiful, serene watercolor background that captures the essence of "{natural_scene}" using the specified colors and lighting."""
+    
+    def _apply_cached_image(self, context, cached, metadata):
+        """使用缓存的场景图，写入与真实生成一致的结果字段"""
+        context["results"]["image_url"] = cached["image_url"]
+        metadata.update({
+            "scene_cache": "hit",
+            "storage_key": cached.get("storage_key"),
+            "image_variants": cached.get("image_variants")
+        })
+        context["results"]["image_metadata"] = metadata
+        
+        variants = cached.get("image_variants")
+        if variants:
+            self._record_variants(context, variants)
+        
+        self.logger.info(f"✅ 心象签自然祝福图复用缓存: {cached['image_url']}")
+    
+    async def generate_scene_entry(self, visual_params):
+        """为场景图缓存预热生成一张背景图，返回缓存条目；失败或兜底图返回None"""
+        palette = list(visual_params.get("palette") or [])
+        palette += ["#f5e6cc", "#d9c4f2", "#9DE0AD"][len(palette):]
+        prompt = self._build_image_prompt(
+            visual_params.get("natural_scene", ""), palette, visual_params.get("animation_hint", "")
+        )
+        try:
+            image_result = await self.provider.generate_image(prompt=prompt, size="1024x1024", quality="standard")
+        except Exception as e:
+            self.logger.warning(f"⚠️ 场景图预热生成失败: {e}")
+            return None
+        
+        metadata = image_result.get("metadata", {})
+        storage_key = metadata.get("storage_key")
+        if not storage_key or metadata.get("fallback"):
+            return None
+        
+        from ...services.image_derivatives import get_image_derivative_service
+        variants = await get_image_derivative_service().create_derivatives(storage_key)
+        return {"image_url": image_result["image_url"], "storage_key": storage_key, "image_variants": variants}
+    
+    async def _attach_derivatives(self, context, metadata):
+        """生成缩略图/预览图/全尺寸派生图，并写入结果与结构化数据的visual字段"""
+        storage_key = metadata.get("storage_key")
+        if not storage_key or metadata.get("fallback"):
+            return
+        
+        from ...services.image_derivatives import get_image_derivative_service
+        variants = await get_image_derivative_service().create_derivatives(storage_key)
+        if not variants:
+            return
+        
+        metadata["image_variants"] = variants
+        self._record_variants(context, variants)
+    
+    def _record_variants(self, context, variants):
+        """派生图写入结果，结构化数据已生成时（两段式/统一工作流）同步写入visual字段，随结构化数据一起持久化"""
+        context["results"]["image_variants"] = variants
+        structured_data = context["results"].get("structured_data")
+        if isinstance(structured_data, dict):
+            visual = structured_data.get("visual")
+            if not isinstance(visual, dict):
+                visual = {}
+                structured_data["visual"] = visual
+            visual["background_image_variants"] = variants
+    
     def _get_default_blessing_image(self):
         """获取默认心象签祝福图（兜底方案）"""
         # 返回一个符合心象签理念的默认图片
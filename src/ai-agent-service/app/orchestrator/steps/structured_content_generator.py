@@ -46,6 +46,8 @@ class StructuredContentGenerator:
                 if not isinstance(parsed_data["visual"], dict):
                     parsed_data["visual"] = {}
                 parsed_data["visual"]["background_image_url"] = image_url
+                if results.get("image_variants"):
+                    parsed_data["visual"]["background_image_variants"] = results["image_variants"]
             
             # 🔮 添加AI选择的签体信息
             if selected_charm and isinstance(selected_charm, dict):
@@ -10,7 +10,8 @@ class TwoStageAnalyzer:
     """阶段1：用户洞察分析器 - 专注心理分析"""
     
     def __init__(self):
-        self.provider = ProviderFactory.create_text_provider("gemini")
+        # 分析阶段对相同输入基本确定，允许接入LLM响应缓存（由环境变量开启）
+        self.provider = ProviderFactory.create_text_provider("gemini", cache_step="analysis")
         self.logger = logging.getLogger(self.__class__.__name__)
         
         # 重试配置
@@ -36,16 +37,20 @@ class TwoStageAnalyzer:
     async def _analyze_with_retry(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """带重试机制的分析执行"""
         
+        cache_inputs = self._build_cache_inputs(task)
+
         for attempt in range(self.max_retries):
             try:
                 self.logger.info(f"📝 第{attempt+1}次分析尝试")
                 
-                # 构建分析prompt
-                prompt = self._build_analysis_prompt(task)
+                # 构建分析prompt（静态前缀交给provider做上下文缓存）
+                prompt = self._build_analysis_input(task)
                 
-                # 调用Gemini
+                # 调用Gemini（仅首次尝试读写响应缓存，重试时提高温度直接请求）
                 response = await self.provider.generate_text(
                     prompt=prompt,
+                    cached_prefix=self.ANALYSIS_PROMPT_PREFIX,
+                    cache_inputs=cache_inputs if attempt == 0 else None,
                     max_tokens=800,
                     temperature=0.7 + attempt * 0.1  # 逐步提高创造性
                 )
@@ -62,6 +67,10 @@ class TwoStageAnalyzer:
             except Exception as e:
                 self.logger.error(f"❌ 第{attempt+1}次分析失败: {e}")
                 
+                if attempt == 0 and hasattr(self.provider, "invalidate"):
+                    # 缓存中的结果可能就是无效响应，移除后再重试
+                    await self.provider.invalidate(cache_inputs, self.ANALYSIS_PROMPT_PREFIX)
+                
                 if attempt < self.max_retries - 1:
                     # 还有重试机会
                     await asyncio.sleep(self.retry_delays[attempt])
@@ -71,31 +80,11 @@ class TwoStageAnalyzer:
                     self.logger.warning(f"⚠️ 所有重试失败，使用规则降级")
                     return self._get_rule_based_analysis(task)
     
-    def _build_analysis_prompt(self, task: Dict[str, Any]) -> str:
-        """构建分析prompt"""
-        
-        user_input = task.get("user_input", "")
-        drawing_data = task.get("drawing_data", {}).get("analysis", {})
-        quiz_answers = task.get("quiz_answers", [])
-        
-        # 处理绘画数据
-        stroke_count = drawing_data.get("stroke_count", 0)
-        drawing_time = drawing_data.get("drawing_time", 0)
-        dominant_quadrant = drawing_data.get("dominant_quadrant", "center")
-        pressure_tendency = drawing_data.get("pressure_tendency", "steady")
-        
-        # 处理问答数据
-        quiz_summary = self._summarize_quiz_answers(quiz_answers)
-        
-        prompt = f"""你是专业的心理分析师，专门从用户行为中洞察内在心理状态。
+    # 静态前缀：指令、分析维度与输出格式，跨请求完全一致，可由提供商做上下文缓存
+    ANALYSIS_PROMPT_PREFIX = """你是专业的心理分析师，专门从用户行为中洞察内在心理状态。
 
 ## 分析任务
-基于以下用户数据进行深度心理分析，输出结构化报告。
-
-## 输入数据
-**用户描述**: {user_input}
-**绘画分析**: 笔画{stroke_count}笔，{drawing_time}ms，主要区域{dominant_quadrant}，压力{pressure_tendency}
-**问答结果**: {quiz_summary}
+基于文末提供的用户数据进行深度心理分析，输出结构化报告。
 
 ## 分析维度
 
@@ -119,28 +108,66 @@ class TwoStageAnalyzer:
 严格按以下JSON格式返回：
 
 ```json
-{{
-  "psychological_profile": {{
+{
+  "psychological_profile": {
     "emotion_state": "平静/焦虑/兴奋/沉思/愉悦",
     "core_needs": ["具体需求1", "具体需求2"],
     "energy_type": "活跃/平衡/内省",
     "dominant_traits": ["特质1", "特质2", "特质3"]
-  }},
-  "five_elements": {{
+  },
+  "five_elements": {
     "wood": 0.5, "fire": 0.5, "earth": 0.5, "metal": 0.5, "water": 0.5
-  }},
-  "hexagram_match": {{
+  },
+  "hexagram_match": {
     "name": "卦象名称",
     "modern_name": "现代化解读名",
     "insight": "一句话核心启示(不超过20字)"
-  }},
+  },
   "key_insights": ["洞察1", "洞察2", "洞察3"]
-}}
+}
 ```
 
 专注分析，保持客观专业，避免创作内容。"""
+
+    def _build_analysis_prompt(self, task: Dict[str, Any]) -> str:
+        """构建完整分析prompt（静态前缀 + 动态用户数据）"""
+        return self.provider.compose_prompt(self._build_analysis_input(task), self.ANALYSIS_PROMPT_PREFIX)
+
+    def _build_analysis_input(self, task: Dict[str, Any]) -> str:
+        """构建分析prompt的动态部分（仅包含本次用户数据）"""
+        
+        user_input = task.get("user_input", "")
+        drawing_data = task.get("drawing_data", {}).get("analysis", {})
+        quiz_answers = task.get("quiz_answers", [])
+        
+        # 处理绘画数据
+        stroke_count = drawing_data.get("stroke_count", 0)
+        drawing_time = drawing_data.get("drawing_time", 0)
+        dominant_quadrant = drawing_data.get("dominant_quadrant", "center")
+        pressure_tendency = drawing_data.get("pressure_tendency", "steady")
+        
+        # 处理问答数据
+        quiz_summary = self._summarize_quiz_answers(quiz_answers)
         
-        return prompt
+        return f"""## 输入数据
+**用户描述**: {user_input}
+**绘画分析**: 笔画{stroke_count}笔，{drawing_time}ms，主要区域{dominant_quadrant}，压力{pressure_tendency}
+**问答结果**: {quiz_summary}"""
+    
+    def _build_cache_inputs(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """提取决定分析结果的输入，用于LLM响应缓存键
+
+        绘画时长按秒取整，使几乎相同的绘画能命中同一缓存。
+        """
+        drawing_data = task.get("drawing_data", {}).get("analysis", {})
+        return {
+            "user_input": task.get("user_input", ""),
+            "stroke_count": drawing_data.get("stroke_count", 0),
+            "drawing_seconds": round((drawing_data.get("drawing_time", 0) or 0) / 1000),
+            "dominant_quadrant": drawing_data.get("dominant_quadrant", "center"),
+            "pressure_tendency": drawing_data.get("pressure_tendency", "steady"),
+            "quiz": self._summarize_quiz_answers(task.get("quiz_answers", []))
+        }
     
     def _summarize_quiz_answers(self, quiz_answers: list) -> str:
         """总结问答结果"""
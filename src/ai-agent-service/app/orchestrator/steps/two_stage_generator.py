@@ -3,24 +3,25 @@ import json
 import asyncio
 import datetime
 import os
-import math
-import random
 from typing import Dict, Any, Optional
 from zoneinfo import ZoneInfo
+import numpy as np
 from ...providers.provider_factory import ProviderFactory
+from ...services.charm_catalog import get_charm_catalog, shortlist
 
 logger = logging.getLogger(__name__)
 
 class TwoStageGenerator:
     """阶段2：心象签生成器 - 基于分析生成内容"""
 
+    # 含签体目录的静态前缀按目录版本复用（目录热更新后重建，提供商随之创建新的上下文缓存）
+    _prefix_version = None
+    _prefix_text = ""
+
     def __init__(self):
         self.provider = ProviderFactory.create_text_provider("gemini")
         self.logger = logging.getLogger(self.__class__.__name__)
 
-        # 加载签体配置
-        self.charm_configs = self._load_charm_configs()
-
         # 重试配置
         self.max_retries = 3
         self.retry_delays = [2, 4, 8]  # 指数退避
@@ -31,20 +32,21 @@ class TwoStageGenerator:
         self.exposure_balancing = os.getenv("CHARM_EXPOSURE_BALANCING", "on") == "on"
         self.random_noise_sigma = float(os.getenv("CHARM_RANDOM_NOISE_SIGMA", "0.15"))
         self.history_penalty_base = float(os.getenv("CHARM_HISTORY_PENALTY_BASE", "0.3"))
+        # 精确重打分前的近邻短名单大小（签体目录很大时只对这K个计算曝光/历史/随机项）
+        self.shortlist_size = int(os.getenv("CHARM_SHORTLIST_SIZE", "64"))
 
         self.logger.info(f"🎯 [CHARM-REC] 签体推荐算法配置: algorithm={self.algorithm_enabled}, top_n={self.top_n}")
 
-        # 🆕 加载签体特征矩阵
-        self.charm_matrix = self._load_charm_features_matrix()
+        if not self.algorithm_enabled:
+            self.logger.info("⚙️ [CHARM-REC] 优化算法已禁用，将使用旧版推荐")
+        self._rng = np.random.default_rng()
 
-        # 🆕 初始化曝光追踪器
-        if self.charm_matrix and self.exposure_balancing:
+        # 🆕 初始化曝光追踪器（进程级单例，异步批量写入）
+        if self.algorithm_enabled and self.exposure_balancing:
             try:
-                from ...utils.redis_client import get_redis_client
-                from ...utils.charm_exposure_tracker import CharmExposureTracker
+                from ...utils.charm_exposure_tracker import get_charm_exposure_tracker
 
-                redis_client = get_redis_client()
-                self.exposure_tracker = CharmExposureTracker(redis_client)
+                self.exposure_tracker = get_charm_exposure_tracker()
                 self.logger.info("✅ [CHARM-REC] 曝光追踪器初始化成功")
 
             except Exception as e:
@@ -84,14 +86,15 @@ class TwoStageGenerator:
                 self.logger.info(f"📝 第{attempt+1}次生成尝试")
 
                 # 签体推荐
-                recommended_charms = self._recommend_charms(analysis)
+                recommended_charms = await self._recommend_charms(analysis)
 
-                # 构建生成prompt
-                prompt = self._build_generation_prompt(analysis, task, recommended_charms)
+                # 构建生成prompt（静态前缀与签体目录交给provider做上下文缓存）
+                prompt = self._build_generation_input(analysis, task, recommended_charms)
 
                 # 调用Gemini
                 response = await self.provider.generate_text(
                     prompt=prompt,
+                    cached_prefix=self.generation_prompt_prefix(),
                     max_tokens=1200,
                     temperature=0.8 + attempt * 0.1  # 逐步提高创造性
                 )
@@ -119,52 +122,23 @@ class TwoStageGenerator:
                     self.logger.warning(f"⚠️ 所有重试失败，使用模板降级")
                     return self._get_template_oracle(analysis, task)
 
-    # ============ 新增: 加载特征矩阵 ============
-    def _load_charm_features_matrix(self):
-        """加载签体特征矩阵（带容错）"""
-        import os
-        import json
-
-        # 检查算法开关
-        if not self.algorithm_enabled:
-            self.logger.info("⚙️ [CHARM-REC] 优化算法已禁用，将使用旧版推荐")
-            return None
-
-        matrix_path = os.getenv('CHARM_FEATURES_MATRIX_PATH',
-                                '/app/resources/签体/charm-features-matrix.json')
-
-        try:
-            with open(matrix_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-                # 验证数据完整性
-                if "charms" not in data or len(data["charms"]) != 18:
-                    raise ValueError(f"特征矩阵数据不完整: {len(data.get('charms', []))}个签体")
-
-                self.logger.info(f"✅ [CHARM-REC] 加载签体特征矩阵成功: {len(data['charms'])}个")
-                return data['charms']
-
-        except FileNotFoundError:
-            self.logger.warning(f"⚠️ [CHARM-REC] 特征矩阵文件不存在: {matrix_path}，降级到旧版推荐")
-            return None
-        except json.JSONDecodeError as e:
-            self.logger.error(f"❌ [CHARM-REC] 特征矩阵JSON解析失败: {e}，降级到旧版推荐")
-            return None
-        except Exception as e:
-            self.logger.error(f"❌ [CHARM-REC] 加载特征矩阵失败: {e}，降级到旧版推荐")
-            return None
+    @property
+    def charm_configs(self) -> list:
+        """签体配置（来自进程级共享的签体目录，文件变化时自动热更新）"""
+        return get_charm_catalog().get().configs
 
     # ============ 修改: _recommend_charms方法 ============
-    def _recommend_charms(self, analysis: Dict[str, Any]) -> list:
+    async def _recommend_charms(self, analysis: Dict[str, Any]) -> list:
         """签体推荐 - 支持新旧算法自动切换"""
 
         # 🔒 兼容性判断: 如果特征矩阵未加载，使用旧算法
-        if not self.charm_matrix or not self.algorithm_enabled:
+        catalog = get_charm_catalog().get()
+        if catalog.feature_index is None or not self.algorithm_enabled:
             return self._recommend_charms_legacy(analysis)
 
-        # 🆕 使用优化算法
+        # 🆕 使用优化算法（整个推荐过程使用同一个目录快照）
         try:
-            return self._recommend_charms_optimized(analysis)
+            return await self._recommend_charms_optimized(analysis, catalog)
         except Exception as e:
             self.logger.error(f"❌ [CHARM-REC] 优化算法失败: {e}，降级到旧版推荐")
             return self._recommend_charms_legacy(analysis)
@@ -203,8 +177,8 @@ class TwoStageGenerator:
         return recommended[:3] if recommended else self.charm_configs[:3]
 
     # ============ 新增: 优化版推荐算法 ============
-    def _recommend_charms_optimized(self, analysis: Dict[str, Any]) -> list:
-        """优化版推荐算法（带容错）"""
+    async def _recommend_charms_optimized(self, analysis: Dict[str, Any], catalog) -> list:
+        """优化版推荐算法（带容错）：全部签体一次向量化打分"""
         try:
             # 获取user_id（用于历史去重）
             user_id = analysis.get("user_id")
@@ -212,25 +186,17 @@ class TwoStageGenerator:
             # 1. 构建用户向量
             user_vector = self._build_user_vector(analysis)
 
-            # 2. 计算所有签体得分
-            scored_charms = []
-            for charm in self.charm_matrix:
-                try:
-                    score_data = self._compute_charm_score(charm, user_vector, user_id)
-                    scored_charms.append(score_data)
-                except Exception as e:
-                    self.logger.warning(f"⚠️ [CHARM-REC] 计算签体得分失败: {charm.get('id')} - {e}")
-                    continue
-
-            # 如果没有成功计算的签体，降级
-            if not scored_charms:
-                self.logger.error("❌ [CHARM-REC] 所有签体得分计算失败，降级到旧版推荐")
-                return self._recommend_charms_legacy(analysis)
+            # 2. 近邻短名单 + 短名单内向量化精确打分（曝光数据一次Redis往返取回）
+            snapshot = await self.exposure_tracker.get_snapshot(user_id) if self.exposure_tracker else {"recent": [], "global": {}}
+            index = catalog.feature_index
+            positions = shortlist(index, np.asarray(user_vector, dtype=np.float64) * index["weights"], self.shortlist_size)
+            exposure_rates = self._exposure_rates(index, positions, snapshot["global"], snapshot.get("total"))
+            scores = self._score_charms(index, positions, user_vector, snapshot["recent"], exposure_rates)
 
             # 3. 选择Top-N候选
-            candidates = self._select_topn_candidates(scored_charms)
+            candidates = self._select_topn_candidates(index, positions, scores, exposure_rates)
 
-            # 4. 记录曝光（带容错）
+            # 4. 记录曝光（写入缓冲区后台批量刷盘，不阻塞推荐）
             if user_id and self.exposure_tracker:
                 try:
                     self.exposure_tracker.record_recommendation(
@@ -242,17 +208,12 @@ class TwoStageGenerator:
                     self.logger.warning(f"⚠️ [CHARM-REC] 记录曝光失败: {e}，继续返回推荐结果")
 
             # 5. 转换为原有格式（保持兼容性）
-            result = []
-            for candidate in candidates:
-                for charm_config in self.charm_configs:
-                    if charm_config.get("id") == candidate["id"]:
-                        result.append(charm_config)
-                        break
+            result = [catalog.by_id[c["id"]] for c in candidates if c["id"] in catalog.by_id]
 
             # 如果转换失败，使用fallback
             if not result:
                 self.logger.error("❌ [CHARM-REC] 推荐结果转换失败，使用默认签体")
-                return self.charm_configs[:self.top_n]
+                return catalog.configs[:self.top_n]
 
             return result
 
@@ -290,219 +251,228 @@ class TwoStageGenerator:
             cultural_depth
         ]
 
-    def _weighted_cosine_similarity(self, vec1: list, vec2: list) -> float:
-        """加权余弦相似度"""
-        weights = [1.5, 1.5, 1.3, 1.3, 1.0, 1.0, 1.0, 1.0, 1.0, 0.8]
-
-        weighted_vec1 = [v * w for v, w in zip(vec1, weights)]
-        weighted_vec2 = [v * w for v, w in zip(vec2, weights)]
-
-        dot_product = sum(a * b for a, b in zip(weighted_vec1, weighted_vec2))
-        norm1 = math.sqrt(sum(a ** 2 for a in weighted_vec1))
-        norm2 = math.sqrt(sum(b ** 2 for b in weighted_vec2))
-
-        return dot_product / (norm1 * norm2) if norm1 > 0 and norm2 > 0 else 0.0
-
-    def _compute_charm_score(self, charm, user_vector, user_id) -> dict:
-        """计算签体综合得分"""
-        charm_vector = list(charm["features"].values())
-
-        base_score = self._weighted_cosine_similarity(user_vector, charm_vector)
-
-        random_factor = random.gauss(1.0, self.random_noise_sigma)
-        perturbed_score = base_score * random_factor
-
-        history_penalty = 1.0
-        if user_id and self.exposure_tracker:
-            recent = self.exposure_tracker.get_user_recent(user_id)
-            if charm["id"] in recent:
-                idx = recent.index(charm["id"])
-                penalty = self.history_penalty_base ** (5 - idx)
-                history_penalty = 1.0 - penalty
-
-        exposure_boost = self._get_exposure_boost(charm["id"])
-
-        final_score = perturbed_score * history_penalty * exposure_boost
-
-        return {
-            "id": charm["id"],
-            "name": charm["name"],
-            "score": final_score
-        }
-
-    def _get_exposure_boost(self, charm_id: str) -> float:
-        """获取曝光平衡提升因子"""
-        if not self.exposure_tracker:
-            return 1.0
-
-        stats = self.exposure_tracker.get_global_stats()
-        total = sum(stats.values())
-
-        if total == 0:
-            return 1.0
-
-        actual_rate = stats.get(charm_id, 0) / total
-        expected_rate = 1.0 / 18
-
-        if actual_rate < expected_rate * 0.3:
-            return 1.8
-        elif actual_rate < expected_rate * 0.6:
-            return 1.4
-        elif actual_rate < expected_rate:
-            return 1.1
+    def _exposure_rates(self, index: Dict[str, Any], positions: np.ndarray, stats: dict,
+                        total: Optional[int] = None) -> np.ndarray:
+        """全局曝光计数转为与短名单同序的曝光率向量"""
+        ids = index["ids"]
+        counts = np.asarray([stats.get(ids[p], 0) for p in positions], dtype=np.float64)
+        if total is None:
+            total = sum(stats.values())
+        return counts / total if total > 0 else np.zeros(len(counts))
+
+    def _score_charms(self, index: Dict[str, Any], positions: np.ndarray, user_vector: list, recent: list,
+                      exposure_rates: np.ndarray) -> np.ndarray:
+        """短名单内向量化综合打分：加权余弦相似度 × 随机扰动 × 历史惩罚 × 曝光提升"""
+        user_weighted = np.asarray(user_vector, dtype=np.float64) * index["weights"]
+        user_norm = np.linalg.norm(user_weighted)
+
+        denominator = index["norms"][positions] * user_norm
+        base_scores = np.divide(
+            index["weighted"][positions] @ user_weighted, denominator,
+            out=np.zeros_like(denominator), where=denominator > 0
+        )
+
+        random_factor = self._rng.normal(1.0, self.random_noise_sigma, len(base_scores))
+
+        # 近期推荐过的签体按位置衰减惩罚（越新惩罚越重）
+        history_penalty = np.ones(len(base_scores))
+        for idx in reversed(range(min(len(recent), 5))):
+            position = index["position"].get(recent[idx])
+            if position is not None:
+                history_penalty[positions == position] = 1.0 - self.history_penalty_base ** (5 - idx)
+
+        exposure_boost = np.ones(len(base_scores))
+        if self.exposure_tracker and exposure_rates.any():
+            expected_rate = 1.0 / len(index["ids"])
+            exposure_boost = np.select(
+                [exposure_rates < expected_rate * 0.3, exposure_rates < expected_rate * 0.6, exposure_rates < expected_rate],
+                [1.8, 1.4, 1.1],
+                default=1.0
+            )
+
+        return base_scores * random_factor * history_penalty * exposure_boost
+
+    def _select_topn_candidates(self, index: Dict[str, Any], positions: np.ndarray, scores: np.ndarray,
+                                exposure_rates: np.ndarray) -> list:
+        """智能选择Top-N候选：前3名 + 4-8名随机1个 + 低曝光签体1个"""
+        order = np.argsort(-scores, kind="stable")
+
+        picks = [int(order[0]), int(order[1]), int(order[2])]
+
+        if len(order) >= 8:
+            picks.append(int(self._rng.choice(order[3:8])))
         else:
-            return 1.0
-
-    def _select_topn_candidates(self, scored_charms: list) -> list:
-        """智能选择Top-N候选"""
-        scored_charms.sort(key=lambda x: x["score"], reverse=True)
-
-        candidates = [scored_charms[0], scored_charms[1], scored_charms[2]]
-
-        if len(scored_charms) >= 8:
-            candidates.append(random.choice(scored_charms[3:8]))
-        else:
-            candidates.append(scored_charms[3] if len(scored_charms) > 3 else scored_charms[0])
+            picks.append(int(order[3]) if len(order) > 3 else int(order[0]))
 
         # Top-5: 选择低曝光签体
-        stats = self.exposure_tracker.get_global_stats() if self.exposure_tracker else {}
-        total = sum(stats.values()) or 1
-
-        underexposed = [
-            c for c in scored_charms[5:]
-            if (stats.get(c["id"], 0) / total) < (1.0 / 18 * 0.5)
-        ]
+        tail = order[5:]
+        underexposed = tail[exposure_rates[tail] < (1.0 / len(index["ids"]) * 0.5)]
 
-        if underexposed:
-            candidates.append(random.choice(underexposed[:3]))
+        if len(underexposed):
+            picks.append(int(self._rng.choice(underexposed[:3])))
         else:
-            candidates.append(scored_charms[4] if len(scored_charms) > 4 else scored_charms[0])
-
-        return candidates
-
-    def _build_generation_prompt(self, analysis: Dict[str, Any], task: Dict[str, Any], recommended_charms: list) -> str:
-        """构建生成prompt"""
+            # 第4名随机可能已选中第5名，顺延到下一个未选中的签体
+            rest = [int(i) for i in order[4:] if int(i) not in picks]
+            picks.append(rest[0] if rest else int(order[0]))
 
-        # 提取分析结果
-        psychological_profile = analysis.get("psychological_profile", {})
-        five_elements = analysis.get("five_elements", {})
-        hexagram_match = analysis.get("hexagram_match", {})
-        key_insights = analysis.get("key_insights", [])
-
-        # 构建推荐签体信息（现在是5个）
-        charm_info = ""
-        for i, charm in enumerate(recommended_charms, 1):
-            charm_info += f"  {i}. {charm.get('name', '')} (ID: {charm.get('id', '')}) - {charm.get('note', '')}\n"
-
-        # 获取绘画数据
-        drawing_data = task.get("drawing_data", {}).get("analysis", {})
+        return [
+            {"id": index["ids"][positions[i]], "name": index["names"][positions[i]], "score": float(scores[i])}
+            for i in picks
+        ]
 
-        prompt = f"""你是心象签创作大师，基于心理分析报告创作个性化心象签内容。
+    # 静态前缀：角色、创作要求与输出格式，跨请求完全一致，可由提供商做上下文缓存
+    GENERATION_PROMPT_PREFIX = """你是心象签创作大师，基于心理分析报告创作个性化心象签内容。
 
 ## 创作任务
-根据分析报告生成完整心象签，体现东方美学和个性化表达。
-
-## 分析报告
-**心理档案**:
-- 情绪状态: {psychological_profile.get('emotion_state', '未知')}
-- 核心需求: {', '.join(psychological_profile.get('core_needs', []))}
-- 能量类型: {psychological_profile.get('energy_type', '平衡')}
-- 主导特质: {', '.join(psychological_profile.get('dominant_traits', []))}
-
-**五行能量**:
-- 木: {five_elements.get('wood', 0.5)}  火: {five_elements.get('fire', 0.5)}  土: {five_elements.get('earth', 0.5)}
-- 金: {five_elements.get('metal', 0.5)}  水: {five_elements.get('water', 0.5)}
-
-**卦象匹配**:
-- 卦象: {hexagram_match.get('name', '未知')} ({hexagram_match.get('modern_name', '未知')})
-- 启示: {hexagram_match.get('insight', '未知')}
-
-**核心洞察**: {', '.join(key_insights)}
-
-## 可选签体
-{charm_info}
+根据文末的分析报告生成完整心象签，体现东方美学和个性化表达。
 
 ## 创作要求
 1. **个性化表达**：基于分析结果体现用户独特性，避免通用模板
 2. **文化融入**：结合卦象智慧和五行调和理念
 3. **现代表达**：传统文化的现代化演绎
 4. **色彩心理**：main_color和accent_color体现用户心理需求
-5. **签体匹配**：从推荐列表选择最符合用户特质的签体
+5. **签体匹配**：从文末"可选签体"中选择最符合用户特质的签体，参考下方签体目录中的造型、排版与配色特点
+6. **数据一致**：hexagram.name使用分析报告中的卦象现代化解读名，element_balance与ink_metrics照抄分析报告中的数值
 
 ## 输出格式
 严格按以下JSON格式返回，所有字段必填：
 
 ```json
-{{
-  "oracle_theme": {{
+{
+  "oracle_theme": {
     "title": "基于分析的自然意象(4-6字)",
     "subtitle": "今日心象签"
-  }},
-  "charm_identity": {{
+  },
+  "charm_identity": {
     "charm_name": "XX签(必须以'签'结尾)",
     "charm_description": "体现用户特质的签体描述",
     "charm_blessing": "个性化祝福(8字以内)",
     "main_color": "#hex颜色值",
     "accent_color": "#hex颜色值"
-  }},
+  },
   "affirmation": "直击用户内心的祝福语(8-14字)",
-  "oracle_manifest": {{
-    "hexagram": {{
-      "name": "{hexagram_match.get('modern_name', '内心和谐')}",
+  "oracle_manifest": {
+    "hexagram": {
+      "name": "卦象现代化解读名",
       "insight": "结合卦象的人生指引(不超过30字)"
-    }},
+    },
     "daily_guide": [
       "基于五行的平衡建议(15-25字)",
       "针对心理状态的实用指引(15-25字)"
     ],
     "fengshui_focus": "结合用户状态的环境建议",
     "ritual_hint": "简单易行的调和仪式",
-    "element_balance": {{
-      "wood": {five_elements.get('wood', 0.5)},
-      "fire": {five_elements.get('fire', 0.5)},
-      "earth": {five_elements.get('earth', 0.5)},
-      "metal": {five_elements.get('metal', 0.5)},
-      "water": {five_elements.get('water', 0.5)}
-    }}
-  }},
-  "ink_reading": {{
+    "element_balance": {
+      "wood": 0.5,
+      "fire": 0.5,
+      "earth": 0.5,
+      "metal": 0.5,
+      "water": 0.5
+    }
+  },
+  "ink_reading": {
     "stroke_impression": "基于绘画数据的心理解读(25-40字)",
     "symbolic_keywords": ["核心关键词1", "关键词2", "关键词3"],
-    "ink_metrics": {{
-      "stroke_count": {drawing_data.get('stroke_count', 0)},
-      "dominant_quadrant": "{drawing_data.get('dominant_quadrant', 'center')}",
-      "pressure_tendency": "{drawing_data.get('pressure_tendency', 'steady')}"
-    }}
-  }},
-  "context_insights": {{
+    "ink_metrics": {
+      "stroke_count": 0,
+      "dominant_quadrant": "center",
+      "pressure_tendency": "steady"
+    }
+  },
+  "context_insights": {
     "session_time": "时间段描述",
     "season_hint": "季节时分",
     "visit_pattern": "基于用户特征的访问模式",
     "historical_keywords": []
-  }},
+  },
   "blessing_stream": [
     "与意象呼应的祝福1(4-6字)",
     "体现需求的祝福2(4-6字)",
     "五行调和的祝福3(4-6字)",
     "未来希冀的祝福4(4-6字)"
   ],
-  "art_direction": {{
+  "art_direction": {
     "image_prompt": "基于意象的具体画面描述，水彩风格",
     "palette": ["主色调hex", "辅助色1hex", "辅助色2hex"],
     "animation_hint": "符合意境的动画效果"
-  }},
-  "ai_selected_charm": {{
+  },
+  "ai_selected_charm": {
     "charm_id": "选择的签体ID",
     "charm_name": "签体名称",
     "ai_reasoning": "基于分析选择此签体的原因"
-  }},
+  },
   "culture_note": "灵感源于易经与五行智慧，不作吉凶断言，请以现代视角理解。"
-}}
+}
 ```
 
 专注创作，体现深度个性化，避免套话模板。"""
 
-        return prompt
+    @classmethod
+    def generation_prompt_prefix(cls) -> str:
+        """可缓存的静态前缀：创作要求、输出格式与完整签体目录（随目录版本变化）"""
+        snapshot = get_charm_catalog().get()
+        if cls._prefix_version != snapshot.version:
+            cls._prefix_text = cls.GENERATION_PROMPT_PREFIX + "\n\n" + cls._format_charm_catalog(snapshot.configs)
+            cls._prefix_version = snapshot.version
+        return cls._prefix_text
+
+    @staticmethod
+    def _format_charm_catalog(configs: list) -> str:
+        lines = ["## 签体目录", "ai_selected_charm.charm_id 只能取自文末可选签体的ID；各签体的造型、排版与建议配色如下："]
+        for charm in configs:
+            palette = "、".join(charm.get("suggestedPalette") or [])
+            lines.append(
+                f"- {charm.get('id', '')}｜{charm.get('name', '')}"
+                + (f"｜建议配色 {palette}" if palette else "")
+                + f"｜{charm.get('note', '')}"
+            )
+        return "\n".join(lines)
+
+    def _build_generation_prompt(self, analysis: Dict[str, Any], task: Dict[str, Any], recommended_charms: list) -> str:
+        """构建完整生成prompt（静态前缀 + 动态分析报告）"""
+        return self.provider.compose_prompt(
+            self._build_generation_input(analysis, task, recommended_charms),
+            self.generation_prompt_prefix()
+        )
+
+    def _build_generation_input(self, analysis: Dict[str, Any], task: Dict[str, Any], recommended_charms: list) -> str:
+        """构建生成prompt的动态部分（分析报告、绘画数据与推荐签体）"""
+
+        # 提取分析结果
+        psychological_profile = analysis.get("psychological_profile", {})
+        five_elements = analysis.get("five_elements", {})
+        hexagram_match = analysis.get("hexagram_match", {})
+        key_insights = analysis.get("key_insights", [])
+
+        # 构建推荐签体信息（现在是5个；造型说明已在前缀的签体目录中）
+        charm_info = ""
+        for i, charm in enumerate(recommended_charms, 1):
+            charm_info += f"  {i}. {charm.get('name', '')} (ID: {charm.get('id', '')})\n"
+
+        # 获取绘画数据
+        drawing_data = task.get("drawing_data", {}).get("analysis", {})
+
+        return f"""## 分析报告
+**心理档案**:
+- 情绪状态: {psychological_profile.get('emotion_state', '未知')}
+- 核心需求: {', '.join(psychological_profile.get('core_needs', []))}
+- 能量类型: {psychological_profile.get('energy_type', '平衡')}
+- 主导特质: {', '.join(psychological_profile.get('dominant_traits', []))}
+
+**五行能量**:
+- 木: {five_elements.get('wood', 0.5)}  火: {five_elements.get('fire', 0.5)}  土: {five_elements.get('earth', 0.5)}
+- 金: {five_elements.get('metal', 0.5)}  水: {five_elements.get('water', 0.5)}
+
+**卦象匹配**:
+- 卦象: {hexagram_match.get('name', '未知')} ({hexagram_match.get('modern_name', '内心和谐')})
+- 启示: {hexagram_match.get('insight', '未知')}
+
+**核心洞察**: {', '.join(key_insights)}
+
+**绘画数据**: 笔画{drawing_data.get('stroke_count', 0)}笔，主要区域{drawing_data.get('dominant_quadrant', 'center')}，压力{drawing_data.get('pressure_tendency', 'steady')}
+
+## 可选签体
+{charm_info}"""
 
     def _parse_generation_response(self, response: str) -> Dict[str, Any]:
         """解析生成响应"""
@@ -572,6 +542,24 @@ class TwoStageGenerator:
                 "wood": 0.5, "fire": 0.5, "earth": 0.5, "metal": 0.5, "water": 0.5
             })
 
+        # 回填由输入决定的字段（静态前缀中不再内嵌这些数值）
+        manifest = oracle_content.get("oracle_manifest")
+        if isinstance(manifest, dict):
+            modern_name = analysis.get("hexagram_match", {}).get("modern_name")
+            if modern_name and isinstance(manifest.get("hexagram"), dict):
+                manifest["hexagram"]["name"] = modern_name
+            if analysis.get("five_elements"):
+                manifest["element_balance"] = analysis["five_elements"]
+
+        ink_reading = oracle_content.get("ink_reading")
+        if isinstance(ink_reading, dict):
+            drawing_data = task.get("drawing_data", {}).get("analysis", {})
+            ink_reading["ink_metrics"] = {
+                "stroke_count": drawing_data.get("stroke_count", 0),
+                "dominant_quadrant": drawing_data.get("dominant_quadrant", "center"),
+                "pressure_tendency": drawing_data.get("pressure_tendency", "steady")
+            }
+
         # 确保context_insights存在
         if "context_insights" not in oracle_content:
             temporal_info = self._get_temporal_info()
@@ -665,42 +653,6 @@ class TwoStageGenerator:
             "season_hint": season_hint
         }
 
-    def _load_charm_configs(self):
-        """加载签体配置"""
-        import os
-        import json
-
-        potential_paths = [
-            os.environ.get('CHARM_CONFIG_PATH'),
-            '/app/resources/签体/charm-config.json',
-            os.path.join(os.path.dirname(__file__), '../../../../resources/签体/charm-config.json'),
-            os.path.join(os.getcwd(), 'resources/签体/charm-config.json'),
-        ]
-
-        potential_paths = [p for p in potential_paths if p is not None]
-
-        for config_path in potential_paths:
-            try:
-                if os.path.exists(config_path):
-                    with open(config_path, 'r', encoding='utf-8') as f:
-                        configs = json.load(f)
-                        if isinstance(configs, list) and len(configs) > 0:
-                            self.logger.info(f"✅ 成功加载 {len(configs)} 个签体配置")
-                            return configs
-            except Exception:
-                continue
-
-        self.logger.warning("⚠️ 使用默认签体配置")
-        return self._get_default_charm_configs()
-
-    def _get_default_charm_configs(self):
-        """默认签体配置"""
-        return [
-            {"id": "lianhua-yuanpai", "name": "莲花圆牌 (平和雅致)", "note": "圆牌留白充足"},
-            {"id": "jinbian-moyu", "name": "金边墨玉璧 (沉稳庄重)", "note": "墨玉色调沉稳"},
-            {"id": "qinghua-cishan", "name": "青花瓷扇 (文化底蕴)", "note": "青花纹路典雅"}
-        ]
-
     def _get_default_field_value(self, field: str, analysis: Dict[str, Any]) -> Any:
         """获取字段的默认值"""
         defaults = {
@@ -4,6 +4,7 @@ import asyncio
 import os
 from typing import Dict, Any, Optional
 from ...providers.provider_factory import ProviderFactory
+from ...services.charm_catalog import get_charm_catalog
 
 logger = logging.getLogger(__name__)
 
@@ -14,9 +15,6 @@ class UnifiedContentGenerator:
         self.provider = ProviderFactory.create_text_provider("gemini")
         self.logger = logging.getLogger(self.__class__.__name__)
         
-        # 加载签体配置
-        self.charm_configs = self._load_charm_configs()
-        
         # 优化的重试配置 - 读取环境变量
         self.max_retries = int(os.getenv("GEMINI_RETRY_MAX_ATTEMPTS", "3"))
         retry_delays_str = os.getenv("GEMINI_RETRY_DELAYS", "2,8,20")
@@ -416,24 +414,8 @@ JSON格式(必须完整)：
     
     
     
-    def _load_charm_configs(self):
-        """加载签体配置 - 精简版本"""
-        try:
-            config_path = os.getenv('CHARM_CONFIG_PATH', '/app/resources/签体/charm-config.json')
-            
-            if os.path.exists(config_path):
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    configs = json.load(f)
-                    self.logger.info(f"✅ 成功加载 {len(configs)} 个签体配置")
-                    return configs
-            else:
-                self.logger.warning("⚠️ 使用默认签体配置")
-                return [
-                    {"id": "lianhua-yuanpai", "name": "莲花圆牌 (平和雅致)", "note": "内心平和"},
-                    {"id": "xiangYun-liucai", "name": "祥云流彩 (活力充沛)", "note": "活力充沛"},
-                    {"id": "shuimo-chanxin", "name": "水墨禅心 (禅意深远)", "note": "禅意深远"}
-                ]
-        except Exception as e:
-            self.logger.error(f"❌ 加载签体配置失败: {e}")
-            return [{"id": "fallback", "name": "默认签体", "note": "备用配置"}]
+    @property
+    def charm_configs(self) -> list:
+        """签体配置（来自进程级共享的签体目录，文件变化时自动热更新）"""
+        return get_charm_catalog().get().configs
     
@@ -260,6 +260,10 @@ class PostcardWorkflow:
                 resp = await client.post(url, json=payload)
                 if resp.status_code == 200:
                     self.logger.info("✅ 最终结果提交成功")
+                    # 记录明信片对生成产物的引用，未被引用的对象由存储GC回收
+                    from ..storage import get_content_store
+                    store = get_content_store()
+                    await store.add_references(task_id, store.keys_in(payload))
                 else:
                     self.logger.error(f"❌ 最终结果提交失败: {resp.status_code} - {resp.text}")
 
@@ -4,7 +4,9 @@ from .base_provider import BaseProvider, BaseTextProvider, BaseImageProvider, Ba
 from .gemini_text_provider import GeminiTextProvider
 from .gemini_image_provider import GeminiImageProvider
 from .laozhang_image_provider import LaoZhangImageProvider
+from .response_cache import CachedTextProvider, LLMResponseCache, get_response_cache
 from .provider_factory import ProviderFactory
+from .image_provider_router import ImageProviderRouter, get_image_provider_router
 
 __all__ = [
     'BaseProvider',
@@ -14,5 +16,10 @@ __all__ = [
     'GeminiTextProvider',
     'GeminiImageProvider',
     'LaoZhangImageProvider',
-    'ProviderFactory'
+    'CachedTextProvider',
+    'LLMResponseCache',
+    'get_response_cache',
+    'ProviderFactory',
+    'ImageProviderRouter',
+    'get_image_provider_router'
 ]
\ No newline at end of file
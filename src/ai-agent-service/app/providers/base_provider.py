@@ -21,15 +21,28 @@ class BaseTextProvider(BaseProvider):
     
     @abstractmethod
     async def generate_text(
-        self, 
-        prompt: str, 
+        self,
+        prompt: str,
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
         **kwargs
     ) -> str:
-        """生成文本"""
+        """生成文本
+
+        kwargs 约定:
+            cached_prefix: 可缓存的静态prompt前缀（指令、维度定义、输出格式等），
+                prompt 仅为动态后缀。不支持上下文缓存的提供商应按
+                compose_prompt 拼接后整体发送。
+        """
         pass
 
+    @staticmethod
+    def compose_prompt(prompt: str, cached_prefix: Optional[str] = None) -> str:
+        """将静态前缀与动态后缀拼接为完整prompt"""
+        if not cached_prefix:
+            return prompt
+        return f"{cached_prefix}\n\n{prompt}"
+
 class BaseImageProvider(BaseProvider):
     """图片生成提供商基类"""
     
@@ -0,0 +1,269 @@
+"""
+本地假提供商（压测/离线联调用）
+按可配置的延迟分布、错误率与输出长度模拟上游模型，返回符合分析/生成步骤JSON结构的固定内容与程序生成的PNG背景图。
+AI_PROVIDER_MODE=fake 时由 ProviderFactory 替换所有文本/图片提供商；需要连同HTTP层一起压测时，
+改为启动 app.providers.fake_server 并将 GEMINI_BASE_URL / META_BASE_URL / LAO_ZHANG_URL 指向它。
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import struct
+import zlib
+from typing import Any, Dict, Optional
+
+from .base_provider import BaseTextProvider, BaseImageProvider
+
+
+class LatencyModel:
+    """延迟分布，格式: fixed:秒 | uniform:最小:最大 | normal:均值:标准差 | lognormal:中位数:sigma"""
+
+    def __init__(self, spec: str, rng: random.Random):
+        parts = (spec or "fixed:0").split(":")
+        self.kind = parts[0]
+        self.params = [float(p) for p in parts[1:]]
+        self.rng = rng
+        if self.kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"不支持的延迟分布: {spec}")
+
+    def sample(self) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0] if p else 0.0
+        elif self.kind == "uniform":
+            value = self.rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = self.rng.gauss(p[0], p[1])
+        else:
+            value = p[0] * math.exp(self.rng.gauss(0, p[1]))
+        return max(0.0, value)
+
+
+class FakeProfile:
+    """一类假调用（文本/图片）的行为配置，环境变量前缀 FAKE_TEXT_ / FAKE_IMAGE_"""
+
+    def __init__(self, kind: str, default_latency: str):
+        prefix = f"FAKE_{kind.upper()}_"
+        seed = int(os.getenv("FAKE_PROVIDER_SEED", "42"))
+        self.rng = random.Random(f"{seed}:{kind}")
+        self.latency = LatencyModel(os.getenv(f"{prefix}LATENCY", default_latency), self.rng)
+        self.error_rate = float(os.getenv(f"{prefix}ERROR_RATE", "0"))
+        # 每输出token追加的生成耗时（毫秒），模拟长输出更慢
+        self.per_token_ms = float(os.getenv(f"{prefix}PER_TOKEN_MS", "0"))
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and self.rng.random() < self.error_rate
+
+    def delay_for(self, output_tokens: int = 0) -> float:
+        return self.latency.sample() + output_tokens * self.per_token_ms / 1000.0
+
+
+# 固定内容池：按prompt哈希选择，同一输入得到同一结果
+SCENES = [
+    {"title": "晨光照进窗", "palette": ["#f5e6cc", "#d9c4f2", "#9DE0AD"], "hint": "从模糊到清晰的光晕扩散",
+     "hexagram": ("地天泰", "安泰通达"), "emotion": "平静", "energy": "平衡"},
+    {"title": "雨后竹林", "palette": ["#cfe8d5", "#7fb59a", "#f2efe6"], "hint": "水珠沿竹叶缓缓滑落",
+     "hexagram": ("风雷益", "积累成长"), "emotion": "沉思", "energy": "内省"},
+    {"title": "山间云海", "palette": ["#e6eef7", "#a9c1de", "#f7e7c6"], "hint": "云层缓慢流动",
+     "hexagram": ("天山遁", "退而有守"), "emotion": "焦虑", "energy": "内省"},
+    {"title": "夕阳下的湖面", "palette": ["#f8d6b3", "#e79a7a", "#6f8fb5"], "hint": "波光由近及远闪烁",
+     "hexagram": ("火天大有", "丰盛包容"), "emotion": "愉悦", "energy": "活跃"},
+    {"title": "星河入梦", "palette": ["#1f2a4a", "#6c5ea8", "#f3e3a1"], "hint": "星点渐次亮起",
+     "hexagram": ("水火既济", "圆满有序"), "emotion": "兴奋", "energy": "活跃"},
+]
+
+ELEMENTS = ["wood", "fire", "earth", "metal", "water"]
+
+
+def _rng_for(text: str) -> random.Random:
+    return random.Random(hashlib.sha256(text.encode("utf-8")).hexdigest())
+
+
+def canned_analysis(prompt: str) -> Dict[str, Any]:
+    """符合 TwoStageAnalyzer 校验规则的分析结果"""
+    rng = _rng_for(prompt)
+    scene = rng.choice(SCENES)
+    return {
+        "psychological_profile": {
+            "emotion_state": scene["emotion"],
+            "core_needs": rng.sample(["被理解", "安全感", "自我成长", "放松休息", "表达自我"], 2),
+            "energy_type": scene["energy"],
+            "dominant_traits": rng.sample(["细腻", "坚韧", "好奇", "温和", "专注", "乐观"], 3)
+        },
+        "five_elements": {element: round(rng.uniform(0.2, 0.9), 2) for element in ELEMENTS},
+        "hexagram_match": {
+            "name": scene["hexagram"][0],
+            "modern_name": scene["hexagram"][1],
+            "insight": "顺势而为，静待花开"
+        },
+        "key_insights": ["内心渴望片刻安宁", "对生活保有期待", "需要温柔的自我肯定"]
+    }
+
+
+def canned_oracle(prompt: str) -> Dict[str, Any]:
+    """符合 TwoStageGenerator / 统一生成器结构的心象签内容；签体从prompt的可选签体中选取"""
+    rng = _rng_for(prompt)
+    scene = rng.choice(SCENES)
+    charm_ids = re.findall(r"\(ID:\s*([\w-]+)\)", prompt)
+    charm_id = rng.choice(charm_ids) if charm_ids else "lianhua-yuanpai"
+    return {
+        "oracle_theme": {"title": scene["title"], "subtitle": "今日心象签"},
+        "charm_identity": {
+            "charm_name": f"{scene['title'][:2]}签",
+            "charm_description": "心有所安，步履从容",
+            "charm_blessing": "愿你心安",
+            "main_color": scene["palette"][0],
+            "accent_color": scene["palette"][1]
+        },
+        "affirmation": "愿你被这个世界温柔以待",
+        "oracle_manifest": {
+            "hexagram": {"name": scene["hexagram"][1], "insight": "在变化中寻找属于自己的节奏"},
+            "daily_guide": ["宜整理书桌，给心留白", "宜与老友简短问候"],
+            "fengshui_focus": "窗边保持通透明亮",
+            "ritual_hint": "睡前写下今天的三件小确幸",
+            "element_balance": {element: round(rng.uniform(0.2, 0.9), 2) for element in ELEMENTS}
+        },
+        "ink_reading": {
+            "stroke_impression": "笔触舒展而有停顿，显示你在行动前习惯先感受与思考",
+            "symbolic_keywords": ["舒展", "停顿", "温度"],
+            "ink_metrics": {"stroke_count": 0, "dominant_quadrant": "center", "pressure_tendency": "steady"}
+        },
+        "context_insights": {
+            "session_time": "午后",
+            "season_hint": "秋意渐浓",
+            "visit_pattern": "心象之旅",
+            "historical_keywords": []
+        },
+        "blessing_stream": ["心安即归处", "步步生光", "五行调和", "未来可期"],
+        "art_direction": {
+            "image_prompt": f"{scene['title']}的抽象水彩",
+            "palette": scene["palette"],
+            "animation_hint": scene["hint"]
+        },
+        "ai_selected_charm": {
+            "charm_id": charm_id,
+            "charm_name": charm_id,
+            "ai_reasoning": "签体气质与当前心境相呼应"
+        },
+        "culture_note": "灵感源于易经与五行智慧，不作吉凶断言，请以现代视角理解。"
+    }
+
+
+def canned_text(prompt: str) -> str:
+    """按prompt中的输出格式选择对应结构，包裹在```json代码块中（与真实模型输出一致）"""
+    if "psychological_profile" in prompt and "oracle_theme" not in prompt:
+        payload = canned_analysis(prompt)
+    else:
+        payload = canned_oracle(prompt)
+    return f"```json\n{json.dumps(payload, ensure_ascii=False, indent=2)}\n```"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文约1字1token，ASCII约4字符1token"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + ascii_chars // 4
+
+
+def gradient_png(prompt: str, size: int = 512) -> bytes:
+    """按prompt中的配色生成竖向渐变PNG（纯Python，不依赖PIL）"""
+    colors = re.findall(r"#([0-9a-fA-F]{6})", prompt)[:2]
+    if len(colors) < 2:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        colors = [digest[:6], digest[6:12]]
+    top, bottom = ([int(c[i:i + 2], 16) for i in (0, 2, 4)] for c in colors)
+
+    rows = []
+    for y in range(size):
+        t = y / max(1, size - 1)
+        pixel = bytes(int(a + (b - a) * t) for a, b in zip(top, bottom))
+        rows.append(b"\x00" + pixel * size)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+class FakeTextProvider(BaseTextProvider):
+    """假文本提供商：模拟延迟与错误，返回固定结构JSON"""
+
+    _profile: Optional[FakeProfile] = None
+
+    def __init__(self):
+        super().__init__()
+        # 进程级共享配置与随机源，保证同一种子下的调用序列可复现
+        if FakeTextProvider._profile is None:
+            FakeTextProvider._profile = FakeProfile("text", "lognormal:1.5:0.4")
+        self.profile = FakeTextProvider._profile
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        **kwargs
+    ) -> str:
+        full_prompt = self.compose_prompt(prompt, kwargs.get("cached_prefix"))
+        text = canned_text(full_prompt)
+        await asyncio.sleep(self.profile.delay_for(estimate_tokens(text)))
+        if self.profile.should_fail():
+            raise Exception("429 RESOURCE_EXHAUSTED (fake provider)")
+        return text
+
+    async def health_check(self) -> bool:
+        return True
+
+
+class FakeImageProvider(BaseImageProvider):
+    """假图片提供商：模拟延迟与错误，生成渐变PNG写入存储（走完整的派生图/引用计数链路）"""
+
+    _profile: Optional[FakeProfile] = None
+
+    def __init__(self):
+        super().__init__()
+        if FakeImageProvider._profile is None:
+            FakeImageProvider._profile = FakeProfile("image", "lognormal:8:0.3")
+        self.profile = FakeImageProvider._profile
+        self.image_size = int(os.getenv("FAKE_IMAGE_SIZE", "512"))
+
+    async def generate_image(
+        self,
+        prompt: str,
+        size: Optional[str] = None,
+        quality: Optional[str] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        metadata = {"prompt": prompt, "size": size, "quality": quality, "model": "fake-image", "provider": "fake"}
+        await asyncio.sleep(self.profile.delay_for())
+        if self.profile.should_fail():
+            # 与真实提供商一致：失败时返回占位图并标记fallback
+            return {
+                "image_url": "https://via.placeholder.com/1024x1024/FFB6C1/000000?text=AI+Generated+Image",
+                "metadata": dict(metadata, error="simulated failure", fallback=True)
+            }
+
+        from ..storage import get_content_store
+
+        loop = asyncio.get_event_loop()
+        data = await loop.run_in_executor(None, gradient_png, prompt, self.image_size)
+        stored = await get_content_store().put_bytes(data, "png")
+        return {
+            "image_url": stored["url"],
+            "metadata": dict(metadata, real_generation=True, storage_key=stored["key"])
+        }
+
+    def _placeholder_url(self) -> str:
+        return "https://via.placeholder.com/1024x1024/FFB6C1/000000?text=AI+Generated+Image"
+
+    async def health_check(self) -> bool:
+        return True
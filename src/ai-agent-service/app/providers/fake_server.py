@@ -0,0 +1,220 @@
+"""
+本地假AI上游服务（压测用）
+模拟 Gemini generateContent / cachedContents / 模型元数据接口与老张AI chat/completions 接口的请求与响应结构，
+延迟分布、错误率与输出内容与进程内假提供商（fake_provider）共用同一套配置，可在完全离线的环境中压测完整链路。
+
+运行：python -m app.providers.fake_server --port 8089
+然后设置 GEMINI_BASE_URL=META_BASE_URL=http://fake-ai:8089，LAO_ZHANG_URL=http://fake-ai:8089/v1/chat/completions
+"""
+
+import argparse
+import asyncio
+import base64
+import logging
+import os
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from aiohttp import web
+
+from .fake_provider import FakeProfile, canned_text, estimate_tokens, gradient_png
+
+logger = logging.getLogger(__name__)
+
+
+def _gemini_error(status: int, reason: str, message: str) -> web.Response:
+    return web.json_response({"error": {"code": status, "message": message, "status": reason}}, status=status)
+
+
+def _parts_text(contents: Any) -> str:
+    """从 generateContent / cachedContents 请求体的 contents 中提取全部文本"""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, dict):
+        contents = [contents]
+    texts: List[str] = []
+    for content in contents or []:
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content.get("parts", []):
+            if isinstance(part, dict) and part.get("text"):
+                texts.append(part["text"])
+    return "\n\n".join(texts)
+
+
+class FakeAIServer:
+    """假上游服务：Gemini 与老张AI 接口形状"""
+
+    def __init__(self):
+        self.text_profile = FakeProfile("text", "lognormal:1.5:0.4")
+        self.image_profile = FakeProfile("image", "lognormal:8:0.3")
+        self.image_size = int(os.getenv("FAKE_IMAGE_SIZE", "512"))
+        self.cached_contents: Dict[str, str] = {}
+        self.stats: Counter = Counter()
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_get("/v1beta/models", self.list_models)
+        app.router.add_get("/v1/models", self.list_models)
+        app.router.add_get("/v1beta/models/{model}", self.get_model)
+        app.router.add_post("/v1beta/models/{target}", self.generate_content)
+        app.router.add_post("/v1beta/cachedContents", self.create_cached_content)
+        app.router.add_patch("/v1beta/cachedContents/{cache_id}", self.update_cached_content)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_get("/stats", self.get_stats)
+        return app
+
+    async def _simulate(self, profile: FakeProfile, output_tokens: int = 0) -> bool:
+        """按配置等待并决定本次是否失败"""
+        await asyncio.sleep(profile.delay_for(output_tokens))
+        return profile.should_fail()
+
+    async def list_models(self, request: web.Request) -> web.Response:
+        models = [{"name": "models/fake-text"}, {"name": "models/fake-image"}]
+        return web.json_response({"models": models, "data": [{"id": m["name"]} for m in models]})
+
+    async def get_model(self, request: web.Request) -> web.Response:
+        model = request.match_info["model"]
+        return web.json_response({
+            "name": f"models/{model}",
+            "displayName": model,
+            "inputTokenLimit": 1048576,
+            "outputTokenLimit": 8192,
+            "supportedGenerationMethods": ["generateContent", "createCachedContent"]
+        })
+
+    async def generate_content(self, request: web.Request) -> web.Response:
+        model, _, method = request.match_info["target"].partition(":")
+        if method != "generateContent":
+            return _gemini_error(404, "NOT_FOUND", f"不支持的方法: {method}")
+
+        body = await request.json()
+        prompt = _parts_text(body.get("contents"))
+        cache_name = body.get("cachedContent")
+        if cache_name:
+            if cache_name not in self.cached_contents:
+                return _gemini_error(404, "NOT_FOUND", f"CachedContent not found: {cache_name}")
+            prompt = f"{self.cached_contents[cache_name]}\n\n{prompt}"
+
+        modalities = (body.get("generationConfig") or {}).get("responseModalities") or []
+        wants_image = "IMAGE" in modalities or "image" in model
+        self.stats["gemini_image" if wants_image else "gemini_text"] += 1
+
+        if wants_image:
+            if await self._simulate(self.image_profile):
+                self.stats["errors"] += 1
+                return _gemini_error(503, "UNAVAILABLE", "The model is overloaded. Please try again later.")
+            loop = asyncio.get_event_loop()
+            png = await loop.run_in_executor(None, gradient_png, prompt, self.image_size)
+            parts = [
+                {"text": "Here is the generated image."},
+                {"inlineData": {"mimeType": "image/png", "data": base64.b64encode(png).decode("ascii")}}
+            ]
+            output_tokens = 1290
+        else:
+            text = canned_text(prompt)
+            output_tokens = estimate_tokens(text)
+            if await self._simulate(self.text_profile, output_tokens):
+                self.stats["errors"] += 1
+                return _gemini_error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota).")
+            parts = [{"text": text}]
+
+        prompt_tokens = estimate_tokens(prompt)
+        return web.json_response({
+            "candidates": [{
+                "content": {"role": "model", "parts": parts},
+                "finishReason": "STOP",
+                "index": 0
+            }],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "cachedContentTokenCount": estimate_tokens(self.cached_contents.get(cache_name, "")) if cache_name else 0,
+                "candidatesTokenCount": output_tokens,
+                "totalTokenCount": prompt_tokens + output_tokens
+            },
+            "modelVersion": model
+        })
+
+    def _cached_content_body(self, name: str, model: str, ttl_seconds: float) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc)
+        return {
+            "name": name,
+            "model": model,
+            "createTime": now.isoformat().replace("+00:00", "Z"),
+            "updateTime": now.isoformat().replace("+00:00", "Z"),
+            "expireTime": (now + timedelta(seconds=ttl_seconds)).isoformat().replace("+00:00", "Z"),
+            "usageMetadata": {"totalTokenCount": estimate_tokens(self.cached_contents.get(name, ""))}
+        }
+
+    async def create_cached_content(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        name = f"cachedContents/{uuid.uuid4().hex[:16]}"
+        self.cached_contents[name] = _parts_text(body.get("contents"))
+        self.stats["cached_contents"] += 1
+        ttl = float(str(body.get("ttl", "3600s")).rstrip("s") or 3600)
+        return web.json_response(self._cached_content_body(name, body.get("model", ""), ttl))
+
+    async def update_cached_content(self, request: web.Request) -> web.Response:
+        name = f"cachedContents/{request.match_info['cache_id']}"
+        if name not in self.cached_contents:
+            return _gemini_error(404, "NOT_FOUND", f"CachedContent not found: {name}")
+        body = await request.json()
+        ttl = float(str(body.get("ttl", "3600s")).rstrip("s") or 3600)
+        return web.json_response(self._cached_content_body(name, "", ttl))
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        """老张AI：图片以markdown内嵌data URI的形式放在message.content中"""
+        body = await request.json()
+        prompt = _parts_text([{"parts": [{"text": m.get("content", "")} for m in body.get("messages", [])]}])
+        self.stats["laozhang_image"] += 1
+
+        if await self._simulate(self.image_profile):
+            self.stats["errors"] += 1
+            return web.json_response(
+                {"error": {"message": "upstream overloaded", "type": "server_error", "code": "overloaded"}},
+                status=503
+            )
+
+        loop = asyncio.get_event_loop()
+        png = await loop.run_in_executor(None, gradient_png, prompt, self.image_size)
+        content = f"![image](data:image/png;base64,{base64.b64encode(png).decode('ascii')})"
+        prompt_tokens = estimate_tokens(prompt)
+        return web.json_response({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-image"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 1290, "total_tokens": prompt_tokens + 1290}
+        })
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地假AI上游服务（Gemini / 老张AI 接口形状）")
+    parser.add_argument("--host", default=os.getenv("FAKE_AI_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("FAKE_AI_PORT", "8089")))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    server = FakeAIServer()
+    logger.info(
+        f"🧪 假AI上游服务启动: http://{args.host}:{args.port} "
+        f"text_error_rate={server.text_profile.error_rate} image_error_rate={server.image_profile.error_rate}"
+    )
+    web.run_app(server.build_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,11 @@
 from google import genai
 from typing import Dict, Any, Optional
 from .base_provider import BaseImageProvider
+from ..utils.rate_limiter import get_rate_limiter
+from ..storage import get_content_store
 import os
 import aiohttp
 import asyncio
-from PIL import Image
-from io import BytesIO
-import base64
 
 class GeminiImageProvider(BaseImageProvider):
     """Gemini图片生成服务提供商"""
@@ -75,19 +74,20 @@ class GeminiImageProvider(BaseImageProvider):
             final_prompt = prompt
             self.logger.info(f"📝 使用传入的完整prompt（长度: {len(final_prompt)} 字符）")
             
-            # 按照官网教程调用图片生成API
+            # 按照官网教程调用图片生成API（经客户端限流）
             loop = asyncio.get_event_loop()
             
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.client.models.generate_content(
-                    model=self.model_name,
-                    contents=final_prompt,
-                    config=genai.types.GenerateContentConfig(
-                        response_modalities=['TEXT', 'IMAGE']
+            async with get_rate_limiter("gemini_image").acquire():
+                response = await loop.run_in_executor(
+                    None,
+                    lambda: self.client.models.generate_content(
+                        model=self.model_name,
+                        contents=final_prompt,
+                        config=genai.types.GenerateContentConfig(
+                            response_modalities=['TEXT', 'IMAGE']
+                        )
                     )
                 )
-            )
             
             # 按照官方教程处理响应
             if response.candidates and len(response.candidates) > 0:
@@ -96,35 +96,21 @@ class GeminiImageProvider(BaseImageProvider):
                 # 查找图片数据
                 image_saved = False
                 image_url = None
+                storage_key = None
                 
                 for part in content_parts:
                     if part.text is not None:
                         self.logger.info(f"📝 Gemini返回文本: {part.text[:100]}...")
                     elif part.inline_data is not None:
-                        # 保存图片数据
+                        # 保存图片数据（原始字节按内容哈希写入存储，文件写入在线程池中完成）
                         try:
-                            image = Image.open(BytesIO(part.inline_data.data))
-                            
-                            # 创建保存目录
-                            import tempfile
-                            import uuid
-                            
-                            # 生成唯一文件名
-                            image_id = str(uuid.uuid4())[:8]
-                            image_filename = f"gemini_generated_{image_id}.png"
-                            
-                            # 保存到静态文件目录，供HTTP访问
-                            static_dir = "/app/app/static/generated"
-                            os.makedirs(static_dir, exist_ok=True)
-                            image_path = f"{static_dir}/{image_filename}"
-                            image.save(image_path)
-                            
-                            # 构建可通过HTTP访问的URL
-                            base_url = os.getenv("AI_AGENT_PUBLIC_URL", "http://ai-agent-service:8000")
-                            image_url = f"{base_url}/static/generated/{image_filename}"
+                            image_format = self._format_from_mime(part.inline_data.mime_type)
+                            stored = await get_content_store().put_bytes(part.inline_data.data, image_format)
+                            storage_key = stored["key"]
+                            image_url = stored["url"]
                             image_saved = True
                             
-                            self.logger.info(f"✅ 图片保存成功: {image_path}")
+                            self.logger.info(f"✅ 图片保存成功: {storage_key}")
                             break
                             
                         except Exception as save_error:
@@ -139,7 +125,8 @@ class GeminiImageProvider(BaseImageProvider):
                             "quality": quality,
                             "model": self.model_name,
                             "provider": "gemini",
-                            "real_generation": True
+                            "real_generation": True,
+                            "storage_key": storage_key
                         }
                     }
                     self.logger.info("✅ Gemini真实图片生成成功")
@@ -167,15 +154,23 @@ class GeminiImageProvider(BaseImageProvider):
     
     async def health_check(self) -> bool:
         """健康检查"""
+        if not self.api_key:
+            return False
         try:
-            # 简单的连接测试
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.base_url}/v1/models"
+            # 查询单个模型元数据，不消耗生成配额
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
+                url = f"{self.base_url}/v1beta/models/{self.model_name}"
                 headers = {"x-goog-api-key": self.api_key}
                 async with session.get(url, headers=headers) as response:
                     return response.status == 200
-        except:
+        except Exception as e:
+            self.logger.warning(f"健康检查失败: {e}")
             return False
 
+    @staticmethod
+    def _format_from_mime(mime_type: Optional[str]) -> str:
+        subtype = (mime_type or "image/png").split("/")[-1].lower()
+        return "jpg" if subtype == "jpeg" else subtype
+    
     def _placeholder_url(self) -> str:
         return "https://via.placeholder.com/1024x1024/FFB6C1/000000?text=AI+Generated+Image"
\ No newline at end of file
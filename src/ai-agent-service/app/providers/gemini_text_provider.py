@@ -1,12 +1,22 @@
 from google import genai
-from typing import Dict, Any, Optional
+from google.genai import errors as genai_errors
+from typing import Dict, Any, Optional, Tuple
 from .base_provider import BaseTextProvider
+from ..utils.rate_limiter import get_rate_limiter
 import os
+import time
 import asyncio
+import hashlib
 
 class GeminiTextProvider(BaseTextProvider):
     """Gemini文本生成服务提供商"""
     
+    # 上下文缓存注册表（进程级共享，步骤实例每次任务都会重建provider）
+    # prefix_hash -> (cached_content_name, expires_at)；name为None表示创建失败的负缓存
+    _context_caches: Dict[str, Tuple[Optional[str], float]] = {}
+    # 每个前缀一把锁，只串行化同一前缀的创建/续期
+    _context_cache_locks: Dict[str, asyncio.Lock] = {}
+    
     def __init__(self):
         super().__init__()
         
@@ -29,6 +39,16 @@ class GeminiTextProvider(BaseTextProvider):
             "max_output_tokens": int(os.getenv("GEMINI_TEXT_MAX_TOKENS", "2048")),
         }
         
+        # 上下文缓存配置：静态prompt前缀上传一次，后续请求只发送动态后缀
+        self.context_cache_enabled = os.getenv("GEMINI_CONTEXT_CACHE", "on") == "on"
+        self.context_cache_ttl = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+        # 距过期不足该秒数时续期，避免请求恰好落在缓存失效的边界
+        self.context_cache_refresh_margin = int(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN", "300"))
+        # 创建失败（前缀过短、代理不支持等）后的重试冷却时间
+        self.context_cache_retry_after = int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_AFTER", "600"))
+        # 模型可缓存内容的最小token数，低于该值的前缀不创建缓存
+        self.context_cache_min_tokens = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+        
         self.logger.info(f"✅ Gemini文本提供商初始化成功: {self.model_name}")
     
     async def generate_text(
@@ -42,15 +62,22 @@ class GeminiTextProvider(BaseTextProvider):
         try:
             self.logger.info(f"📝 开始生成文本，模型: {self.model_name}")
             
-            # 使用新SDK在线程池中运行
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.client.models.generate_content(
-                    model=self.model_name,
-                    contents=prompt
-                )
-            )
+            cached_prefix = kwargs.get("cached_prefix")
+            cache_key = None
+            cache_name = None
+            if cached_prefix and self.context_cache_enabled:
+                cache_key = self._context_cache_key(cached_prefix)
+                cache_name = await self._get_context_cache(cache_key, cached_prefix)
+            
+            try:
+                response = await self._generate_content(prompt, cached_prefix, cache_name)
+            except genai_errors.ClientError as e:
+                if not cache_name or e.code not in (400, 403, 404):
+                    raise
+                # 缓存已被清除/模型变更等导致cached_content被拒：作废缓存条目，用完整prompt重试一次
+                self.logger.warning(f"⚠️ 上下文缓存不可用，改用完整prompt重试: {cache_name} - {e}")
+                self._drop_context_cache(cache_key, cache_name)
+                response = await self._generate_content(prompt, cached_prefix, None)
             
             if response.candidates and len(response.candidates) > 0:
                 content_parts = response.candidates[0].content.parts
@@ -74,10 +101,115 @@ class GeminiTextProvider(BaseTextProvider):
             self.logger.error(f"❌ Gemini文本生成失败: {e}")
             raise
     
+    async def _generate_content(self, prompt: str, cached_prefix: Optional[str], cache_name: Optional[str]):
+        if cache_name:
+            contents = prompt
+            config = genai.types.GenerateContentConfig(cached_content=cache_name)
+        else:
+            contents = self.compose_prompt(prompt, cached_prefix)
+            config = None
+        
+        # 使用新SDK在线程池中运行（经客户端限流，避免多worker同时触发429）
+        loop = asyncio.get_event_loop()
+        async with get_rate_limiter("gemini_text").acquire():
+            return await loop.run_in_executor(
+                None,
+                lambda: self.client.models.generate_content(
+                    model=self.model_name,
+                    contents=contents,
+                    config=config
+                )
+            )
+    
+    def _context_cache_key(self, prefix: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\n{prefix}".encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """粗略估算token数：中日韩字符约1字1 token，其余约4字符1 token"""
+        cjk = sum(1 for ch in text if "\u3000" <= ch <= "\u9fff" or "\uff00" <= ch <= "\uffef")
+        return cjk + (len(text) - cjk) // 4
+    
+    def _drop_context_cache(self, key: str, name: str):
+        entry = GeminiTextProvider._context_caches.get(key)
+        if entry and entry[0] == name:
+            del GeminiTextProvider._context_caches[key]
+    
+    async def _get_context_cache(self, key: str, prefix: str) -> Optional[str]:
+        """获取（必要时创建或续期）静态前缀对应的上下文缓存名称；不可用时返回None走完整prompt"""
+        if self._estimate_tokens(prefix) < self.context_cache_min_tokens:
+            # 低于模型最小可缓存长度，创建必然失败
+            return None
+        
+        cls = GeminiTextProvider
+        now = time.time()
+        entry = cls._context_caches.get(key)
+        if entry:
+            name, expires_at = entry
+            if name is None and now < expires_at:
+                # 负缓存：冷却期内直接走完整prompt
+                return None
+            if name is not None and now < expires_at - self.context_cache_refresh_margin:
+                return name
+        
+        lock = cls._context_cache_locks.setdefault(key, asyncio.Lock())
+        if lock.locked():
+            # 其他请求正在创建/续期：本次不等待网络调用，直接使用完整prompt
+            return None
+        
+        async with lock:
+            entry = cls._context_caches.get(key)
+            now = time.time()
+            if entry and entry[0] is not None and now < entry[1]:
+                # 即将过期：续期TTL，失败则重新创建
+                if await self._refresh_context_cache(key, entry[0]):
+                    return entry[0]
+            return await self._create_context_cache(key, prefix)
+    
+    async def _create_context_cache(self, key: str, prefix: str) -> Optional[str]:
+        loop = asyncio.get_event_loop()
+        try:
+            cached = await loop.run_in_executor(
+                None,
+                lambda: self.client.caches.create(
+                    model=self.model_name,
+                    config=genai.types.CreateCachedContentConfig(
+                        contents=[prefix],
+                        display_name=f"prompt-prefix-{key[:12]}",
+                        ttl=f"{self.context_cache_ttl}s"
+                    )
+                )
+            )
+            GeminiTextProvider._context_caches[key] = (cached.name, time.time() + self.context_cache_ttl)
+            self.logger.info(f"🗄️ 创建上下文缓存成功: {cached.name}（前缀 {len(prefix)} 字符）")
+            return cached.name
+        except Exception as e:
+            GeminiTextProvider._context_caches[key] = (None, time.time() + self.context_cache_retry_after)
+            self.logger.warning(f"⚠️ 创建上下文缓存失败，回退完整prompt: {e}")
+            return None
+    
+    async def _refresh_context_cache(self, key: str, name: str) -> bool:
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(
+                None,
+                lambda: self.client.caches.update(
+                    name=name,
+                    config=genai.types.UpdateCachedContentConfig(ttl=f"{self.context_cache_ttl}s")
+                )
+            )
+            GeminiTextProvider._context_caches[key] = (name, time.time() + self.context_cache_ttl)
+            self.logger.info(f"🗄️ 上下文缓存已续期: {name}")
+            return True
+        except Exception as e:
+            self.logger.warning(f"⚠️ 上下文缓存续期失败，将重新创建: {e}")
+            return False
+    
     async def health_check(self) -> bool:
-        """健康检查"""
+        """健康检查：查询模型元数据，不消耗生成配额"""
         try:
-            test_response = await self.generate_text("测试连接", max_tokens=10)
-            return bool(test_response)
-        except:
+            model = await self.client.aio.models.get(model=self.model_name)
+            return bool(model)
+        except Exception as e:
+            self.logger.warning(f"健康检查失败: {e}")
             return False
\ No newline at end of file
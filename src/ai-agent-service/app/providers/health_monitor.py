@@ -0,0 +1,159 @@
+"""
+AI提供商后台健康监测
+按带抖动的间隔用最便宜的调用（模型元数据/列表接口）探测各提供商，结果带时间戳缓存在进程内并发布到Redis。
+/health 接口直接读取缓存状态，图片路由器据此跳过探测失败的提供商，不再由存活探针触发真实生成调用。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEALTH_KEY = "provider:health"
+
+
+class ProviderHealthMonitor:
+    """提供商健康监测器"""
+
+    def __init__(self):
+        self.enabled = os.getenv("PROVIDER_HEALTH_MONITOR", "on") == "on"
+        self.interval = float(os.getenv("PROVIDER_HEALTH_INTERVAL", "60"))
+        self.timeout = float(os.getenv("PROVIDER_HEALTH_TIMEOUT", "10"))
+        # 超过该时长未更新的状态视为未知，不参与路由判断
+        self.stale_after = float(os.getenv("PROVIDER_HEALTH_STALE_AFTER", str(self.interval * 3)))
+
+        self.state: Dict[str, Dict[str, Any]] = {}
+        self._providers: Dict[str, Any] = {}
+
+    def _targets(self) -> List[Tuple[str, str]]:
+        """需要监测的 (类别, 提供商) 列表，与实际启用的提供商配置一致"""
+        targets = [("text", "gemini")]
+        primary = os.getenv("IMAGE_PROVIDER_TYPE", "gemini")
+        image_types = [primary]
+        if os.getenv("IMAGE_PROVIDER_ROUTER", "off") == "on":
+            candidates = [p.strip() for p in os.getenv("IMAGE_PROVIDER_CANDIDATES", "gemini,laozhang").split(",") if p.strip()]
+            image_types += [p for p in candidates if p != primary]
+        targets += [("image", name) for name in image_types]
+        return targets
+
+    def _get_provider(self, kind: str, name: str):
+        """提供商实例只创建一次，探测复用其客户端/会话"""
+        key = f"{kind}:{name}"
+        if key not in self._providers:
+            from .provider_factory import ProviderFactory
+
+            if kind == "text":
+                self._providers[key] = ProviderFactory.create_text_provider(name)
+            else:
+                self._providers[key] = ProviderFactory.create_image_provider(name)
+        return self._providers[key]
+
+    async def probe(self, kind: str, name: str) -> Dict[str, Any]:
+        key = f"{kind}:{name}"
+        previous = self.state.get(key, {})
+        started = time.monotonic()
+        error = None
+        try:
+            provider = self._get_provider(kind, name)
+            healthy = await asyncio.wait_for(provider.health_check(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            healthy, error = False, "timeout"
+        except Exception as e:
+            healthy, error = False, str(e)
+
+        entry = {
+            "healthy": bool(healthy),
+            "checked_at": time.time(),
+            "latency": round(time.monotonic() - started, 3),
+            "error": error,
+            "consecutive_failures": 0 if healthy else previous.get("consecutive_failures", 0) + 1
+        }
+        if previous.get("healthy") != entry["healthy"]:
+            icon = "✅" if healthy else "⚠️"
+            logger.info(f"{icon} 提供商健康状态变化: {key} -> {'healthy' if healthy else 'unhealthy'}")
+        self.state[key] = entry
+        return entry
+
+    async def probe_all(self) -> Dict[str, Dict[str, Any]]:
+        targets = self._targets()
+        await asyncio.gather(*(self.probe(kind, name) for kind, name in targets))
+        await self._publish()
+        return self.state
+
+    async def _publish(self):
+        """发布到Redis，供API进程的 /health 读取"""
+        try:
+            from ..utils.redis_client import get_async_redis_client
+
+            client = get_async_redis_client()
+            await client.hset(HEALTH_KEY, mapping={k: json.dumps(v) for k, v in self.state.items()})
+            await client.expire(HEALTH_KEY, int(self.stale_after) + 60)
+        except Exception as e:
+            logger.warning(f"⚠️ 发布提供商健康状态失败: {e}")
+
+    async def run_loop(self):
+        """后台探测循环（由worker启动）"""
+        if not self.enabled:
+            return
+        logger.info(f"🩺 提供商健康监测已启动: interval={self.interval}s")
+        # 启动时错开首次探测，避免多个实例同时请求上游
+        await asyncio.sleep(random.uniform(0, min(self.interval, 5)))
+        while True:
+            try:
+                await self.probe_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ 提供商健康探测失败: {e}")
+            await asyncio.sleep(self.interval * random.uniform(0.8, 1.2))
+
+    def is_healthy(self, kind: str, name: str) -> Optional[bool]:
+        """读取本进程的探测结果；从未探测或已过期返回None（未知）"""
+        entry = self.state.get(f"{kind}:{name}")
+        if not entry or time.time() - entry["checked_at"] > self.stale_after:
+            return None
+        return entry["healthy"]
+
+    async def get_status(self) -> Dict[str, Any]:
+        """汇总状态：优先使用本进程结果，否则读取worker发布到Redis的结果"""
+        state = dict(self.state)
+        if not state:
+            try:
+                from ..utils.redis_client import get_async_redis_client
+
+                raw = await get_async_redis_client().hgetall(HEALTH_KEY)
+                state = {
+                    (k.decode() if isinstance(k, bytes) else k): json.loads(v) for k, v in raw.items()
+                }
+            except Exception as e:
+                logger.warning(f"⚠️ 读取提供商健康状态失败: {e}")
+
+        now = time.time()
+        providers = {}
+        for key, entry in state.items():
+            providers[key] = dict(entry, age=round(now - entry["checked_at"], 1), stale=now - entry["checked_at"] > self.stale_after)
+
+        fresh = [p for p in providers.values() if not p["stale"]]
+        if not fresh:
+            status = "unknown"
+        elif all(p["healthy"] for p in fresh):
+            status = "healthy"
+        else:
+            status = "degraded"
+        return {"status": status, "providers": providers}
+
+
+_health_monitor: Optional[ProviderHealthMonitor] = None
+
+
+def get_provider_health_monitor() -> ProviderHealthMonitor:
+    """获取进程级健康监测器单例"""
+    global _health_monitor
+    if _health_monitor is None:
+        _health_monitor = ProviderHealthMonitor()
+    return _health_monitor
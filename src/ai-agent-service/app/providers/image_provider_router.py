@@ -0,0 +1,272 @@
+"""
+图片生成提供商路由器
+基于滚动延迟/错误统计在多个图片提供商之间选路，支持熔断与对冲请求
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from .base_provider import BaseImageProvider
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderStats:
+    """单个提供商的滚动统计与熔断状态"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window_size: int, failure_threshold: int, cooldown: float):
+        self.samples = deque(maxlen=window_size)  # (latency, success)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_in_flight = False
+
+    def record(self, latency: float, success: bool):
+        self.samples.append((latency, success))
+        if success:
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+        else:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+        self.half_open_in_flight = False
+
+    def allow_request(self) -> bool:
+        """熔断判定：打开状态冷却结束后放行一个探测请求"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self.half_open_in_flight:
+            return True
+        return False
+
+    def mark_dispatched(self):
+        if self.state == self.HALF_OPEN:
+            self.half_open_in_flight = True
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        latencies = sorted(lat for lat, ok in self.samples if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(pct * (len(latencies) - 1))))
+        return latencies[index]
+
+    def success_count(self) -> int:
+        return sum(1 for _, ok in self.samples if ok)
+
+    def score(self) -> float:
+        """综合得分，越低越健康；无样本时为0，保持配置顺序并允许探索"""
+        p50 = self.latency_percentile(0.5)
+        if p50 is None:
+            return 0.0 if not self.samples else float("inf")
+        return p50 * (1 + 4 * self.error_rate())
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "samples": len(self.samples),
+            "error_rate": round(self.error_rate(), 3),
+            "p50": self.latency_percentile(0.5),
+            "p95": self.latency_percentile(0.95),
+            "consecutive_failures": self.consecutive_failures
+        }
+
+
+class ImageProviderRouter(BaseImageProvider):
+    """多图片提供商路由：选择最健康的提供商，失败自动切换，可选p95对冲"""
+
+    def __init__(self, provider_types: Optional[List[str]] = None):
+        super().__init__()
+        from .provider_factory import ProviderFactory
+
+        if provider_types is None:
+            primary = os.getenv("IMAGE_PROVIDER_TYPE", "gemini")
+            candidates = [p.strip() for p in os.getenv("IMAGE_PROVIDER_CANDIDATES", "gemini,laozhang").split(",") if p.strip()]
+            provider_types = [primary] + [p for p in candidates if p != primary]
+
+        self.providers: Dict[str, BaseImageProvider] = {}
+        for provider_type in provider_types:
+            try:
+                self.providers[provider_type] = ProviderFactory.create_image_provider(provider_type)
+            except Exception as e:
+                self.logger.warning(f"⚠️ 图片提供商 {provider_type} 初始化失败，路由中跳过: {e}")
+
+        if not self.providers:
+            raise ValueError("图片路由器没有可用的提供商")
+
+        window_size = int(os.getenv("IMAGE_ROUTER_WINDOW", "50"))
+        failure_threshold = int(os.getenv("IMAGE_ROUTER_FAILURE_THRESHOLD", "3"))
+        cooldown = float(os.getenv("IMAGE_ROUTER_COOLDOWN", "60"))
+        self.stats: Dict[str, ProviderStats] = {
+            name: ProviderStats(window_size, failure_threshold, cooldown) for name in self.providers
+        }
+
+        self.attempt_timeout = float(os.getenv("IMAGE_ROUTER_ATTEMPT_TIMEOUT", "120"))
+        # 对冲请求：主提供商超过其p95延迟仍未返回时并发请求下一个提供商（会增加调用成本）
+        self.hedging_enabled = os.getenv("IMAGE_ROUTER_HEDGING", "off") == "on"
+        self.hedge_min_samples = int(os.getenv("IMAGE_ROUTER_HEDGE_MIN_SAMPLES", "5"))
+        self.hedge_min_delay = float(os.getenv("IMAGE_ROUTER_HEDGE_MIN_DELAY", "5"))
+
+        self.logger.info(f"✅ 图片提供商路由器初始化: {list(self.providers.keys())}, hedging={self.hedging_enabled}")
+
+    def _rank_providers(self) -> List[str]:
+        """按健康度排序可用提供商（熔断中的提供商被排除）"""
+        available = [name for name in self.providers if self.stats[name].allow_request()]
+        # 后台健康探测明确失败的提供商排到最后（全部失败时仍按原顺序尝试）
+        from .health_monitor import get_provider_health_monitor
+        monitor = get_provider_health_monitor()
+        return sorted(
+            available,
+            key=lambda name: (monitor.is_healthy("image", name) is False, self.stats[name].score())
+        )
+
+    def _hedge_delay(self, name: str) -> Optional[float]:
+        if not self.hedging_enabled:
+            return None
+        stats = self.stats[name]
+        if stats.success_count() < self.hedge_min_samples:
+            return None
+        p95 = stats.latency_percentile(0.95)
+        return max(p95, self.hedge_min_delay) if p95 is not None else None
+
+    async def _call(self, name: str, prompt: str, size: Optional[str], quality: Optional[str], **kwargs) -> Tuple[bool, Dict[str, Any]]:
+        """调用单个提供商并记录统计；返回 (是否真实成功, 结果)"""
+        provider = self.providers[name]
+        stats = self.stats[name]
+        stats.mark_dispatched()
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(
+                provider.generate_image(prompt, size=size, quality=quality, **kwargs),
+                timeout=self.attempt_timeout
+            )
+            # 提供商内部吞掉异常并返回占位图，以 fallback 标记判定失败
+            success = bool(result and result.get("image_url")) and not result.get("metadata", {}).get("fallback")
+        except asyncio.CancelledError:
+            # 对冲落败被取消，不计入统计
+            stats.half_open_in_flight = False
+            raise
+        except Exception as e:
+            self.logger.warning(f"⚠️ 图片提供商 {name} 调用异常: {e}")
+            result, success = None, False
+
+        stats.record(time.monotonic() - started, success)
+        if not success:
+            self.logger.warning(f"⚠️ 图片提供商 {name} 未返回真实图片，熔断状态: {stats.state}")
+        return success, result
+
+    async def generate_image(
+        self,
+        prompt: str,
+        size: Optional[str] = None,
+        quality: Optional[str] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """按健康度路由生成图片，失败依次切换，必要时对冲"""
+        candidates = self._rank_providers()
+        if not candidates:
+            self.logger.warning("⚠️ 所有图片提供商均处于熔断状态，直接返回占位图")
+            return self._placeholder_result(prompt, size, quality, "all_providers_circuit_open")
+
+        pending = set()
+        launched = 0
+        last_result = None
+
+        def launch():
+            nonlocal launched
+            name = candidates[launched]
+            launched += 1
+            task = asyncio.create_task(self._call(name, prompt, size, quality, **kwargs))
+            task.provider_name = name
+            pending.add(task)
+            self.logger.info(f"📡 图片请求路由到: {name}")
+
+        launch()
+        try:
+            while pending:
+                timeout = self._hedge_delay(candidates[launched - 1]) if launched < len(candidates) else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    self.logger.info(f"⏱️ 超过p95延迟 {timeout:.1f}s，发起对冲请求")
+                    launch()
+                    continue
+
+                for task in done:
+                    pending.discard(task)
+                    success, result = task.result()
+                    if success:
+                        result.setdefault("metadata", {})["routed_provider"] = task.provider_name
+                        return result
+                    last_result = result or last_result
+
+                # 当前没有在途请求时切换到下一个提供商
+                if not pending and launched < len(candidates):
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        return last_result or self._placeholder_result(prompt, size, quality, "all_providers_failed")
+
+    def _placeholder_result(self, prompt: str, size: Optional[str], quality: Optional[str], reason: str) -> Dict[str, Any]:
+        provider = next(iter(self.providers.values()))
+        placeholder = provider._placeholder_url() if hasattr(provider, "_placeholder_url") else ""
+        return {
+            "image_url": placeholder,
+            "metadata": {
+                "prompt": prompt,
+                "size": size,
+                "quality": quality,
+                "provider": "router",
+                "fallback": True,
+                "reason": reason
+            }
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        from .health_monitor import get_provider_health_monitor
+        monitor = get_provider_health_monitor()
+        return {
+            name: dict(stats.snapshot(), probe_healthy=monitor.is_healthy("image", name))
+            for name, stats in self.stats.items()
+        }
+
+    async def health_check(self) -> bool:
+        """读取熔断状态与后台探测结果，不发起上游请求"""
+        from .health_monitor import get_provider_health_monitor
+        monitor = get_provider_health_monitor()
+        return any(
+            stats.state != ProviderStats.OPEN and monitor.is_healthy("image", name) is not False
+            for name, stats in self.stats.items()
+        )
+
+
+_image_router: Optional[ImageProviderRouter] = None
+
+
+def get_image_provider_router() -> ImageProviderRouter:
+    """获取进程级路由器单例（统计需跨任务累积）"""
+    global _image_router
+    if _image_router is None:
+        _image_router = ImageProviderRouter()
+    return _image_router
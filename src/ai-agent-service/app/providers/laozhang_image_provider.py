@@ -1,19 +1,19 @@
 import aiohttp
 import asyncio
 import base64
-import json
 import os
-import re
-import uuid
-from typing import Dict, Any, Optional
-from PIL import Image
-from io import BytesIO
+from typing import Dict, Any, Optional, Tuple
 from .base_provider import BaseImageProvider
+from ..utils.rate_limiter import get_rate_limiter
+from ..storage import get_content_store
 
 
 class LaoZhangImageProvider(BaseImageProvider):
     """老张AI图片生成服务提供商"""
     
+    # 进程级共享会话：复用连接池与TLS连接（provider实例每个任务都会重建）
+    _session: Optional[aiohttp.ClientSession] = None
+    
     def __init__(self):
         super().__init__()
         
@@ -32,6 +32,25 @@ class LaoZhangImageProvider(BaseImageProvider):
         
         self.logger.info(f"✅ 老张AI图片提供商初始化成功: {self.model_name}")
     
+    @classmethod
+    def _get_session(cls) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话（惰性创建，关闭后自动重建）"""
+        if cls._session is None or cls._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=int(os.getenv("LAO_ZHANG_HTTP_POOL_SIZE", "20")),
+                keepalive_timeout=float(os.getenv("LAO_ZHANG_HTTP_KEEPALIVE", "60")),
+                ttl_dns_cache=300
+            )
+            cls._session = aiohttp.ClientSession(connector=connector)
+        return cls._session
+    
+    @classmethod
+    async def close_session(cls):
+        """关闭共享会话（优雅退出时调用）"""
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
+    
     async def generate_image(
         self,
         prompt: str,
@@ -86,7 +105,9 @@ class LaoZhangImageProvider(BaseImageProvider):
             
             self.logger.info("📡 发送API请求到老张AI...")
             
-            async with aiohttp.ClientSession() as session:
+            # 经客户端限流后再发出请求
+            async with get_rate_limiter("laozhang_image").acquire():
+                session = self._get_session()
                 async with session.post(
                     self.api_url,
                     headers=headers,
@@ -104,44 +125,32 @@ class LaoZhangImageProvider(BaseImageProvider):
                             error_msg += f", 响应内容: {error_text[:500]}"
                         raise Exception(error_msg)
                     
-                    self.logger.info("✅ API请求成功，正在解析响应...")
-                    
-                    # 解析JSON响应
-                    result = await response.json()
-                    self.logger.info("✅ 成功解析JSON响应")
-                    
-                    # 提取消息内容
-                    full_content = ""
-                    if "choices" in result and len(result["choices"]) > 0:
-                        choice = result["choices"][0]
-                        if "message" in choice and "content" in choice["message"]:
-                            full_content = choice["message"]["content"]
-                    
-                    if not full_content:
-                        raise Exception("未找到消息内容")
-                    
-                    self.logger.info(f"📝 获取到消息内容，长度: {len(full_content)} 字符")
-                    self.logger.info("🔍 正在解析图片数据...")
-                    
-                    # 提取并保存图片
-                    image_url = await self._extract_and_save_image(full_content)
-                    
-                    if image_url:
-                        result = {
-                            "image_url": image_url,
-                            "metadata": {
-                                "prompt": prompt,
-                                "size": size,
-                                "quality": quality,
-                                "model": self.model_name,
-                                "provider": "laozhang",
-                                "real_generation": True
-                            }
-                        }
-                        self.logger.info("✅ 老张AI真实图片生成成功")
-                        return result
-                    else:
-                        raise Exception("图片保存失败")
+                    # 读取原始字节，不做整体JSON解码（响应内嵌数MB的base64图片）
+                    raw = await response.read()
+            
+            self.logger.info(f"✅ API请求成功，响应大小: {len(raw)} 字节，正在解析图片数据...")
+            
+            # 提取并保存图片
+            saved = await self._extract_and_save_image(raw)
+            
+            if saved:
+                image_url, storage_key = saved
+                result = {
+                    "image_url": image_url,
+                    "metadata": {
+                        "prompt": prompt,
+                        "size": size,
+                        "quality": quality,
+                        "model": self.model_name,
+                        "provider": "laozhang",
+                        "real_generation": True,
+                        "storage_key": storage_key
+                    }
+                }
+                self.logger.info("✅ 老张AI真实图片生成成功")
+                return result
+            else:
+                raise Exception("图片保存失败")
                         
         except Exception as e:
             self.logger.error(f"❌ 老张AI图片生成失败: {e}")
@@ -159,58 +168,88 @@ class LaoZhangImageProvider(BaseImageProvider):
                 }
             }
     
-    async def _extract_and_save_image(self, content: str) -> Optional[str]:
-        """高效提取并保存base64图片数据"""
+    @staticmethod
+    def _locate_data_uri(raw: bytes) -> Optional[Tuple[str, int, int]]:
+        """在原始响应字节中定位 data:image/...;base64, 数据段
+
+        仅使用 bytes.find（memchr级别），不对整段内容跑正则。
+        返回 (图片格式, base64起始偏移, base64结束偏移)。
+        """
+        prefix = b"data:image/"
+        marker = raw.find(prefix)
+        if marker == -1:
+            # 部分JSON序列化器会把 "/" 转义为 "\\/"
+            prefix = b"data:image\\/"
+            marker = raw.find(prefix)
+            if marker == -1:
+                return None
+        
+        separator = raw.find(b";base64,", marker, marker + 64)
+        if separator == -1:
+            return None
+        
+        image_format = raw[marker + len(prefix):separator].decode("ascii", "ignore")
+        start = separator + len(b";base64,")
+        
+        return image_format, start, LaoZhangImageProvider._base64_end(raw, start, len(raw))
+    
+    @staticmethod
+    def _base64_end(data: bytes, start: int, end: int) -> int:
+        """base64数据段在JSON字符串引号、markdown括号、转义符或空白处结束"""
+        for terminator in (b'"', b")", b"\\", b" ", b"\n", b"\r", b"\t"):
+            position = data.find(terminator, start, end)
+            if position != -1:
+                end = position
+        return end
+    
+    async def _extract_and_save_image(self, raw: bytes) -> Optional[Tuple[str, str]]:
+        """定位base64图片数据，在线程中解码并直接落盘（不经过PIL重新编码），返回 (URL, 存储键)"""
         try:
-            self.logger.info(f"📄 内容预览（前200字符）: {content[:200]}")
-            
-            # 使用精确的正则表达式提取base64图片数据
-            base64_pattern = r'data:image/([^;]+);base64,([A-Za-z0-9+/=]+)'
-            match = re.search(base64_pattern, content)
-            
-            if not match:
-                self.logger.warning('⚠️ 未找到base64图片数据')
+            located = self._locate_data_uri(raw)
+            if not located:
+                self.logger.warning(f'⚠️ 未找到base64图片数据，响应预览: {raw[:200]!r}')
                 return None
             
-            image_format = match.group(1)  # png, jpg, etc.
-            b64_data = match.group(2)
+            image_format, start, end = located
+            
+            # 服务端将 "/" 转义为 "\/" 时，先对所在JSON字符串去转义，再同样截到第一个非base64字符
+            # （markdown包裹时字符串内数据段后还有 ")" 与说明文字）
+            if raw[end:end + 2] == b"\\/":
+                closing = raw.find(b'"', start)
+                segment = raw[start:closing if closing != -1 else len(raw)].replace(b"\\/", b"/")
+                b64_data = segment[:self._base64_end(segment, 0, len(segment))]
+            else:
+                b64_data = memoryview(raw)[start:end]
             
             self.logger.info(f'🎨 图像格式: {image_format}')
             self.logger.info(f'📏 Base64数据长度: {len(b64_data)} 字符')
             
-            # 解码图片数据
-            image_data = base64.b64decode(b64_data)
+            loop = asyncio.get_event_loop()
+            image_data = await loop.run_in_executor(None, self._decode, b64_data)
             
-            if len(image_data) < 100:
+            if image_data is None:
                 self.logger.error("解码后的图片数据太小，可能无效")
                 return None
             
-            # 保存图片
-            image = Image.open(BytesIO(image_data))
-            
-            # 生成唯一文件名
-            image_id = str(uuid.uuid4())[:8]
-            image_filename = f"laozhang_generated_{image_id}.{image_format}"
-            
-            # 保存到静态文件目录，供HTTP访问
-            static_dir = "/app/app/static/generated"
-            os.makedirs(static_dir, exist_ok=True)
-            image_path = f"{static_dir}/{image_filename}"
-            image.save(image_path)
-            
-            # 构建可通过HTTP访问的URL
-            base_url = os.getenv("AI_AGENT_PUBLIC_URL", "http://ai-agent-service:8000")
-            image_url = f"{base_url}/static/generated/{image_filename}"
-            
-            self.logger.info(f'🖼️ 图片保存成功: {image_path}')
-            self.logger.info(f'📊 文件大小: {len(image_data)} 字节')
+            # 按内容哈希写入存储，供HTTP访问
+            stored = await get_content_store().put_bytes(image_data, image_format)
+            self.logger.info(f'🖼️ 图片保存成功: {stored["key"]}')
+            self.logger.info(f'📊 文件大小: {stored["size"]} 字节')
             
-            return image_url
+            return stored["url"], stored["key"]
                 
         except Exception as e:
             self.logger.error(f"处理图片时发生错误: {str(e)}")
             return None
     
+    @staticmethod
+    def _decode(b64_data) -> Optional[bytes]:
+        """解码base64图片数据（在线程池中执行）"""
+        image_data = base64.b64decode(b64_data)
+        if len(image_data) < 100:
+            return None
+        return image_data
+    
     async def health_check(self) -> bool:
         """健康检查"""
         try:
@@ -222,13 +261,13 @@ class LaoZhangImageProvider(BaseImageProvider):
             }
             
             # 简单的连接测试
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    self.api_url.replace('/chat/completions', '/models'),
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    return response.status in [200, 404]  # 404也算正常，说明连接通了
+            session = self._get_session()
+            async with session.get(
+                self.api_url.replace('/chat/completions', '/models'),
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                return response.status in [200, 404]  # 404也算正常，说明连接通了
         except Exception as e:
             self.logger.error(f"健康检查失败: {e}")
             return False
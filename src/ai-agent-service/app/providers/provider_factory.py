@@ -1,8 +1,11 @@
-from typing import Dict, Type, Any
+import os
+from typing import Dict, Type, Any, Optional
 from .base_provider import BaseTextProvider, BaseImageProvider, BaseCodeProvider
 from .gemini_text_provider import GeminiTextProvider
 from .gemini_image_provider import GeminiImageProvider
 from .laozhang_image_provider import LaoZhangImageProvider
+from .fake_provider import FakeTextProvider, FakeImageProvider
+from .response_cache import CachedTextProvider
 from ..coding_service.providers.claude_provider import ClaudeCodeProvider
 
 class ProviderFactory:
@@ -10,12 +13,14 @@ class ProviderFactory:
     
     _text_providers: Dict[str, Type[BaseTextProvider]] = {
         "gemini": GeminiTextProvider,
+        "fake": FakeTextProvider,
         # "claude": ClaudeTextProvider,  # 如需要文本生成
     }
     
     _image_providers: Dict[str, Type[BaseImageProvider]] = {
         "gemini": GeminiImageProvider,
         "laozhang": LaoZhangImageProvider,
+        "fake": FakeImageProvider,
         # "dalle": DalleProvider,  # 未来扩展
     }
     
@@ -23,20 +28,41 @@ class ProviderFactory:
         "claude": ClaudeCodeProvider,
     }
     
+    @staticmethod
+    def _resolve(provider_type: str) -> str:
+        """AI_PROVIDER_MODE=fake 时所有文本/图片提供商替换为进程内假提供商（压测/离线联调）"""
+        if os.getenv("AI_PROVIDER_MODE", "live") == "fake":
+            return "fake"
+        return provider_type
+    
     @classmethod
-    def create_text_provider(cls, provider_type: str = "gemini") -> BaseTextProvider:
-        """创建文本生成提供商"""
+    def create_text_provider(cls, provider_type: str = "gemini", cache_step: Optional[str] = None) -> BaseTextProvider:
+        """创建文本生成提供商
+
+        cache_step: 指定步骤名时包装LLM响应缓存（是否生效由 LLM_RESPONSE_CACHE_STEPS 控制）
+        """
+        provider_type = cls._resolve(provider_type)
         if provider_type not in cls._text_providers:
             raise ValueError(f"不支持的文本提供商: {provider_type}")
-        return cls._text_providers[provider_type]()
+        provider = cls._text_providers[provider_type]()
+        if cache_step:
+            return CachedTextProvider(provider, cache_step)
+        return provider
     
     @classmethod
     def create_image_provider(cls, provider_type: str = "gemini") -> BaseImageProvider:
         """创建图片生成提供商"""
+        provider_type = cls._resolve(provider_type)
         if provider_type not in cls._image_providers:
             raise ValueError(f"不支持的图片提供商: {provider_type}")
         return cls._image_providers[provider_type]()
     
+    @classmethod
+    def create_image_router(cls) -> BaseImageProvider:
+        """获取图片提供商路由器（进程级单例，跨任务累积健康统计）"""
+        from .image_provider_router import get_image_provider_router
+        return get_image_provider_router()
+    
     @classmethod
     def create_code_provider(cls, provider_type: str = "claude") -> BaseCodeProvider:
         """创建代码生成提供商"""
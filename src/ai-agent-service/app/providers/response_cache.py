@@ -0,0 +1,192 @@
+"""
+LLM响应缓存
+以 (模型, 步骤, 规范化输入) 的哈希为键，进程内LRU + Redis两级缓存文本生成结果
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .base_provider import BaseTextProvider
+
+logger = logging.getLogger(__name__)
+
+
+def canonicalize(value: Any) -> Any:
+    """规范化缓存输入：字符串统一全半角、大小写与空白，浮点数保留3位小数"""
+    if isinstance(value, str):
+        text = unicodedata.normalize("NFKC", value).strip().lower()
+        return " ".join(text.split())
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, float):
+        return round(value, 3)
+    if isinstance(value, dict):
+        return {str(k): canonicalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(v) for v in value]
+    return value
+
+
+class LLMResponseCache:
+    """两级响应缓存：进程内LRU（带TTL） + Redis"""
+
+    def __init__(self):
+        self.ttl = int(os.getenv("LLM_RESPONSE_CACHE_TTL", "86400"))
+        self.max_entries = int(os.getenv("LLM_RESPONSE_CACHE_MAX_ENTRIES", "512"))
+        self.redis_enabled = os.getenv("LLM_RESPONSE_CACHE_REDIS", "on") == "on"
+        self.key_prefix = "llm:resp"
+
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, model: str, step: str, inputs: Dict[str, Any], prefix: Optional[str] = None) -> str:
+        """生成缓存键；静态前缀参与哈希，模板变更后旧缓存自然失效"""
+        payload = {
+            "model": model,
+            "step": step,
+            "inputs": canonicalize(inputs),
+            "prefix": hashlib.sha256(prefix.encode("utf-8")).hexdigest() if prefix else None
+        }
+        digest = hashlib.sha256(
+            json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        return f"{self.key_prefix}:{step}:{digest}"
+
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        entry = self._local.get(key)
+        if entry:
+            expires_at, value = entry
+            if now < expires_at:
+                self._local.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._local[key]
+
+        if self.redis_enabled:
+            try:
+                from ..utils.redis_client import get_async_redis_client
+
+                raw = await get_async_redis_client().get(key)
+                if raw is not None:
+                    value = raw.decode("utf-8")
+                    self._set_local(key, value)
+                    self.hits += 1
+                    return value
+            except Exception as e:
+                logger.warning(f"⚠️ 读取Redis响应缓存失败: {e}")
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        self._set_local(key, value)
+        if self.redis_enabled:
+            try:
+                from ..utils.redis_client import get_async_redis_client
+
+                await get_async_redis_client().set(key, value.encode("utf-8"), ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"⚠️ 写入Redis响应缓存失败: {e}")
+
+    async def delete(self, key: str):
+        self._local.pop(key, None)
+        if self.redis_enabled:
+            try:
+                from ..utils.redis_client import get_async_redis_client
+
+                await get_async_redis_client().delete(key)
+            except Exception as e:
+                logger.warning(f"⚠️ 删除Redis响应缓存失败: {e}")
+
+    def _set_local(self, key: str, value: str):
+        self._local[key] = (time.time() + self.ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._local),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+_response_cache: Optional[LLMResponseCache] = None
+
+
+def get_response_cache() -> LLMResponseCache:
+    """获取进程级响应缓存单例"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = LLMResponseCache()
+    return _response_cache
+
+
+class CachedTextProvider(BaseTextProvider):
+    """带响应缓存的文本提供商包装器
+
+    仅当调用方传入 cache_inputs（该步骤prompt所依赖的全部输入）且步骤已在
+    LLM_RESPONSE_CACHE_STEPS 中开启时才走缓存，其余情况直接透传。
+    """
+
+    def __init__(self, provider: BaseTextProvider, step: str):
+        super().__init__()
+        self.provider = provider
+        self.step = step
+
+        enabled_steps = [s.strip() for s in os.getenv("LLM_RESPONSE_CACHE_STEPS", "analysis").split(",") if s.strip()]
+        self.enabled = os.getenv("LLM_RESPONSE_CACHE", "off") == "on" and step in enabled_steps
+        self.cache = get_response_cache()
+
+        if self.enabled:
+            self.logger.info(f"🗃️ 已为步骤 {step} 启用LLM响应缓存")
+
+    def __getattr__(self, name):
+        # 透传 model_name 等底层提供商属性
+        if name == "provider":
+            raise AttributeError(name)
+        return getattr(self.provider, name)
+
+    def _cache_key(self, cache_inputs: Dict[str, Any], cached_prefix: Optional[str]) -> str:
+        model = getattr(self.provider, "model_name", self.provider.__class__.__name__)
+        return self.cache.make_key(model, self.step, cache_inputs, cached_prefix)
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        **kwargs
+    ) -> str:
+        cache_inputs = kwargs.pop("cache_inputs", None)
+        if not self.enabled or cache_inputs is None:
+            return await self.provider.generate_text(prompt, max_tokens=max_tokens, temperature=temperature, **kwargs)
+
+        key = self._cache_key(cache_inputs, kwargs.get("cached_prefix"))
+        cached = await self.cache.get(key)
+        if cached is not None:
+            self.logger.info(f"⚡ LLM响应缓存命中: {self.step}")
+            return cached
+
+        response = await self.provider.generate_text(prompt, max_tokens=max_tokens, temperature=temperature, **kwargs)
+        await self.cache.set(key, response)
+        return response
+
+    async def invalidate(self, cache_inputs: Dict[str, Any], cached_prefix: Optional[str] = None):
+        """移除某次输入对应的缓存（调用方发现缓存结果无法解析/校验时使用）"""
+        if self.enabled:
+            await self.cache.delete(self._cache_key(cache_inputs, cached_prefix))
+
+    async def health_check(self) -> bool:
+        return await self.provider.health_check()
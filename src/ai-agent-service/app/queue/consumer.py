@@ -1,4 +1,5 @@
 import asyncio
+import hashlib
 import redis.asyncio as redis
 from redis.exceptions import ResponseError
 import logging
@@ -126,8 +127,11 @@ class TaskConsumer:
             task = PostcardGenerationTask(**task_data)
             self.logger.info(f"📋 任务详情: {task.task_id} - {task.user_input[:50]}...")
             
+            task_dict = task.dict()
+            await self._reference_emotion_image(task_dict)
+            
             # 执行工作流
-            await self.workflow.execute(task.dict())
+            await self.workflow.execute(task_dict)
             
             # 确认消息处理完成
             await self.redis_client.xack(self.stream_name, self.consumer_group, msg_id)
@@ -144,6 +148,53 @@ class TaskConsumer:
                 pass
             # 这里可以实现重试逻辑或死信队列
     
+    async def _reference_emotion_image(self, task_dict: Dict[str, Any]):
+        """登记任务对情绪图片的存储引用（避免被GC回收），不读取图片内容
+
+        旧版客户端内联的 emotion_image_base64 与上传接口一样规范化后写入存储，
+        改为以 emotion_image_ref 传递，任务数据中不保留base64副本。
+        """
+        image_ref = task_dict.get("emotion_image_ref")
+        image_base64 = task_dict.pop("emotion_image_base64", None)
+        if not image_ref and not image_base64:
+            return
+        
+        from ..storage import get_content_store
+        
+        store = get_content_store()
+        if not image_ref:
+            image_ref = await self._store_inline_emotion_image(store, task_dict, image_base64)
+            if not image_ref:
+                return
+        key = store.key_from_blob_ref(image_ref)
+        if key:
+            # 先记录引用再确认存在：明信片引用该图片，避免被存储GC回收
+            await store.add_references(task_dict["task_id"], [key])
+            if await store.exists(key):
+                return
+            await store.remove_references(task_dict["task_id"], [key])
+        # 情绪图片为可选输入：引用无效或已过期时继续生成
+        self.logger.warning(f"⚠️ 情绪图片引用无效或已过期，已忽略: {task_dict.get('task_id')} - {image_ref}")
+    
+    async def _store_inline_emotion_image(self, store, task_dict: Dict[str, Any], image_base64: str):
+        """规范化并保存内联情绪图片，返回其存储引用；图片无效时返回None"""
+        from ..services.image_normalizer import InvalidImage, get_image_normalizer
+        
+        normalizer = get_image_normalizer()
+        try:
+            raw = normalizer.decode_base64(image_base64)
+            raw_hash = await asyncio.get_event_loop().run_in_executor(None, lambda: hashlib.sha256(raw).hexdigest())
+            stored = await normalizer.normalize_and_store(store, raw_hash, raw)
+        except (InvalidImage, asyncio.TimeoutError) as e:
+            # 情绪图片为可选输入：无法解码时继续生成
+            self.logger.warning(f"⚠️ 内联情绪图片无法规范化，已忽略: {task_dict.get('task_id')} - {e}")
+            return None
+        
+        image_ref = store.blob_ref(stored["key"])
+        task_dict["emotion_image_ref"] = image_ref
+        self.logger.info(f"🖼️ 内联情绪图片已转存: {task_dict.get('task_id')} -> {image_ref}")
+        return image_ref
+    
     async def stop_consuming(self):
         """停止消费"""
         self.running = False
@@ -21,4 +21,6 @@ class PostcardGenerationTask(BaseModel):
     created_at: str
     # 🆕 版本3.0新增：直接包含base64编码的情绪图片数据
     emotion_image_base64: Optional[str] = None
+    # 情绪图片的不透明存储引用（二进制上传接口返回），worker据此从存储读取图片字节
+    emotion_image_ref: Optional[str] = None
     metadata: Dict[str, Any] = Field(default_factory=dict)
\ No newline at end of file
@@ -0,0 +1,521 @@
+"""
+模板卡片合成服务（Pillow原生渲染）
+固定版式的卡片（签体挂件、默认明信片）直接用Pillow合成：背景图、签体PNG（resources/签体）与文字块（resources/font），
+不经过HTML与无头浏览器；Puppeteer只用于真正自定义的HTML。
+
+- 解码后的签体图片按目标尺寸缓存，签体光晕按（签体、颜色、尺寸）缓存，ImageFont按（字体、字号）缓存
+- 文字支持自动换行与中文避头尾（标点不出现在行首、开括号不出现在行尾）、竖排签名、阴影与模糊
+- CPU部分在线程池执行（Pillow绘制与滤镜释放GIL），不阻塞事件循环，同时与缓存共享进程内存
+"""
+
+import asyncio
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from PIL import Image, ImageColor, ImageDraw, ImageFilter, ImageFont
+
+logger = logging.getLogger(__name__)
+
+LAYOUTS = ("charm", "postcard")
+
+# 签体配置中的坐标均基于 1024x1024 画布
+CHARM_CANVAS = 1024
+
+FONT_FILES = {
+    "ma-shan-zheng": "ma-shan-zheng-6500.woff",
+    "zhi-mang-xing": "zhi-mang-xing-6500.woff",
+    "long-cang": "long-cang-6500.woff",
+}
+DEFAULT_FONT = "ma-shan-zheng"
+
+# 避头尾：不能出现在行首 / 行尾的字符
+NO_LINE_START = set("，。、；：？！）》」』】〕〉”’…—～·,.;:?!)]}%")
+NO_LINE_END = set("（《「『【〔〈“‘([{")
+
+# 连续的拉丁字母/数字作为一个整体换行，其余字符逐字断行
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_\-'@#$%&+.]+|\s|.", re.S)
+
+# 光晕形状：多边形按边数绘制，矩形类用圆角矩形，其余（云、叶、葫芦等）模糊后近似为椭圆
+POLYGON_SIDES = {"octagon": 8, "hexagon": 6, "diamond": 4}
+RECT_SHAPES = {"rectangle", "rounded-square"}
+
+
+def parse_color(value: Optional[str], default: str, alpha: int = 255) -> Tuple[int, int, int, int]:
+    """解析#hex/颜色名，无效时使用默认值"""
+    try:
+        rgb = ImageColor.getrgb(value or default)
+    except ValueError:
+        rgb = ImageColor.getrgb(default)
+    return rgb[:3] + (alpha,)
+
+
+@lru_cache(maxsize=8192)
+def _token_width(font: ImageFont.FreeTypeFont, token: str) -> float:
+    """单个字符/单词的排版宽度（逐词累加，忽略跨词字距调整）"""
+    return font.getlength(token)
+
+
+def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: float, max_lines: int = 0) -> List[str]:
+    """按像素宽度换行：中文逐字断行、拉丁单词整体断行并遵守避头尾；超过max_lines时末行以省略号结尾"""
+    lines: List[str] = []
+    for paragraph in (text or "").split("\n"):
+        line: List[str] = []
+        width = 0.0
+        for token in TOKEN_PATTERN.findall(paragraph):
+            if not line and token.isspace():
+                continue
+            token_width = _token_width(font, token)
+            if not line or width + token_width <= max_width:
+                line.append(token)
+                width += token_width
+                continue
+            if token in NO_LINE_START:
+                # 行首禁用标点：带上前一个字一起换行（前一个字同样是标点时直接悬挂在行尾）
+                if len(line) > 1 and line[-1] not in NO_LINE_START:
+                    carry = line.pop()
+                    lines.append("".join(line))
+                    line = [carry, token]
+                    width = _token_width(font, carry) + token_width
+                else:
+                    line.append(token)
+                    width += token_width
+                continue
+            carry = []
+            while len(line) > 1 and line[-1] in NO_LINE_END:
+                carry.insert(0, line.pop())
+            lines.append("".join(line).rstrip())
+            line = carry + ([] if token.isspace() else [token])
+            width = sum(_token_width(font, t) for t in line)
+        lines.append("".join(line).rstrip())
+
+    if max_lines and len(lines) > max_lines:
+        lines = lines[:max_lines]
+        last = lines[-1]
+        while last and font.getlength(last + "…") > max_width:
+            last = last[:-1]
+        lines[-1] = last + "…"
+    return lines
+
+
+class CardCompositor:
+    """模板卡片合成器"""
+
+    def __init__(self):
+        self.threads = int(os.getenv("CARD_COMPOSITOR_THREADS", "4"))
+        self.font_dir = os.getenv("CARD_FONT_DIR") or ""
+        self.default_font = os.getenv("CARD_DEFAULT_FONT", DEFAULT_FONT)
+        self.image_cache_size = int(os.getenv("CARD_IMAGE_CACHE_SIZE", "64"))
+        # 背景图除内容存储中的对象与本服务公网前缀下的URL外，只从这些主机下载（逗号分隔）
+        self.background_hosts = {
+            host.strip().lower() for host in os.getenv("CARD_BACKGROUND_HOSTS", "").split(",") if host.strip()
+        }
+
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._images: "OrderedDict[Any, Image.Image]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ---------- 资源与缓存 ----------
+
+    def _resources_dir(self) -> str:
+        from .charm_catalog import get_charm_catalog
+
+        source = get_charm_catalog().get().source
+        if source and os.path.isfile(source):
+            return os.path.dirname(os.path.dirname(source))
+        return "/app/resources"
+
+    def _font_path(self, name: str) -> str:
+        filename = FONT_FILES.get(name, FONT_FILES[DEFAULT_FONT])
+        return os.path.join(self.font_dir or os.path.join(self._resources_dir(), "font"), filename)
+
+    def font(self, size: int, name: Optional[str] = None) -> ImageFont.FreeTypeFont:
+        return self._load_font(self._font_path(name or self.default_font), max(1, int(round(size))))
+
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _load_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError as e:
+            logger.warning(f"⚠️ 字体加载失败: {path} - {e}，使用默认字体")
+            return ImageFont.load_default(size)
+
+    def _cached(self, key: Any, build) -> Image.Image:
+        """解码/缩放结果的LRU缓存（多线程共享，返回值只读）"""
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                return image
+        image = build()
+        with self._lock:
+            self._images[key] = image
+            while len(self._images) > self.image_cache_size:
+                self._images.popitem(last=False)
+        return image
+
+    def charm_image(self, charm: Dict[str, Any], size: int) -> Optional[Image.Image]:
+        """签体PNG按边长缩放后的RGBA图"""
+        path = os.path.join(self._resources_dir(), "签体", charm.get("image") or "")
+        if not os.path.isfile(path):
+            return None
+
+        def build():
+            with Image.open(path) as source:
+                image = source.convert("RGBA")
+            if image.size != (size, size):
+                image = image.resize((size, size), Image.LANCZOS)
+            return image
+
+        return self._cached(("charm", path, os.path.getmtime(path), size), build)
+
+    def charm_glow(self, charm: Dict[str, Any], color: Tuple[int, int, int, int], size: int) -> Image.Image:
+        """按签体光晕配置绘制模糊光晕（坐标基于1024画布，按size缩放）"""
+        glow = charm.get("glow") or {}
+        scale = size / CHARM_CANVAS
+        shape = glow.get("shape", "circle")
+        radius = glow.get("radius") or [360, 360]
+        opacity = float(glow.get("opacity", 0.35))
+
+        def build():
+            layer = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+            draw = ImageDraw.Draw(layer)
+            cx = cy = size / 2
+            rx, ry = radius[0] * scale, radius[-1] * scale
+            fill = color[:3] + (int(255 * opacity),)
+            if shape in POLYGON_SIDES:
+                draw.regular_polygon((cx, cy, min(rx, ry)), POLYGON_SIDES[shape], rotation=0, fill=fill)
+            elif shape in RECT_SHAPES:
+                draw.rounded_rectangle((cx - rx, cy - ry, cx + rx, cy + ry), radius=min(rx, ry) * 0.25, fill=fill)
+            else:
+                draw.ellipse((cx - rx, cy - ry, cx + rx, cy + ry), fill=fill)
+            return layer.filter(ImageFilter.GaussianBlur(max(1, 48 * scale)))
+
+        return self._cached(("glow", charm.get("id"), shape, tuple(radius), opacity, color, size), build)
+
+    def background_image(self, data: bytes, cache_key: str, size: Tuple[int, int], blur: float = 0) -> Image.Image:
+        """背景图按cover方式裁剪缩放到目标尺寸（可选高斯模糊）"""
+        def build():
+            with Image.open(BytesIO(data)) as source:
+                image = source.convert("RGB")
+            src_w, src_h = image.size
+            ratio = max(size[0] / src_w, size[1] / src_h)
+            resized = image.resize((max(size[0], round(src_w * ratio)), max(size[1], round(src_h * ratio))), Image.LANCZOS)
+            left = (resized.width - size[0]) // 2
+            top = (resized.height - size[1]) // 2
+            cropped = resized.crop((left, top, left + size[0], top + size[1]))
+            if blur > 0:
+                cropped = cropped.filter(ImageFilter.GaussianBlur(blur))
+            return cropped.convert("RGBA")
+
+        return self._cached(("background", cache_key, size, blur), build)
+
+    # ---------- 绘制工具 ----------
+
+    @staticmethod
+    def draw_text(
+        canvas: Image.Image,
+        xy: Tuple[float, float],
+        text: str,
+        font: ImageFont.FreeTypeFont,
+        fill: Tuple[int, int, int, int],
+        anchor: str = "mm",
+        shadow: Optional[Dict[str, Any]] = None,
+        blur: float = 0
+    ):
+        """绘制单行文字；shadow={"offset": (dx, dy), "blur": r, "color": "#000", "opacity": 0.3}，blur为文字本身的模糊半径"""
+        if not text:
+            return
+        left, top, right, bottom = font.getbbox(text, anchor=anchor)
+        margin = int(max(blur, (shadow or {}).get("blur", 0)) * 3) + 4
+        if shadow:
+            dx, dy = shadow.get("offset", (0, 2))
+            margin += int(max(abs(dx), abs(dy)))
+        box = (int(xy[0] + left) - margin, int(xy[1] + top) - margin, int(xy[0] + right) + margin, int(xy[1] + bottom) + margin)
+        origin = (xy[0] - box[0], xy[1] - box[1])
+        size = (box[2] - box[0], box[3] - box[1])
+
+        # 只在文字包围盒内做模糊，避免整图滤镜
+        if shadow:
+            layer = Image.new("RGBA", size, (0, 0, 0, 0))
+            alpha = int(255 * float(shadow.get("opacity", 0.35)))
+            ImageDraw.Draw(layer).text(
+                (origin[0] + dx, origin[1] + dy), text, font=font, anchor=anchor,
+                fill=parse_color(shadow.get("color"), "#000000", alpha)
+            )
+            if shadow.get("blur"):
+                layer = layer.filter(ImageFilter.GaussianBlur(shadow["blur"]))
+            canvas.alpha_composite(layer, (box[0], box[1]))
+
+        if blur > 0:
+            layer = Image.new("RGBA", size, (0, 0, 0, 0))
+            ImageDraw.Draw(layer).text(origin, text, font=font, anchor=anchor, fill=fill)
+            canvas.alpha_composite(layer.filter(ImageFilter.GaussianBlur(blur)), (box[0], box[1]))
+        else:
+            ImageDraw.Draw(canvas).text(xy, text, font=font, anchor=anchor, fill=fill)
+
+    def draw_paragraph(
+        self,
+        canvas: Image.Image,
+        center_x: float,
+        top: float,
+        text: str,
+        font: ImageFont.FreeTypeFont,
+        fill: Tuple[int, int, int, int],
+        max_width: float,
+        line_height: float,
+        max_lines: int = 0,
+        shadow: Optional[Dict[str, Any]] = None
+    ) -> float:
+        """居中绘制换行段落，返回段落底部y坐标"""
+        lines = wrap_text(text, font, max_width, max_lines)
+        for i, line in enumerate(lines):
+            self.draw_text(canvas, (center_x, top + line_height * (i + 0.5)), line, font, fill, "mm", shadow)
+        return top + line_height * len(lines)
+
+    # ---------- 版式 ----------
+
+    def compose_charm(self, data: Dict[str, Any], width: int) -> Image.Image:
+        """签体挂件：光晕 + 签体PNG + 签名（竖排/横排）+ 祝福副标题，版式取自签体配置"""
+        from .charm_catalog import get_charm_catalog
+
+        snapshot = get_charm_catalog().get()
+        charm = snapshot.by_id.get(data.get("charm_id")) or snapshot.by_name.get(data.get("charm_name"))
+        if charm is None:
+            raise ValueError(f"未知签体: {data.get('charm_id') or data.get('charm_name')}")
+
+        scale = width / CHARM_CANVAS
+        background = data.get("background_color")
+        canvas = Image.new("RGBA", (width, width), parse_color(background, "#000000", 255 if background else 0))
+
+        palette = charm.get("suggestedPalette") or ["#FFD166"]
+        glow_color = parse_color(data.get("accent_color") or palette[0], "#FFD166")
+        canvas.alpha_composite(self.charm_glow(charm, glow_color, width))
+
+        charm_image = self.charm_image(charm, width)
+        if charm_image is not None:
+            canvas.alpha_composite(charm_image)
+
+        main_color = parse_color(data.get("main_color"), "#2D3748")
+        shadow = {"offset": (0, max(1, round(2 * scale))), "blur": max(1, 3 * scale), "color": "#FFFFFF", "opacity": 0.6}
+
+        title = charm.get("title") or {}
+        name = (data.get("title") or "")[:int(title.get("maxChars", 4))]
+        position = title.get("position") or {"x": 512, "y": 520}
+        x, y = position["x"] * scale, position["y"] * scale
+        font = self.font(title.get("fontSize", 64) * scale, data.get("font"))
+        if title.get("type") == "vertical":
+            step = title.get("lineHeight", title.get("fontSize", 64)) * scale
+            first = y - step * (len(name) - 1) / 2
+            for i, char in enumerate(name):
+                self.draw_text(canvas, (x, first + step * i), char, font, main_color, "mm", shadow)
+        else:
+            self.draw_text(canvas, (x, y), name, font, main_color, "mm", shadow)
+
+        subtitle = charm.get("subtitle") or {}
+        if subtitle.get("visible", True) and data.get("subtitle"):
+            position = subtitle.get("position") or {"x": 512, "y": 660}
+            self.draw_text(
+                canvas,
+                (position["x"] * scale, position["y"] * scale),
+                data["subtitle"][:int(subtitle.get("maxChars", 10))],
+                self.font(subtitle.get("fontSize", 28) * scale, data.get("font")),
+                parse_color(subtitle.get("color"), "#2C3E50"),
+                "mm",
+                shadow
+            )
+        return canvas
+
+    def compose_postcard(self, data: Dict[str, Any], width: int, height: int, background: Optional[bytes]) -> Image.Image:
+        """默认明信片：上部背景图（底部渐暗）+ 居中标题/副标题/正文/署名，与前端默认卡片模板一致"""
+        scale = width / 375
+        canvas = Image.new("RGBA", (width, height), parse_color(data.get("card_color"), "#FFFFFF"))
+
+        header_h = round(height * 350 / 600)
+        if background:
+            header = self.background_image(
+                background, data.get("image_url") or "", (width, header_h), float(data.get("background_blur", 0)) * scale
+            )
+            canvas.alpha_composite(header)
+            canvas.alpha_composite(self._header_gradient(width, header_h))
+        else:
+            top, bottom = parse_color("#667eea", "#667eea"), parse_color("#764ba2", "#764ba2")
+            canvas.alpha_composite(self._vertical_gradient((width, header_h), top, bottom))
+
+        # 可选签体徽记：叠在背景图右下角
+        if data.get("charm_id"):
+            badge_size = round(120 * scale)
+            badge = self.compose_charm({"charm_id": data["charm_id"], "title": data.get("charm_name", "")}, badge_size * 2)
+            badge = badge.resize((badge_size, badge_size), Image.LANCZOS)
+            canvas.alpha_composite(badge, (width - badge_size - round(12 * scale), header_h - badge_size - round(8 * scale)))
+
+        center_x = width / 2
+        max_width = width - 50 * scale
+        shadow = data.get("text_shadow")
+        y = header_h + 30 * scale
+        y = self.draw_paragraph(
+            canvas, center_x, y, data.get("title") or "温馨祝福",
+            self.font(28 * scale, data.get("font")), parse_color("#333333", "#333333"), max_width, 36 * scale, 1, shadow
+        )
+        y = self.draw_paragraph(
+            canvas, center_x, y + 6 * scale, data.get("subtitle") or "来自心底的真诚",
+            self.font(16 * scale, data.get("font")), parse_color("#666666", "#666666"), max_width, 22 * scale, 1, shadow
+        )
+        signature_h = 20 * scale
+        body_top = y + 14 * scale
+        body_line = 18 * 1.6 * scale
+        body_lines = max(1, int((height - 30 * scale - signature_h - 10 * scale - body_top) // body_line))
+        self.draw_paragraph(
+            canvas, center_x, body_top, data.get("body") or "愿美好与你同在",
+            self.font(18 * scale, data.get("font")), parse_color("#444444", "#444444"), max_width, body_line, body_lines, shadow
+        )
+        self.draw_paragraph(
+            canvas, center_x, height - 30 * scale - signature_h, data.get("signature") or "致亲爱的你",
+            self.font(14 * scale, data.get("font")), parse_color("#888888", "#888888"), max_width, signature_h, 1, shadow
+        )
+        return self._round_corners(canvas, round(20 * scale))
+
+    def _header_gradient(self, width: int, height: int) -> Image.Image:
+        return self._cached(
+            ("header_gradient", width, height),
+            lambda: self._vertical_gradient((width, height), (0, 0, 0, 0), (0, 0, 0, 77))
+        )
+
+    @staticmethod
+    def _vertical_gradient(size: Tuple[int, int], top: Tuple[int, ...], bottom: Tuple[int, ...]) -> Image.Image:
+        column = Image.new("RGBA", (1, 256))
+        column.putdata([
+            tuple(round(top[c] + (bottom[c] - top[c]) * i / 255) for c in range(4)) for i in range(256)
+        ])
+        return column.resize(size, Image.BILINEAR)
+
+    @staticmethod
+    def _round_corners(canvas: Image.Image, radius: int) -> Image.Image:
+        mask = Image.new("L", canvas.size, 0)
+        ImageDraw.Draw(mask).rounded_rectangle((0, 0, canvas.width - 1, canvas.height - 1), radius=radius, fill=255)
+        canvas.putalpha(Image.composite(canvas.getchannel("A"), mask, mask))
+        return canvas
+
+    # ---------- 入口 ----------
+
+    def compose(
+        self,
+        layout: str,
+        data: Dict[str, Any],
+        width: int,
+        height: int,
+        format: str = "png",
+        device_scale: float = 1,
+        quality: Optional[int] = None,
+        background: Optional[bytes] = None
+    ) -> bytes:
+        """合成卡片并编码为图片字节（同步，供线程池调用）"""
+        pixel_w, pixel_h = round(width * device_scale), round(height * device_scale)
+        if layout == "charm":
+            image = self.compose_charm(data, pixel_w)
+        elif layout == "postcard":
+            image = self.compose_postcard(data, pixel_w, pixel_h, background)
+        else:
+            raise ValueError(f"未知卡片版式: {layout}")
+
+        buffer = BytesIO()
+        if format in ("jpg", "jpeg"):
+            flat = Image.new("RGB", image.size, (255, 255, 255))
+            flat.paste(image, mask=image.getchannel("A"))
+            flat.save(buffer, "JPEG", quality=quality or 90, optimize=True)
+        elif format == "webp":
+            image.save(buffer, "WEBP", quality=quality or 90, method=4)
+        else:
+            image.save(buffer, "PNG", compress_level=1)
+        return buffer.getvalue()
+
+    def _remote_allowed(self, image_url: str) -> bool:
+        """可经HTTP下载的背景图：本服务公网前缀下或白名单主机上的 http(s) URL"""
+        public_base = os.getenv("AI_AGENT_PUBLIC_URL", "").rstrip("/")
+        if public_base and image_url.startswith(public_base + "/"):
+            return True
+        parsed = urlparse(image_url)
+        return parsed.scheme in ("http", "https") and (parsed.hostname or "").lower() in self.background_hosts
+
+    def background_allowed(self, image_url: Any) -> bool:
+        """背景图来源是否可信（内容存储对象键或允许下载的URL），防止借合成接口访问任意地址"""
+        if not image_url:
+            return True
+        if not isinstance(image_url, str):
+            return False
+        from ..storage import ContentStore
+
+        return bool(ContentStore.key_from_url(image_url)) or self._remote_allowed(image_url)
+
+    async def _fetch_background(self, image_url: Optional[str]) -> Optional[bytes]:
+        """读取背景图：本服务生成的图片直接读内容存储，其余仅在来源可信时走HTTP"""
+        if not image_url or not isinstance(image_url, str):
+            return None
+        try:
+            from ..storage import get_content_store
+
+            store = get_content_store()
+            key = store.key_from_url(image_url)
+            if key:
+                data = await store.get_bytes(key)
+                if data:
+                    return data
+            if not self._remote_allowed(image_url):
+                logger.warning(f"⚠️ 卡片背景图来源不在允许范围，不下载: {image_url[:120]}")
+                return None
+            import aiohttp
+
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15)) as session:
+                # 不跟随重定向，避免白名单主机把请求转到内网地址
+                async with session.get(image_url, allow_redirects=False) as response:
+                    if response.status == 200:
+                        return await response.read()
+                    logger.warning(f"⚠️ 卡片背景图下载失败: HTTP {response.status}")
+        except Exception as e:
+            logger.warning(f"⚠️ 卡片背景图读取失败: {e}")
+        return None
+
+    async def render(
+        self,
+        layout: str,
+        data: Dict[str, Any],
+        width: int,
+        height: int,
+        format: str = "png",
+        device_scale: float = 1,
+        quality: Optional[int] = None
+    ) -> bytes:
+        """异步合成卡片，返回图片字节"""
+        if layout not in LAYOUTS:
+            raise ValueError(f"未知卡片版式: {layout}")
+        background = await self._fetch_background(data.get("image_url")) if layout == "postcard" else None
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="card-compositor")
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._pool, self.compose, layout, data, width, height, format, device_scale, quality, background
+        )
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+_card_compositor: Optional[CardCompositor] = None
+
+
+def get_card_compositor() -> CardCompositor:
+    """获取进程级卡片合成器单例（图片与字体缓存需跨请求共享）"""
+    global _card_compositor
+    if _card_compositor is None:
+        _card_compositor = CardCompositor()
+    return _card_compositor
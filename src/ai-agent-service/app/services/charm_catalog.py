@@ -0,0 +1,281 @@
+"""
+签体目录服务（进程级共享、热更新）
+签体配置与特征矩阵只加载一次：联合校验后建立按ID/名称的索引与加权特征矩阵，所有生成步骤共享同一份快照。
+读取时按间隔检查文件mtime，文件变化后重新加载并整体替换快照；新版本校验失败时继续使用旧快照，新增签体无需重启。
+
+推荐时先按加权余弦相似度取Top-K短名单（签体数超过阈值时使用IVF近邻索引，否则一次矩阵乘法+argpartition），
+再只对短名单做曝光/历史等精确重打分，签体目录扩展到数千个时推荐延迟基本不变。
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 特征维度顺序与权重（与推荐用户向量一一对应）
+FEATURE_KEYS = [
+    "emotion_calm", "emotion_energetic", "emotion_anxious", "emotion_thoughtful",
+    "element_wood", "element_fire", "element_earth", "element_metal", "element_water",
+    "cultural_depth"
+]
+FEATURE_WEIGHTS = [1.5, 1.5, 1.3, 1.3, 1.0, 1.0, 1.0, 1.0, 1.0, 0.8]
+
+
+class IVFIndex:
+    """倒排文件近邻索引：球面k-means把单位向量划分为若干簇，查询时只精确扫描与查询最相近的n_probe个簇"""
+
+    def __init__(self, unit: np.ndarray, n_lists: int = 0, n_probe: int = 8, iterations: int = 10, seed: int = 0):
+        n = len(unit)
+        self.unit = unit
+        self.n_lists = max(1, min(n, n_lists or int(math.sqrt(n))))
+        self.n_probe = max(1, min(self.n_lists, n_probe))
+        rng = np.random.default_rng(seed)
+
+        # 在采样上训练簇中心，再把全部向量分配到最近的簇
+        sample = unit[rng.choice(n, min(n, self.n_lists * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), self.n_lists, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            filled = norms > 0
+            centroids[filled] = sums[filled] / norms[filled, None]
+        self.centroids = centroids
+
+        labels = np.concatenate([
+            np.argmax(unit[i:i + 8192] @ centroids.T, axis=1) for i in range(0, n, 8192)
+        ])
+        self.order = np.argsort(labels, kind="stable")
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=self.n_lists))])
+
+    def query(self, q: np.ndarray, k: int) -> np.ndarray:
+        """返回与单位向量q余弦相似度最高的约k个行号（近似；候选不足k个时扩大探测簇数）"""
+        ranked = np.argsort(-(self.centroids @ q))
+        n_probe = self.n_probe
+        while True:
+            members = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in ranked[:n_probe]])
+            if len(members) >= k or n_probe >= self.n_lists:
+                break
+            n_probe *= 2
+        if len(members) <= k:
+            return members
+        similarities = self.unit[members] @ q
+        return members[np.argpartition(-similarities, k - 1)[:k]]
+
+
+class CharmCatalogSnapshot:
+    """一个版本的签体目录（构建完成后只读）"""
+
+    def __init__(self, configs: List[Dict[str, Any]], matrix: Optional[List[Dict[str, Any]]], version: Tuple, source: str,
+                 ann_min_size: int = 20000, ann_probe: int = 8):
+        self.configs = configs
+        self.matrix = matrix
+        self.version = version
+        self.source = source
+        self.loaded_at = time.time()
+
+        self.by_id = {config["id"]: config for config in configs}
+        self.by_name = {config["name"]: config for config in configs}
+        self.feature_index = self._build_feature_index(matrix, ann_min_size, ann_probe) if matrix else None
+
+    @staticmethod
+    def _build_feature_index(charms: List[Dict[str, Any]], ann_min_size: int, ann_probe: int) -> Dict[str, Any]:
+        """预处理为加权NumPy矩阵、范数与单位向量；签体数达到阈值时额外构建近邻索引"""
+        weights = np.asarray(FEATURE_WEIGHTS, dtype=np.float64)
+        features = np.asarray(
+            [[float(charm["features"][key]) for key in FEATURE_KEYS] for charm in charms],
+            dtype=np.float64
+        )
+        weighted = features * weights
+        norms = np.linalg.norm(weighted, axis=1)
+        unit = np.divide(weighted, norms[:, None], out=np.zeros_like(weighted), where=norms[:, None] > 0)
+        return {
+            "ids": [charm["id"] for charm in charms],
+            "names": [charm["name"] for charm in charms],
+            "position": {charm["id"]: i for i, charm in enumerate(charms)},
+            "weights": weights,
+            "features": features,
+            "weighted": weighted,
+            "norms": norms,
+            "unit": unit,
+            "ann": IVFIndex(unit, n_probe=ann_probe) if len(charms) >= ann_min_size else None
+        }
+
+    def __len__(self):
+        return len(self.configs)
+
+
+def shortlist(index: Dict[str, Any], user_weighted: np.ndarray, k: int) -> np.ndarray:
+    """按加权余弦相似度取Top-K签体行号（无序）；签体数不超过K时返回全部"""
+    n = len(index["ids"])
+    if n <= k:
+        return np.arange(n)
+
+    norm = np.linalg.norm(user_weighted)
+    if norm == 0:
+        return np.arange(k)
+    query = user_weighted / norm
+
+    if index["ann"] is not None:
+        return index["ann"].query(query, k)
+    similarities = index["unit"] @ query
+    return np.argpartition(-similarities, k - 1)[:k]
+
+
+class CharmCatalog:
+    """签体目录：加载、联合校验、索引与按mtime热更新"""
+
+    def __init__(self):
+        self.check_interval = float(os.getenv("CHARM_CATALOG_CHECK_INTERVAL", "5"))
+        # 签体数达到该值时构建近邻索引（更小的目录直接矩阵乘法更快）
+        self.ann_min_size = int(os.getenv("CHARM_ANN_MIN_SIZE", "20000"))
+        self.ann_probe = int(os.getenv("CHARM_ANN_PROBE", "8"))
+        self._snapshot: Optional[CharmCatalogSnapshot] = None
+        # 最近一次尝试加载的文件版本（加载失败时同样记录，文件未再变化前不重复尝试）
+        self._seen_version: Optional[Tuple] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _config_paths(self) -> List[str]:
+        paths = [
+            os.environ.get('CHARM_CONFIG_PATH'),
+            '/app/resources/签体/charm-config.json',
+            os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../..', 'resources/签体/charm-config.json')),
+            os.path.join(os.getcwd(), 'resources/签体/charm-config.json'),
+        ]
+        return [p for p in paths if p]
+
+    def _resolve_paths(self) -> Tuple[Optional[str], Optional[str]]:
+        config_path = next((p for p in self._config_paths() if os.path.exists(p)), None)
+        matrix_path = os.getenv('CHARM_FEATURES_MATRIX_PATH')
+        if not matrix_path and config_path:
+            matrix_path = os.path.join(os.path.dirname(config_path), 'charm-features-matrix.json')
+        matrix_path = matrix_path or '/app/resources/签体/charm-features-matrix.json'
+        return config_path, matrix_path
+
+    @staticmethod
+    def _mtime(path: Optional[str]) -> Optional[float]:
+        try:
+            return os.stat(path).st_mtime_ns if path else None
+        except OSError:
+            return None
+
+    def _version(self) -> Tuple:
+        config_path, matrix_path = self._resolve_paths()
+        return (config_path, self._mtime(config_path), matrix_path, self._mtime(matrix_path))
+
+    def get(self) -> CharmCatalogSnapshot:
+        """获取当前快照；距上次检查超过间隔时比对文件mtime，变化则重新加载"""
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._last_check < self.check_interval:
+            return self._snapshot
+
+        with self._lock:
+            if self._snapshot is not None and time.monotonic() - self._last_check < self.check_interval:
+                return self._snapshot
+            self._last_check = time.monotonic()
+            version = self._version()
+            if self._snapshot is None or version != self._seen_version:
+                self._reload(version)
+            return self._snapshot
+
+    def reload(self) -> CharmCatalogSnapshot:
+        """强制重新加载"""
+        with self._lock:
+            self._last_check = time.monotonic()
+            self._reload(self._version())
+            return self._snapshot
+
+    def _reload(self, version: Tuple):
+        self._seen_version = version
+        try:
+            snapshot = self._load(version)
+        except Exception as e:
+            if self._snapshot is not None:
+                logger.error(f"❌ 签体目录热更新校验失败，继续使用旧版本: {e}")
+                return
+            logger.error(f"❌ 加载签体目录失败: {e}，使用内置签体配置")
+            from .charm_defaults import DEFAULT_CHARM_CONFIGS
+            snapshot = CharmCatalogSnapshot(DEFAULT_CHARM_CONFIGS, None, version, "builtin")
+
+        previous = self._snapshot
+        self._snapshot = snapshot
+        matrix_size = len(snapshot.matrix) if snapshot.matrix else 0
+        action = "热更新" if previous is not None else "加载"
+        logger.info(f"✅ 签体目录{action}完成: {len(snapshot)}个签体配置, {matrix_size}个特征向量 ({snapshot.source})")
+
+    def _load(self, version: Tuple) -> CharmCatalogSnapshot:
+        config_path, _, matrix_path, _ = version
+        if not config_path:
+            raise FileNotFoundError("签体配置文件不存在")
+
+        with open(config_path, 'r', encoding='utf-8') as f:
+            configs = json.load(f)
+        self._validate_configs(configs)
+
+        matrix = None
+        if matrix_path and os.path.exists(matrix_path):
+            with open(matrix_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            matrix = self._validate_matrix(data, {config["id"] for config in configs})
+        else:
+            logger.warning(f"⚠️ [CHARM-REC] 特征矩阵文件不存在: {matrix_path}，推荐将降级到旧版算法")
+
+        return CharmCatalogSnapshot(configs, matrix, version, config_path, self.ann_min_size, self.ann_probe)
+
+    @staticmethod
+    def _validate_configs(configs: Any):
+        if not isinstance(configs, list) or not configs:
+            raise ValueError("签体配置必须是非空列表")
+        seen = set()
+        for config in configs:
+            if not isinstance(config, dict) or not config.get("id") or not config.get("name"):
+                raise ValueError(f"签体配置缺少id/name: {config}")
+            if config["id"] in seen:
+                raise ValueError(f"签体ID重复: {config['id']}")
+            seen.add(config["id"])
+
+    @staticmethod
+    def _validate_matrix(data: Any, config_ids: set) -> List[Dict[str, Any]]:
+        """校验特征矩阵：每个签体都有配置、特征维度完整且取值在[0,1]"""
+        charms = data.get("charms") if isinstance(data, dict) else None
+        if not isinstance(charms, list) or not charms:
+            raise ValueError("特征矩阵缺少charms列表")
+
+        seen = set()
+        for charm in charms:
+            charm_id = charm.get("id")
+            if charm_id not in config_ids:
+                raise ValueError(f"特征矩阵中的签体没有对应配置: {charm_id}")
+            if charm_id in seen:
+                raise ValueError(f"特征矩阵签体重复: {charm_id}")
+            seen.add(charm_id)
+            features = charm.get("features") or {}
+            for key in FEATURE_KEYS:
+                value = features.get(key)
+                if not isinstance(value, (int, float)) or not 0 <= value <= 1:
+                    raise ValueError(f"签体 {charm_id} 特征 {key} 取值无效: {value}")
+
+        missing = config_ids - seen
+        if missing:
+            logger.warning(f"⚠️ [CHARM-REC] {len(missing)}个签体缺少特征向量，不参与向量推荐: {sorted(missing)}")
+        return charms
+
+
+_charm_catalog: Optional[CharmCatalog] = None
+
+
+def get_charm_catalog() -> CharmCatalog:
+    """获取进程级签体目录单例"""
+    global _charm_catalog
+    if _charm_catalog is None:
+        _charm_catalog = CharmCatalog()
+    return _charm_catalog
@@ -0,0 +1,279 @@
+"""
+签体推荐离线模拟器
+用合成或录制的分析结果回放 TwoStageGenerator 的推荐逻辑，曝光数据保存在进程内假存储中（不访问Redis/模型），
+输出签体曝光分布公平性、用户重复推荐率与单次推荐延迟分位数；benchmark 模式只测吞吐与延迟。
+
+调参时通过 CHARM_RANDOM_NOISE_SIGMA / CHARM_HISTORY_PENALTY_BASE 等环境变量或命令行参数覆盖，对比前后报告即可。
+
+运行模拟：python -m app.services.charm_simulator --users 200 --calls-per-user 20 --seed 7
+录制回放：python -m app.services.charm_simulator --input analyses.jsonl
+性能基准：python -m app.services.charm_simulator --benchmark --calls 20000 --max-p99-ms 2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMOTION_STATES = ["calm", "energetic", "anxious", "thoughtful", "positive"]
+HEXAGRAMS = ["坤为地", "乾为天", "离为火", "坎为水", "震为雷", "巽为风", "地天泰", "风雷益", "水火既济", "火天大有"]
+ELEMENTS = ["wood", "fire", "earth", "metal", "water"]
+
+
+class InMemoryExposureStore:
+    """进程内曝光存储，接口与 CharmExposureTracker 的推荐路径一致"""
+
+    def __init__(self, history_limit: int = 5):
+        self.history_limit = history_limit
+        self.global_counts: Counter = Counter()
+        self.total = 0
+        self.history: Dict[str, List[str]] = {}
+
+    def record_recommendation(self, user_id: str, charm_ids: list):
+        self.global_counts.update(charm_ids)
+        self.total += len(charm_ids)
+        if user_id:
+            # 与Redis LPUSH+LTRIM一致：最新的在前
+            recent = list(reversed(charm_ids)) + self.history.get(user_id, [])
+            self.history[user_id] = recent[:self.history_limit]
+
+    async def get_snapshot(self, user_id: str = None, limit: int = 5) -> dict:
+        recent = self.history.get(user_id, []) if user_id else []
+        return {"recent": recent[:limit], "global": dict(self.global_counts), "total": self.total}
+
+
+def synthetic_analyses(users: int, calls_per_user: int, seed: int) -> Iterator[Dict[str, Any]]:
+    """合成分析结果：每个用户有稳定的情绪/五行倾向，每次调用在其附近扰动；用户调用交错进行"""
+    rng = random.Random(seed)
+    profiles = []
+    for i in range(users):
+        profiles.append({
+            "user_id": f"sim-user-{i}",
+            "emotions": rng.sample(EMOTION_STATES, 2),
+            "elements": {e: rng.uniform(0.2, 0.9) for e in ELEMENTS},
+            "hexagram": rng.choice(HEXAGRAMS)
+        })
+
+    for _ in range(calls_per_user):
+        for profile in profiles:
+            yield {
+                "user_id": profile["user_id"],
+                "psychological_profile": {"emotion_state": rng.choice(profile["emotions"])},
+                "five_elements": {
+                    e: round(min(1.0, max(0.0, v + rng.gauss(0, 0.1))), 2) for e, v in profile["elements"].items()
+                },
+                "hexagram_match": {"name": profile["hexagram"] if rng.random() < 0.7 else rng.choice(HEXAGRAMS)}
+            }
+
+
+def recorded_analyses(path: str) -> Iterator[Dict[str, Any]]:
+    """录制的分析结果（JSONL）：每行为分析结果本身，或 {"user_id": ..., "analysis": {...}}"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            analysis = dict(record.get("analysis", record))
+            if record.get("user_id"):
+                analysis["user_id"] = record["user_id"]
+            yield analysis
+
+
+def percentiles(values: List[float], points=(50, 90, 99)) -> Dict[str, float]:
+    if not values:
+        return {f"p{p}": 0.0 for p in points}
+    result = np.percentile(np.asarray(values), points)
+    return {f"p{p}": round(float(v), 4) for p, v in zip(points, result)}
+
+
+def fairness_metrics(counts: Counter, charm_ids: List[str]) -> Dict[str, Any]:
+    """曝光分布公平性：Gini系数（0为完全均匀）、归一化熵（1为完全均匀）、最大/最小份额比与覆盖率"""
+    values = np.asarray([counts.get(charm_id, 0) for charm_id in charm_ids], dtype=np.float64)
+    total = values.sum()
+    n = len(values)
+    if total == 0 or n == 0:
+        return {"gini": 0.0, "entropy": 0.0, "max_min_ratio": None, "coverage": 0.0, "shares": {}}
+
+    shares = values / total
+    sorted_values = np.sort(values)
+    gini = float((2 * np.arange(1, n + 1) - n - 1) @ sorted_values / (n * total))
+    nonzero = shares[shares > 0]
+    entropy = float(-(nonzero * np.log(nonzero)).sum() / math.log(n)) if n > 1 else 1.0
+    return {
+        "gini": round(gini, 4),
+        "entropy": round(entropy, 4),
+        "max_min_ratio": round(float(values.max() / values.min()), 2) if values.min() > 0 else None,
+        "coverage": round(float((values > 0).mean()), 4),
+        "shares": {charm_id: round(float(s), 4) for charm_id, s in zip(charm_ids, shares)}
+    }
+
+
+class CharmRecommendationSimulator:
+    """回放分析结果，驱动 TwoStageGenerator 的推荐逻辑并收集指标"""
+
+    def __init__(self, seed: Optional[int] = None, exposure: bool = True, overrides: Optional[Dict[str, Any]] = None):
+        # 推荐逻辑不调用模型，但生成器构造时会创建文本提供商；默认使用假提供商避免依赖API密钥
+        os.environ.setdefault("AI_PROVIDER_MODE", "fake")
+        from ..orchestrator.steps.two_stage_generator import TwoStageGenerator
+        from .charm_catalog import get_charm_catalog
+
+        self.catalog = get_charm_catalog().get()
+        if self.catalog.feature_index is None:
+            raise RuntimeError("特征矩阵未加载，无法模拟优化推荐算法（检查 CHARM_FEATURES_MATRIX_PATH）")
+
+        self.generator = TwoStageGenerator()
+        for key, value in (overrides or {}).items():
+            setattr(self.generator, key, value)
+        self.generator._rng = np.random.default_rng(seed)
+        self.store = InMemoryExposureStore() if exposure else None
+        self.generator.exposure_tracker = self.store
+
+    async def _recommend(self, analysis: Dict[str, Any]) -> Tuple[List[str], float]:
+        started = time.perf_counter()
+        charms = await self.generator._recommend_charms(analysis)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        return [c["id"] for c in charms], elapsed_ms
+
+    async def simulate(self, analyses: Iterator[Dict[str, Any]]) -> Dict[str, Any]:
+        exposure = Counter()
+        first_choice = Counter()
+        latencies: List[float] = []
+        last_by_user: Dict[str, set] = {}
+        user_calls: Counter = Counter()
+        user_repeats: Counter = Counter()
+
+        for analysis in analyses:
+            ids, elapsed_ms = await self._recommend(analysis)
+            latencies.append(elapsed_ms)
+            exposure.update(ids)
+            if ids:
+                first_choice[ids[0]] += 1
+
+            user_id = analysis.get("user_id")
+            if user_id:
+                previous = last_by_user.get(user_id)
+                if previous is not None:
+                    user_calls[user_id] += 1
+                    # 与上一次推荐有交集即计为一次重复
+                    if previous & set(ids):
+                        user_repeats[user_id] += 1
+                last_by_user[user_id] = set(ids)
+
+        per_user = [user_repeats[u] / user_calls[u] for u in user_calls]
+        charm_ids = list(self.catalog.by_id)
+        return {
+            "calls": len(latencies),
+            "users": len(last_by_user),
+            "catalog_size": len(charm_ids),
+            "params": self._params(),
+            "exposure_fairness": fairness_metrics(exposure, charm_ids),
+            "first_choice_fairness": fairness_metrics(first_choice, charm_ids),
+            "repeat_rate": {
+                "overall": round(sum(user_repeats.values()) / max(1, sum(user_calls.values())), 4),
+                "per_user": percentiles(per_user),
+                "users_always_repeated": sum(1 for rate in per_user if rate >= 1.0)
+            },
+            "latency_ms": percentiles(latencies)
+        }
+
+    async def benchmark(self, analyses: List[Dict[str, Any]], calls: int, warmup: int = 200) -> Dict[str, Any]:
+        for i in range(min(warmup, calls)):
+            await self._recommend(analyses[i % len(analyses)])
+
+        latencies: List[float] = []
+        started = time.perf_counter()
+        for i in range(calls):
+            latencies.append((await self._recommend(analyses[i % len(analyses)]))[1])
+        elapsed = time.perf_counter() - started
+        return {
+            "calls": calls,
+            "catalog_size": len(self.catalog),
+            "params": self._params(),
+            "throughput_per_sec": round(calls / elapsed, 1),
+            "latency_ms": percentiles(latencies, (50, 90, 99, 99.9))
+        }
+
+    def _params(self) -> Dict[str, Any]:
+        g = self.generator
+        return {
+            "top_n": g.top_n,
+            "random_noise_sigma": g.random_noise_sigma,
+            "history_penalty_base": g.history_penalty_base,
+            "exposure_balancing": self.store is not None
+        }
+
+
+def _print_report(report: Dict[str, Any]):
+    print(f"📊 调用 {report['calls']} 次, 签体 {report['catalog_size']} 个, 参数 {report['params']}")
+    if "throughput_per_sec" in report:
+        print(f"⚡ 吞吐: {report['throughput_per_sec']} 次/秒")
+    else:
+        for label, key in (("曝光分布", "exposure_fairness"), ("首选分布", "first_choice_fairness")):
+            m = report[key]
+            print(f"⚖️ {label}: gini={m['gini']} entropy={m['entropy']} max/min={m['max_min_ratio']} coverage={m['coverage']}")
+        shares = report["exposure_fairness"]["shares"]
+        for charm_id, share in sorted(shares.items(), key=lambda item: -item[1]):
+            print(f"   {charm_id:<24} {share:.4f} {'█' * int(share * 200)}")
+        repeat = report["repeat_rate"]
+        print(f"🔁 用户重复率: overall={repeat['overall']} per_user={repeat['per_user']} 总是重复的用户={repeat['users_always_repeated']}")
+    print(f"⏱️ 单次延迟(ms): {report['latency_ms']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="签体推荐离线模拟与性能基准")
+    parser.add_argument("--input", help="录制的分析结果JSONL；不指定时使用合成数据")
+    parser.add_argument("--users", type=int, default=100, help="合成用户数")
+    parser.add_argument("--calls-per-user", type=int, default=20, help="每个合成用户的调用次数")
+    parser.add_argument("--seed", type=int, default=42, help="合成数据与推荐随机扰动的种子")
+    parser.add_argument("--noise-sigma", type=float, help="覆盖 CHARM_RANDOM_NOISE_SIGMA")
+    parser.add_argument("--penalty-base", type=float, help="覆盖 CHARM_HISTORY_PENALTY_BASE")
+    parser.add_argument("--no-exposure", action="store_true", help="关闭曝光均衡与历史去重")
+    parser.add_argument("--benchmark", action="store_true", help="只测吞吐与延迟")
+    parser.add_argument("--calls", type=int, default=10000, help="benchmark 调用次数")
+    parser.add_argument("--max-p99-ms", type=float, help="p99延迟超过该值时以非零状态退出（用于CI性能回归检查）")
+    parser.add_argument("--json", action="store_true", help="以JSON输出报告")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    overrides = {}
+    if args.noise_sigma is not None:
+        overrides["random_noise_sigma"] = args.noise_sigma
+    if args.penalty_base is not None:
+        overrides["history_penalty_base"] = args.penalty_base
+
+    simulator = CharmRecommendationSimulator(seed=args.seed, exposure=not args.no_exposure, overrides=overrides)
+    if args.input:
+        analyses = recorded_analyses(args.input)
+    else:
+        analyses = synthetic_analyses(args.users, args.calls_per_user, args.seed)
+
+    if args.benchmark:
+        report = asyncio.run(simulator.benchmark(list(analyses), args.calls))
+    else:
+        report = asyncio.run(simulator.simulate(analyses))
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_report(report)
+
+    if args.max_p99_ms is not None and report["latency_ms"]["p99"] > args.max_p99_ms:
+        print(f"❌ p99延迟 {report['latency_ms']['p99']}ms 超过阈值 {args.max_p99_ms}ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
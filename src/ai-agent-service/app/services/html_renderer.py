@@ -0,0 +1,170 @@
+"""
+HTML渲染常驻进程客户端
+通过本地 Unix socket 把渲染任务交给 render_server.js（常驻 Chromium + 预热页面池），
+不再为每张截图启动新的浏览器；socket 不可用且允许自动拉起时，由本进程启动渲染进程并随本进程退出。
+"""
+
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(__file__), "render_server.js")
+
+# 响应中包含base64截图，需放宽单行读取上限
+READ_LIMIT = 64 * 1024 * 1024
+
+
+class HTMLRenderer:
+    """渲染进程客户端"""
+
+    def __init__(self):
+        self.enabled = os.getenv("HTML_RENDERER", "on") == "on"
+        self.socket_path = os.getenv("RENDER_SOCKET_PATH", "/tmp/html-renderer.sock")
+        self.autostart = os.getenv("RENDER_SIDECAR_AUTOSTART", "on") == "on"
+        self.timeout = float(os.getenv("RENDER_TIMEOUT", "30"))
+        self.start_timeout = float(os.getenv("RENDER_SIDECAR_START_TIMEOUT", "30"))
+
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._ids = itertools.count(1)
+
+    async def _request(self, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_unix_connection(self.socket_path, limit=READ_LIMIT), timeout=min(timeout, 5)
+        )
+        try:
+            writer.write(json.dumps(dict(payload, id=next(self._ids)), ensure_ascii=False).encode("utf-8") + b"\n")
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), timeout=timeout)
+        finally:
+            writer.close()
+        if not line:
+            raise ConnectionResetError("渲染进程关闭了连接")
+        return json.loads(line)
+
+    async def _ping(self) -> bool:
+        try:
+            return (await self._request({"op": "ping"}, 2)).get("ok", False)
+        except (OSError, asyncio.TimeoutError, ValueError):
+            return False
+
+    async def ensure_started(self) -> bool:
+        """确认渲染进程可用，必要时拉起（同一进程内只启动一个）
+
+        多个worker同时拉起时，后启动的渲染进程发现socket已有进程监听会自行退出，
+        此时直接使用已就绪的渲染进程。
+        """
+        if await self._ping():
+            return True
+        if not self.autostart:
+            return False
+
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if await self._ping():
+                return True
+
+            if self._process is None or self._process.returncode is not None:
+                env = dict(os.environ, RENDER_SOCKET_PATH=self.socket_path, RENDER_EXIT_WITH_PARENT="1")
+                # puppeteer 为全局安装，补充全局模块目录
+                env.setdefault("NODE_PATH", "/usr/local/lib/node_modules:/usr/lib/node_modules")
+                logger.info(f"🚀 启动HTML渲染进程: {self.socket_path}")
+                self._process = await asyncio.create_subprocess_exec(
+                    "node", SERVER_SCRIPT, stdin=asyncio.subprocess.PIPE, env=env
+                )
+
+            loop = asyncio.get_event_loop()
+            deadline = loop.time() + self.start_timeout
+            while loop.time() < deadline:
+                # 先探测socket：本进程拉起的渲染进程可能因其他worker的渲染进程已在服务而退出
+                if await self._ping():
+                    return True
+                if self._process.returncode is not None:
+                    logger.warning(f"⚠️ HTML渲染进程启动失败，退出码: {self._process.returncode}")
+                    return False
+                await asyncio.sleep(0.2)
+            logger.warning(f"⚠️ HTML渲染进程{self.start_timeout}s内未就绪")
+            return False
+
+    async def render(
+        self,
+        html: str,
+        width: int,
+        height: int,
+        format: str = "png",
+        device_scale: float = 1,
+        quality: Optional[int] = None
+    ) -> Optional[bytes]:
+        """渲染HTML为图片字节；渲染进程不可用或渲染失败时返回None，由调用方降级"""
+        if not self.enabled:
+            return None
+
+        payload = {
+            "op": "render",
+            "html": html,
+            "width": width,
+            "height": height,
+            "device_scale": device_scale,
+            "format": format,
+            "quality": quality,
+            "timeout_ms": int(self.timeout * 1000)
+        }
+        for attempt in range(2):
+            try:
+                response = await self._request(payload, self.timeout + 5)
+                break
+            except (FileNotFoundError, ConnectionRefusedError, ConnectionResetError):
+                # 渲染进程尚未启动或已退出：拉起后重试一次
+                if attempt or not await self.ensure_started():
+                    return None
+            except (OSError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f"⚠️ HTML渲染请求失败: {e}")
+                return None
+
+        if not response.get("ok"):
+            logger.warning(f"⚠️ HTML渲染失败: {response.get('error')}")
+            return None
+        logger.info(f"✅ HTML渲染完成: {width}x{height} {response.get('elapsed_ms')}ms")
+        return base64.b64decode(response["data"])
+
+    async def get_stats(self) -> Optional[Dict[str, Any]]:
+        try:
+            return (await self._request({"op": "stats"}, 5)).get("stats")
+        except (OSError, asyncio.TimeoutError, ValueError):
+            return None
+
+    async def close(self):
+        """停止本进程拉起的渲染进程"""
+        process, self._process = self._process, None
+        if process is None or process.returncode is not None:
+            return
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            process.kill()
+
+
+_html_renderer: Optional[HTMLRenderer] = None
+
+
+def get_html_renderer() -> HTMLRenderer:
+    """获取进程级渲染客户端单例"""
+    global _html_renderer
+    if _html_renderer is None:
+        _html_renderer = HTMLRenderer()
+    return _html_renderer
+
+
+async def close_html_renderer():
+    global _html_renderer
+    if _html_renderer is not None:
+        await _html_renderer.close()
+        _html_renderer = None
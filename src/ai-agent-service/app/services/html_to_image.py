@@ -4,6 +4,7 @@ HTML转图片服务 - 为小程序提供HTML内容的图片渲染
 """
 
 import asyncio
+import json
 import logging
 import os
 import base64
@@ -12,10 +13,22 @@ import subprocess
 import uuid
 from typing import Optional, Dict, Any
 import aiohttp
-import aiofiles
+
+from ..storage import get_content_store, get_expiry_index
+from .html_renderer import get_html_renderer
+from .render_cache import get_render_cache
+from .render_scheduler import RenderRejected, get_render_scheduler
 
 logger = logging.getLogger(__name__)
 
+
+def _public_url(key: str) -> str:
+    """生成图片的访问URL：配置 AI_AGENT_PUBLIC_URL 时为绝对地址，否则为 /generated 相对路径（由调用方按自身域名访问）"""
+    path_part = f"/generated/{key}"
+    public_base = os.getenv("AI_AGENT_PUBLIC_URL", "").rstrip("/")
+    return f"{public_base}{path_part}" if public_base else path_part
+
+
 class HTMLToImageService:
     """HTML转图片服务"""
     
@@ -41,7 +54,11 @@ class HTMLToImageService:
         output_filename: str = None,
         width: int = 375,
         height: int = 600,
-        format: str = "png"
+        format: str = "png",
+        device_scale: float = 1,
+        quality: Optional[int] = None,
+        priority: str = "interactive",
+        deadline: Optional[float] = None
     ) -> Optional[Dict[str, Any]]:
         """
         将HTML内容转换为图片
@@ -52,35 +69,54 @@ class HTMLToImageService:
             width: 图片宽度
             height: 图片高度
             format: 图片格式（png/jpeg）
+            device_scale: 设备像素比
+            quality: jpeg/webp 质量（0-100）
+            priority: 渲染优先级（interactive: 调用方同步等待; batch: 后台批量生成）
+            deadline: 最长排队秒数，默认按优先级配置
             
         Returns:
-            包含图片路径和URL的字典，失败返回None
+            包含图片路径和URL的字典（image_path 仅本地存储后端有值，其余后端为None，读取内容用 image_url 或存储），
+            失败返回None；渲染队列已满或排队超时抛出 RenderRejected
         """
         try:
             if not output_filename:
                 output_filename = f"postcard_{uuid.uuid4().hex[:8]}.{format}"
             
             output_path = os.path.join(self.output_dir, output_filename)
+            full_html = self._wrap_html(html_content)
             
-            # 方法1: 使用基于Node.js的html-to-image转换
-            success = await self._convert_with_puppeteer(
-                html_content, output_path, width, height, format
-            )
+            async def render():
+                # 方法1: 常驻渲染进程（预热页面池），截图字节直接写入内容寻址存储
+                image_bytes = await get_html_renderer().render(full_html, width, height, format, device_scale, quality)
+                if image_bytes is not None:
+                    return await get_content_store().put_bytes(image_bytes, format)
+                # 方法2: 渲染进程不可用时，单次启动Puppeteer转换
+                if await self._convert_with_puppeteer(html_content, output_path, width, height, format, device_scale, quality):
+                    # 截图移入内容寻址存储（相同卡片只保留一份）
+                    return await get_content_store().put_file(output_path, format)
+                return None
             
-            if success:
-                # 生成访问URL（支持可配置公网前缀）
-                path_part = f"/generated/images/{output_filename}"
-                public_base = os.getenv("AI_AGENT_PUBLIC_URL", "").rstrip("/")
-                image_url = f"{public_base}{path_part}" if public_base else path_part
+            async def schedule():
+                # 经调度器排队执行，限制同时进行的渲染数
+                return await get_render_scheduler().submit(render, priority, deadline)
+            
+            # 相同HTML与渲染参数直接复用已有截图，并发的相同请求只渲染一次
+            render_cache = get_render_cache()
+            cache_key = render_cache.render_key(full_html, width, height, device_scale, format, quality)
+            stored, cached = await render_cache.get_or_render(cache_key, schedule)
+            
+            if stored:
+                image_url = _public_url(stored["key"])
                 
                 return {
                     "success": True,
-                    "image_path": output_path,
+                    "image_path": stored["path"],
                     "image_url": image_url,
-                    "filename": output_filename,
+                    "filename": os.path.basename(stored["key"]),
                     "width": width,
                     "height": height,
-                    "format": format
+                    "format": format,
+                    "cached": cached
                 }
             else:
                 # 降级方案：生成简单的默认图片
@@ -88,26 +124,71 @@ class HTMLToImageService:
                     html_content, output_filename, width, height
                 )
                 
+        except RenderRejected:
+            # 过载时不返回占位图，由调用方决定重试或降级
+            raise
         except Exception as e:
             logger.error(f"HTML转图片失败: {e}")
             return None
     
-    async def _convert_with_puppeteer(
-        self, 
-        html_content: str, 
-        output_path: str, 
-        width: int, 
-        height: int, 
-        format: str
-    ) -> bool:
-        """使用Puppeteer进行HTML转图片"""
+    async def render_card(
+        self,
+        layout: str,
+        data: Dict[str, Any],
+        width: int = 375,
+        height: int = 600,
+        format: str = "png",
+        device_scale: float = 1,
+        quality: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        固定版式卡片直接用Pillow合成（不经过浏览器）
+        
+        Args:
+            layout: 卡片版式（charm: 签体挂件; postcard: 默认明信片）
+            data: 版式数据（标题、正文、签体ID、背景图URL等）
+            其余参数同 convert_html_to_image
+            
+        Returns:
+            与 convert_html_to_image 相同结构的字典，失败返回None
+        """
         try:
-            # 创建临时HTML文件
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False) as tmp_file:
-                # 确保HTML包含完整的文档结构
-                if not html_content.strip().startswith('<!DOCTYPE'):
-                    # 补全HTML结构
-                    full_html = f"""<!DOCTYPE html>
+            from .card_compositor import get_card_compositor
+            
+            async def render():
+                image_bytes = await get_card_compositor().render(layout, data, width, height, format, device_scale, quality)
+                return await get_content_store().put_bytes(image_bytes, format)
+            
+            # 与HTML截图共用缓存：版式+数据相同的卡片直接复用
+            render_cache = get_render_cache()
+            spec = "card:" + json.dumps({"layout": layout, "data": data}, ensure_ascii=False, sort_keys=True, default=str)
+            cache_key = render_cache.render_key(spec, width, height, device_scale, format, quality)
+            stored, cached = await render_cache.get_or_render(cache_key, render)
+            if not stored:
+                return None
+            
+            image_url = _public_url(stored["key"])
+            
+            return {
+                "success": True,
+                "image_path": stored["path"],
+                "image_url": image_url,
+                "filename": os.path.basename(stored["key"]),
+                "width": width,
+                "height": height,
+                "format": format,
+                "cached": cached
+            }
+        except Exception as e:
+            logger.error(f"卡片合成失败: {e}")
+            return None
+    
+    def _wrap_html(self, html_content: str) -> str:
+        """确保HTML包含完整的文档结构"""
+        if html_content.strip().startswith('<!DOCTYPE'):
+            return html_content
+        # 补全HTML结构
+        return f"""<!DOCTYPE html>
 <html lang="zh-CN">
 <head>
     <meta charset="UTF-8">
@@ -118,12 +199,30 @@ class HTMLToImageService:
     {html_content}
 </body>
 </html>"""
-                else:
-                    full_html = html_content
-                
-                tmp_file.write(full_html)
+    
+    async def _convert_with_puppeteer(
+        self, 
+        html_content: str, 
+        output_path: str, 
+        width: int, 
+        height: int, 
+        format: str,
+        device_scale: float = 1,
+        quality: Optional[int] = None
+    ) -> bool:
+        """使用Puppeteer进行HTML转图片"""
+        try:
+            # 创建临时HTML文件
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False) as tmp_file:
+                tmp_file.write(self._wrap_html(html_content))
                 tmp_html_path = tmp_file.name
             
+            # 截图成功后会移入内容寻址存储；失败残留的文件由过期索引回收
+            await get_expiry_index().register(output_path)
+            
+            screenshot_type = "jpeg" if format == "jpg" else format
+            quality_option = f" quality: {int(quality)}," if quality and screenshot_type != "png" else ""
+            
             # 创建Node.js脚本用于转换
             puppeteer_script = f"""
 const puppeteer = require('puppeteer');
@@ -136,13 +235,13 @@ const fs = require('fs');
   }});
   
   const page = await browser.newPage();
-  await page.setViewport({{ width: {width}, height: {height} }});
+  await page.setViewport({{ width: {width}, height: {height}, deviceScaleFactor: {device_scale} }});
   
   await page.goto('file://{tmp_html_path}', {{ waitUntil: 'networkidle0' }});
   
   await page.screenshot({{ 
     path: '{output_path}', 
-    type: '{format}',
+    type: '{screenshot_type}',{quality_option}
     fullPage: false,
     clip: {{ x: 0, y: 0, width: {width}, height: {height} }}
   }});
@@ -214,16 +313,16 @@ const fs = require('fs');
                 
                 output_path = os.path.join(self.output_dir, filename)
                 image.save(output_path)
+                await get_expiry_index().register(output_path)
+                stored = await get_content_store().put_file(output_path)
                 
-                path_part = f"/generated/images/{filename}"
-                public_base = os.getenv("AI_AGENT_PUBLIC_URL", "").rstrip("/")
-                image_url = f"{public_base}{path_part}" if public_base else path_part
+                image_url = _public_url(stored["key"])
 
                 return {
                     "success": True,
-                    "image_path": output_path,
+                    "image_path": stored["path"],
                     "image_url": image_url,
-                    "filename": filename,
+                    "filename": os.path.basename(stored["key"]),
                     "width": width,
                     "height": height,
                     "fallback": True
@@ -242,21 +341,15 @@ const fs = require('fs');
                 </svg>'''
                 
                 # 保存SVG文件
-                svg_filename = filename.replace('.png', '.svg').replace('.jpg', '.svg')
-                svg_path = os.path.join(self.output_dir, svg_filename)
-                
-                async with aiofiles.open(svg_path, 'w') as f:
-                    await f.write(svg_content)
+                stored = await get_content_store().put_bytes(svg_content.encode("utf-8"), "svg")
                 
-                path_part = f"/generated/images/{svg_filename}"
-                public_base = os.getenv("AI_AGENT_PUBLIC_URL", "").rstrip("/")
-                image_url = f"{public_base}{path_part}" if public_base else path_part
+                image_url = _public_url(stored["key"])
 
                 return {
                     "success": True,
-                    "image_path": svg_path,
+                    "image_path": stored["path"],
                     "image_url": image_url,
-                    "filename": svg_filename,
+                    "filename": os.path.basename(stored["key"]),
                     "width": width,
                     "height": height,
                     "fallback": True,
@@ -270,38 +363,31 @@ const fs = require('fs');
     async def get_image_info(self, filename: str) -> Optional[Dict[str, Any]]:
         """获取图片信息"""
         try:
-            file_path = os.path.join(self.output_dir, filename)
-            if os.path.exists(file_path):
-                stat = os.stat(file_path)
-                path_part = f"/generated/images/{filename}"
-                public_base = os.getenv("AI_AGENT_PUBLIC_URL", "").rstrip("/")
-                image_url = f"{public_base}{path_part}" if public_base else path_part
+            # 新文件按内容哈希命名存放于分片目录，旧文件仍在平铺目录中
+            store = get_content_store()
+            key = store.key_for_name(filename) or f"images/{filename}"
+            stat = await store.backend.stat(key)
+            if stat:
+                image_url = _public_url(key)
 
                 return {
                     "filename": filename,
-                    "path": file_path,
+                    "path": store.path_for(key),
                     "url": image_url,
-                    "size": stat.st_size,
-                    "created_at": stat.st_ctime
+                    "size": stat["size"],
+                    "created_at": stat["modified"]
                 }
             return None
         except Exception as e:
             logger.error(f"获取图片信息失败: {e}")
             return None
     
-    async def cleanup_old_images(self, max_age_hours: int = 24):
-        """清理旧图片文件"""
+    async def cleanup_old_images(self, max_age_hours: int = 24) -> int:
+        """回收写入超过 max_age_hours 的生成图片（按过期索引认领，不扫描目录），返回删除数"""
         try:
             import time
-            current_time = time.time()
-            max_age_seconds = max_age_hours * 3600
-            
-            for filename in os.listdir(self.output_dir):
-                file_path = os.path.join(self.output_dir, filename)
-                if os.path.isfile(file_path):
-                    file_age = current_time - os.path.getctime(file_path)
-                    if file_age > max_age_seconds:
-                        os.unlink(file_path)
-                        logger.info(f"清理旧图片: {filename}")
+            # 按登记的写入时间判断年龄（各文件保留期不同，如流式上传暂存文件只保留1小时）
+            return await get_expiry_index().reap_all(written_before=time.time() - max_age_hours * 3600)
         except Exception as e:
-            logger.error(f"清理旧图片失败: {e}")
\ No newline at end of file
+            logger.error(f"清理旧图片失败: {e}")
+            return 0
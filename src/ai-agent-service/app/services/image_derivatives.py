@@ -0,0 +1,157 @@
+"""
+生成图片后处理服务
+在进程池中为原图生成缩略图/预览图/全尺寸三档 WebP + JPEG 派生图并写入内容寻址存储，
+卡片列表与分享使用小图，PIL 编解码不占用事件循环。
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from ..storage import get_content_store
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+
+def _parse_sizes(spec: str) -> List[Tuple[str, Optional[int]]]:
+    """解析 "thumb:256,preview:768" 形式的档位配置，始终追加 full（原尺寸）"""
+    sizes: List[Tuple[str, Optional[int]]] = []
+    for item in spec.split(","):
+        name, _, value = item.strip().partition(":")
+        if name and value.isdigit() and name != "full":
+            sizes.append((name, int(value)))
+    sizes.append(("full", None))
+    return sizes
+
+
+def _build_derivatives(
+    source: Union[str, bytes],
+    sizes: List[Tuple[str, Optional[int]]],
+    webp_quality: int,
+    jpeg_quality: int
+) -> Dict[str, Any]:
+    """进程池任务：一次解码原图（本地路径或原始字节），按档位缩放并编码为 WebP/JPEG
+
+    返回 {"hash": 原图哈希, "variants": {档位: {"width", "height", "files": {格式: 编码后字节}}}}
+    """
+    from io import BytesIO
+    from PIL import Image
+
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source
+    digest = hashlib.sha256(data).hexdigest()[:16]
+
+    image = Image.open(BytesIO(data))
+    image.load()
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    variants: Dict[str, Any] = {}
+
+    for name, max_side in sizes:
+        resized = image
+        if max_side and max(image.size) > max_side:
+            resized = image.copy()
+            resized.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        files = {}
+        for fmt in FORMAT_EXTENSIONS:
+            frame = resized
+            if fmt == "jpeg" and frame.mode == "RGBA":
+                # JPEG不支持透明通道，铺白底
+                background = Image.new("RGB", frame.size, (255, 255, 255))
+                background.paste(frame, mask=frame.split()[-1])
+                frame = background
+            buffer = BytesIO()
+            if fmt == "webp":
+                frame.save(buffer, "WEBP", quality=webp_quality, method=4)
+            else:
+                frame.save(buffer, "JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+            files[fmt] = buffer.getvalue()
+
+        variants[name] = {"width": resized.size[0], "height": resized.size[1], "files": files}
+
+    return {"hash": digest, "variants": variants}
+
+
+class ImageDerivativeService:
+    """派生图生成服务（进程池执行）"""
+
+    def __init__(self):
+        self.enabled = os.getenv("IMAGE_DERIVATIVES", "on") == "on"
+        self.workers = int(os.getenv("IMAGE_DERIVATIVE_WORKERS", "2"))
+        self.sizes = _parse_sizes(os.getenv("IMAGE_DERIVATIVE_SIZES", "thumb:256,preview:768"))
+        self.webp_quality = int(os.getenv("IMAGE_DERIVATIVE_WEBP_QUALITY", "80"))
+        self.jpeg_quality = int(os.getenv("IMAGE_DERIVATIVE_JPEG_QUALITY", "85"))
+        self.timeout = float(os.getenv("IMAGE_DERIVATIVE_TIMEOUT", "30"))
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            logger.info(f"🧵 派生图进程池已启动: workers={self.workers}")
+        return self._pool
+
+    async def create_derivatives(self, storage_key: str) -> Optional[Dict[str, Any]]:
+        """为已存储的原图生成派生图，返回带URL的档位信息；失败返回None，不影响主流程"""
+        if not self.enabled or not storage_key:
+            return None
+
+        store = get_content_store()
+        loop = asyncio.get_event_loop()
+        try:
+            # 本地后端只向子进程传路径，避免跨进程拷贝原图；S3等后端传原图字节
+            source = await store.read_source(storage_key)
+            if source is None:
+                return None
+            raw = await asyncio.wait_for(
+                loop.run_in_executor(
+                    self._get_pool(),
+                    _build_derivatives,
+                    source,
+                    self.sizes,
+                    self.webp_quality,
+                    self.jpeg_quality
+                ),
+                timeout=self.timeout
+            )
+
+            result: Dict[str, Any] = {"hash": raw["hash"]}
+            for name, info in raw["variants"].items():
+                entry = {"width": info["width"], "height": info["height"]}
+                for fmt, data in info["files"].items():
+                    stored = await store.put_bytes(data, FORMAT_EXTENSIONS[fmt])
+                    entry[fmt] = stored["url"]
+                result[name] = entry
+        except Exception as e:
+            # 编码或写入存储失败都只放弃派生图（已写入的派生图无人引用，由GC回收）
+            logger.warning(f"⚠️ 派生图生成失败，仅保留原图: {e}")
+            return None
+
+        logger.info(f"🖼️ 派生图生成完成: {raw['hash']} ({', '.join(raw['variants'].keys())})")
+        return result
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+_derivative_service: Optional[ImageDerivativeService] = None
+
+
+def get_image_derivative_service() -> ImageDerivativeService:
+    """获取进程级派生图服务单例（进程池跨任务复用）"""
+    global _derivative_service
+    if _derivative_service is None:
+        _derivative_service = ImageDerivativeService()
+    return _derivative_service
@@ -0,0 +1,186 @@
+"""
+输入图片规范化服务
+用户上传的情绪图片（含任务内联的旧版 emotion_image_base64）在进程池中只解码一次：
+按EXIF方向摆正、缩放到分析所需的最长边、去除全部元数据并重新编码为 WebP，
+同时返回原始/输出尺寸与输出内容哈希。存储与下游大模型只接触规范化后的小图，PIL 编解码不占用事件循环。
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# 原始内容SHA-256 -> 规范化结果（Redis字符串，JSON），重复上传同一原图时跳过解码与规范化
+NORMALIZED_KEY_PREFIX = "upload:normalized:"
+
+
+class InvalidImage(ValueError):
+    """输入数据无法解码为图片"""
+    pass
+
+
+def _normalize_image(source: Union[str, bytes], max_side: int, quality: int, max_pixels: int) -> Dict[str, Any]:
+    """进程池任务：一次解码图片（本地路径或原始字节），摆正、缩放、去元数据并编码为 WebP
+
+    返回 {"data": WebP字节, "width", "height", "original_width", "original_height", "original_format",
+          "original_size", "hash"}
+    """
+    from io import BytesIO
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        image = Image.open(source if isinstance(source, str) else BytesIO(source))
+        original_size = image.size
+        original_format = image.format
+        # JPEG在解码阶段直接按2的幂缩小，避免先解出全尺寸像素
+        image.draft("RGB", (max_side, max_side))
+        image.load()
+    except Exception as e:
+        raise InvalidImage(f"图片解码失败: {e}") from e
+
+    # 方向信息只在EXIF中，摆正后随元数据一起丢弃
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    buffer = BytesIO()
+    # 不传 exif/icc_profile，输出不含任何元数据
+    image.save(buffer, "WEBP", quality=quality, method=4)
+    data = buffer.getvalue()
+
+    return {
+        "data": data,
+        "width": image.size[0],
+        "height": image.size[1],
+        "original_width": original_size[0],
+        "original_height": original_size[1],
+        "original_format": original_format,
+        "original_size": os.path.getsize(source) if isinstance(source, str) else len(source),
+        "hash": hashlib.sha256(data).hexdigest()
+    }
+
+
+class ImageNormalizer:
+    """输入图片规范化服务（进程池执行）"""
+
+    def __init__(self):
+        self.workers = int(os.getenv("IMAGE_NORMALIZE_WORKERS", "2"))
+        self.max_side = int(os.getenv("IMAGE_NORMALIZE_MAX_SIDE", "1024"))
+        self.quality = int(os.getenv("IMAGE_NORMALIZE_WEBP_QUALITY", "85"))
+        self.max_pixels = int(os.getenv("IMAGE_NORMALIZE_MAX_PIXELS", str(50 * 1000 * 1000)))
+        self.timeout = float(os.getenv("IMAGE_NORMALIZE_TIMEOUT", "20"))
+        # 规范化图片未被明信片引用时的保留时长
+        self.retention = int(os.getenv("CONTENT_STORE_UPLOAD_RETENTION", str(7 * 24 * 3600)))
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            logger.info(f"🧵 图片规范化进程池已启动: workers={self.workers}, max_side={self.max_side}")
+        return self._pool
+
+    async def normalize(self, source: Union[str, bytes]) -> Dict[str, Any]:
+        """规范化图片（本地文件路径只向子进程传路径）；无法解码时抛出 InvalidImage"""
+        loop = asyncio.get_event_loop()
+        result = await asyncio.wait_for(
+            loop.run_in_executor(
+                self._get_pool(), _normalize_image, source, self.max_side, self.quality, self.max_pixels
+            ),
+            timeout=self.timeout
+        )
+        logger.info(
+            f"🖼️ 图片规范化: {result['original_format']} {result['original_width']}x{result['original_height']}"
+            f" -> WEBP {result['width']}x{result['height']} ({len(result['data'])} 字节)"
+        )
+        return result
+
+    async def _lookup_normalized(self, store, raw_hash: str) -> Optional[Dict[str, Any]]:
+        """按原始内容哈希查找已保存的规范化结果；记录缺失或对象已被回收时返回None"""
+        try:
+            from ..utils.redis_client import get_async_redis_client
+
+            cached = await get_async_redis_client().get(f"{NORMALIZED_KEY_PREFIX}{raw_hash}")
+            if not cached:
+                return None
+            info = json.loads(cached)
+            # 推迟回收并确认对象仍存在
+            if not await store.retain(info["key"], self.retention):
+                return None
+            return info
+        except Exception as e:
+            logger.warning(f"⚠️ 查询规范化记录失败: {raw_hash[:12]} - {e}")
+            return None
+
+    async def _remember_normalized(self, raw_hash: str, info: Dict[str, Any]):
+        try:
+            from ..utils.redis_client import get_async_redis_client
+
+            await get_async_redis_client().set(
+                f"{NORMALIZED_KEY_PREFIX}{raw_hash}", json.dumps(info), ex=self.retention
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ 记录规范化结果失败: {raw_hash[:12]} - {e}")
+
+    async def normalize_and_store(self, store, raw_hash: str, source: Union[str, bytes]) -> Dict[str, Any]:
+        """规范化并按内容哈希保存；相同原始内容已保存过时直接复用，不再解码
+
+        Returns:
+            {"key", "url", "size", "width", "height", "original_width", "original_height",
+             "original_format", "original_size", "deduplicated"}
+        """
+        cached = await self._lookup_normalized(store, raw_hash)
+        if cached is not None:
+            logger.info(f"♻️ 原始内容已上传过，跳过规范化: {cached['key']}")
+            return {**cached, "url": store.url_for(cached["key"]), "deduplicated": True}
+
+        normalized = await self.normalize(source)
+        stored = await store.put_bytes(normalized["data"], "webp", retention=self.retention)
+        info = {
+            "key": stored["key"],
+            "size": stored["size"],
+            "width": normalized["width"],
+            "height": normalized["height"],
+            "original_width": normalized["original_width"],
+            "original_height": normalized["original_height"],
+            "original_format": normalized["original_format"],
+            "original_size": normalized["original_size"]
+        }
+        await self._remember_normalized(raw_hash, info)
+        return {**info, "url": stored["url"], "deduplicated": stored["deduplicated"]}
+
+    @staticmethod
+    def decode_base64(image_base64: str) -> bytes:
+        """解码base64图片（兼容 data:image/...;base64, 前缀）；格式错误时抛出 InvalidImage"""
+        if image_base64.startswith("data:"):
+            image_base64 = image_base64.partition(",")[2]
+        try:
+            return base64.b64decode(image_base64)
+        except (binascii.Error, ValueError) as e:
+            raise InvalidImage(f"base64解码失败: {e}") from e
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+_image_normalizer: Optional[ImageNormalizer] = None
+
+
+def get_image_normalizer() -> ImageNormalizer:
+    """获取进程级图片规范化服务单例（进程池跨请求复用）"""
+    global _image_normalizer
+    if _image_normalizer is None:
+        _image_normalizer = ImageNormalizer()
+    return _image_normalizer
@@ -0,0 +1,207 @@
+"""
+HTML截图渲染缓存
+按 (HTML, 视口宽高, 设备像素比, 格式, 质量) 的哈希记录已渲染截图在内容寻址存储中的对象键，
+相同卡片（重试、再次分享、相同数据重新生成）直接返回已有图片；并发的相同请求只渲染一次：
+同一进程内共享同一个渲染任务，跨进程通过Redis锁让后到者等待先到者的结果。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ENTRY_KEY_PREFIX = "render:cache:"
+LOCK_KEY_PREFIX = "render:lock:"
+STATS_KEY = "render:stats"
+
+
+class RenderCache:
+    """截图渲染缓存"""
+
+    def __init__(self):
+        self.enabled = os.getenv("RENDER_CACHE", "on") == "on"
+        self.ttl = int(os.getenv("RENDER_CACHE_TTL", str(7 * 86400)))
+        # 跨进程等待其他实例渲染的上限，应略大于单次渲染超时
+        self.lock_ttl = int(os.getenv("RENDER_CACHE_LOCK_TTL", "45"))
+        self.poll_interval = float(os.getenv("RENDER_CACHE_POLL_INTERVAL", "0.1"))
+
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def render_key(html: str, width: int, height: int, device_scale: float, format: str, quality: Optional[int]) -> str:
+        spec = json.dumps(
+            {"w": width, "h": height, "dpr": float(device_scale), "fmt": format, "q": quality},
+            sort_keys=True
+        )
+        digest = hashlib.sha256(spec.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(html.encode("utf-8"))
+        return digest.hexdigest()
+
+    async def get_or_render(
+        self,
+        cache_key: str,
+        render: Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+    ) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """返回 (存储结果, 是否复用已有渲染)；render 返回 put_bytes/put_file 的结果，失败返回None
+
+        render 抛出的异常会同时抛给合并到本次渲染的等待者；首个请求被取消（含调用方超时）时，
+        等待者不沿用其结果，而是各自重新发起渲染（仍会互相合并）。
+        """
+        if not self.enabled:
+            return await render(), False
+
+        hit = await self._lookup(cache_key)
+        if hit:
+            await self._count("hits")
+            logger.info(f"⚡ 截图缓存命中: {cache_key[:12]}")
+            return hit, True
+
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None:
+            await self._count("coalesced")
+            try:
+                stored = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    # 等待者自身被取消
+                    raise
+                logger.info(f"🔁 合并的截图渲染被取消，重新渲染: {cache_key[:12]}")
+                return await self.get_or_render(cache_key, render)
+            return stored, stored is not None
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[cache_key] = future
+        try:
+            stored, reused = await self._render_once(cache_key, render)
+        except Exception as e:
+            # 渲染异常（如调度器拒绝）原样传给等待者，与首个请求的处理一致
+            future.set_exception(e)
+            # 没有等待者时不产生 "exception was never retrieved" 告警
+            future.exception()
+            raise
+        else:
+            # 渲染失败返回None时等待者同样拿到None，由各自调用方降级
+            future.set_result(stored)
+            return stored, reused
+        finally:
+            # 首个请求被取消时没有结果可共享：作废共享任务，等待者自行重新渲染
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(cache_key, None)
+
+    async def _render_once(
+        self,
+        cache_key: str,
+        render: Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+    ) -> Tuple[Optional[Dict[str, Any]], bool]:
+        lock_key = f"{LOCK_KEY_PREFIX}{cache_key}"
+        token = uuid.uuid4().hex
+        acquired = False
+        try:
+            from ..utils.redis_client import get_async_redis_client
+
+            client = get_async_redis_client()
+            acquired = bool(await client.set(lock_key, token, nx=True, ex=self.lock_ttl))
+            if not acquired:
+                # 其他实例正在渲染同一内容：等待其结果，锁消失仍无结果时自行渲染
+                loop = asyncio.get_event_loop()
+                deadline = loop.time() + self.lock_ttl
+                while loop.time() < deadline:
+                    await asyncio.sleep(self.poll_interval)
+                    hit = await self._lookup(cache_key)
+                    if hit:
+                        await self._count("coalesced")
+                        return hit, True
+                    if not await client.exists(lock_key):
+                        break
+        except Exception as e:
+            logger.warning(f"⚠️ 截图缓存加锁失败，直接渲染: {e}")
+
+        try:
+            await self._count("misses")
+            stored = await render()
+            if stored:
+                await self._save(cache_key, stored)
+            return stored, False
+        finally:
+            if acquired:
+                try:
+                    if (await client.get(lock_key) or b"").decode() == token:
+                        await client.delete(lock_key)
+                except Exception as e:
+                    logger.warning(f"⚠️ 释放截图缓存锁失败: {e}")
+
+    async def _lookup(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        try:
+            from ..utils.redis_client import get_async_redis_client
+            from ..storage import get_content_store
+
+            client = get_async_redis_client()
+            raw = await client.get(f"{ENTRY_KEY_PREFIX}{cache_key}")
+            if not raw:
+                return None
+            entry = json.loads(raw)
+
+            store = get_content_store()
+            # 命中即续期并确认对象仍存在（可能已被引用释放后的GC回收）
+            if not await store.retain(entry["key"], self.ttl):
+                await client.delete(f"{ENTRY_KEY_PREFIX}{cache_key}")
+                return None
+            await client.expire(f"{ENTRY_KEY_PREFIX}{cache_key}", self.ttl)
+            return {
+                "key": entry["key"],
+                "hash": entry.get("hash"),
+                "path": store.path_for(entry["key"]),
+                "url": store.url_for(entry["key"]),
+                "size": entry.get("size"),
+                "deduplicated": True
+            }
+        except Exception as e:
+            logger.warning(f"⚠️ 截图缓存查询失败: {e}")
+            return None
+
+    async def _save(self, cache_key: str, stored: Dict[str, Any]):
+        try:
+            from ..utils.redis_client import get_async_redis_client
+            from ..storage import get_content_store
+
+            entry = {"key": stored["key"], "hash": stored.get("hash"), "size": stored.get("size")}
+            await get_async_redis_client().set(f"{ENTRY_KEY_PREFIX}{cache_key}", json.dumps(entry), ex=self.ttl)
+            # 未被任务引用的截图至少保留到缓存条目过期
+            await get_content_store().retain(stored["key"], self.ttl)
+        except Exception as e:
+            logger.warning(f"⚠️ 截图缓存写入失败: {e}")
+
+    async def _count(self, field: str):
+        try:
+            from ..utils.redis_client import get_async_redis_client
+
+            await get_async_redis_client().hincrby(STATS_KEY, field, 1)
+        except Exception:
+            pass
+
+    async def get_stats(self) -> Dict[str, Any]:
+        from ..utils.redis_client import get_async_redis_client
+
+        raw = await get_async_redis_client().hgetall(STATS_KEY)
+        stats = {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()}
+        requests = sum(stats.get(k, 0) for k in ("hits", "coalesced", "misses"))
+        stats["hit_rate"] = round((stats.get("hits", 0) + stats.get("coalesced", 0)) / requests, 3) if requests else 0.0
+        return stats
+
+
+_render_cache: Optional[RenderCache] = None
+
+
+def get_render_cache() -> RenderCache:
+    """获取进程级截图缓存单例（进行中的渲染需跨请求共享）"""
+    global _render_cache
+    if _render_cache is None:
+        _render_cache = RenderCache()
+    return _render_cache
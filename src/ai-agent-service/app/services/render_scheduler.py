@@ -0,0 +1,222 @@
+"""
+截图渲染调度器
+所有截图渲染（常驻渲染进程与单次Puppeteer降级）经固定数量的工作协程执行，突发请求不会同时拉起大量Chromium：
+- 有界优先队列：交互请求（API直接等待结果）优先于批量生成；队列满时交互请求立即拒绝，
+  批量任务只能占用部分队列并在队列有空位前等待（背压传递给生成流程）
+- 截止时间：任务出队时已超过截止时间则直接丢弃，调用方已放弃的任务同样跳过
+- 运行指标：各优先级排队深度、排队等待与执行耗时分位数、丢弃与拒绝次数
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# 计算分位数的最近样本数
+WINDOW_SIZE = 1000
+
+
+class RenderRejected(Exception):
+    """渲染任务未被执行（队列已满、超过截止时间或调度器关闭）"""
+    pass
+
+
+class RenderQueueFull(RenderRejected):
+    """渲染队列已满"""
+    pass
+
+
+class RenderDeadlineExceeded(RenderRejected):
+    """任务在队列中等待超过截止时间"""
+    pass
+
+
+class _Job:
+    __slots__ = ("run", "priority", "future", "enqueued_at", "expires_at")
+
+    def __init__(self, run: Callable[[], Awaitable[Any]], priority: str, future: asyncio.Future, expires_at: float):
+        self.run = run
+        self.priority = priority
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.expires_at = expires_at
+
+
+def _percentiles(samples: Deque[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {
+        f"p{p}_ms": round(ordered[min(last, int(len(ordered) * p / 100))] * 1000, 1)
+        for p in (50, 95, 99)
+    }
+
+
+class RenderScheduler:
+    """进程级截图渲染调度器"""
+
+    def __init__(self):
+        self.workers = max(1, int(os.getenv("RENDER_WORKERS", os.getenv("RENDER_POOL_SIZE", "4"))))
+        self.queue_max = max(1, int(os.getenv("RENDER_SCHEDULER_QUEUE_MAX", "64")))
+        # 批量任务最多占用的队列长度，其余空间留给交互请求
+        self.batch_queue_max = max(1, min(self.queue_max, int(os.getenv(
+            "RENDER_BATCH_QUEUE_MAX", str(max(1, self.queue_max // 2))
+        ))))
+        self.deadlines = {
+            "interactive": float(os.getenv("RENDER_INTERACTIVE_DEADLINE", "20")),
+            "batch": float(os.getenv("RENDER_BATCH_DEADLINE", "300"))
+        }
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._space: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._seq = itertools.count()
+
+        self._depth = {name: 0 for name in PRIORITIES}
+        self._waits = {name: deque(maxlen=WINDOW_SIZE) for name in PRIORITIES}
+        self._runs: Deque[float] = deque(maxlen=WINDOW_SIZE)
+        self.running = 0
+        self.counters = {"completed": 0, "failed": 0, "expired": 0, "abandoned": 0, "rejected": 0}
+
+    def _ensure_workers(self):
+        loop = asyncio.get_event_loop()
+        if self._loop is loop and self._tasks:
+            return
+        self._loop = loop
+        self._queue = asyncio.PriorityQueue()
+        self._space = asyncio.Event()
+        self._depth = {name: 0 for name in PRIORITIES}
+        self._tasks = [loop.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"🧵 截图渲染调度器启动: workers={self.workers}, queue_max={self.queue_max}")
+
+    def queue_depth(self) -> int:
+        return sum(self._depth.values())
+
+    async def submit(
+        self,
+        run: Callable[[], Awaitable[Any]],
+        priority: str = "interactive",
+        deadline: Optional[float] = None
+    ) -> Any:
+        """排队执行渲染并返回其结果；deadline为最长排队秒数（默认按优先级配置）"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知渲染优先级: {priority}")
+        self._ensure_workers()
+
+        loop = asyncio.get_event_loop()
+        expires_at = time.monotonic() + (deadline if deadline is not None else self.deadlines[priority])
+
+        if priority == "batch":
+            # 背压：批量任务等待队列腾出空间，超过截止时间放弃
+            while self.queue_depth() >= self.batch_queue_max:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    self.counters["expired"] += 1
+                    raise RenderDeadlineExceeded("批量渲染等待入队超时")
+                self._space.clear()
+                try:
+                    await asyncio.wait_for(self._space.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+        elif self.queue_depth() >= self.queue_max:
+            self.counters["rejected"] += 1
+            logger.warning(f"⚠️ 截图渲染队列已满({self.queue_depth()})，拒绝交互请求")
+            raise RenderQueueFull("渲染队列已满，请稍后重试")
+
+        job = _Job(run, priority, loop.create_future(), expires_at)
+        self._depth[priority] += 1
+        self._queue.put_nowait((PRIORITIES[priority], next(self._seq), job))
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            # 调用方放弃（如客户端断开）：排队中的任务出队时跳过
+            job.future.cancel()
+            raise
+
+    async def _worker(self, index: int):
+        while True:
+            _, _, job = await self._queue.get()
+            self._depth[job.priority] -= 1
+            self._space.set()
+
+            if job.future.done():
+                self.counters["abandoned"] += 1
+                continue
+            now = time.monotonic()
+            waited = now - job.enqueued_at
+            if now > job.expires_at:
+                self.counters["expired"] += 1
+                logger.warning(f"⚠️ 丢弃过期截图任务: {job.priority} 已排队{waited:.1f}s")
+                job.future.set_exception(RenderDeadlineExceeded(f"渲染任务排队{waited:.1f}s，超过截止时间"))
+                continue
+
+            self._waits[job.priority].append(waited)
+            self.running += 1
+            try:
+                result = await job.run()
+                self.counters["completed"] += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            except Exception as e:
+                self.counters["failed"] += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.set_exception(RenderRejected("渲染调度器已关闭"))
+                raise
+            finally:
+                self.running -= 1
+                self._runs.append(time.monotonic() - now)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queue_max": self.queue_max,
+            "batch_queue_max": self.batch_queue_max,
+            "queued": dict(self._depth),
+            "wait": {name: _percentiles(samples) for name, samples in self._waits.items()},
+            "run": _percentiles(self._runs),
+            **self.counters
+        }
+
+    async def close(self):
+        """停止工作协程，排队中的任务以拒绝结束"""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            _, _, job = self._queue.get_nowait()
+            if not job.future.done():
+                job.future.set_exception(RenderRejected("渲染调度器已关闭"))
+        self._depth = {name: 0 for name in PRIORITIES}
+
+
+_render_scheduler: Optional[RenderScheduler] = None
+
+
+def get_render_scheduler() -> RenderScheduler:
+    """获取进程级截图渲染调度器单例"""
+    global _render_scheduler
+    if _render_scheduler is None:
+        _render_scheduler = RenderScheduler()
+    return _render_scheduler
+
+
+async def close_render_scheduler():
+    global _render_scheduler
+    if _render_scheduler is not None:
+        await _render_scheduler.close()
+        _render_scheduler = None
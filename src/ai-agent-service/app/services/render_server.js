@@ -0,0 +1,300 @@
+/**
+ * HTML渲染常驻进程（Puppeteer页面池）
+ *
+ * 启动一次 Chromium 并预热 RENDER_POOL_SIZE 个页面，通过本地 Unix socket 接收渲染任务，
+ * 每行一个JSON请求/响应：
+ *   请求 {"id": 1, "op": "render", "html": "...", "width": 375, "height": 600, "device_scale": 1, "format": "png",
+ *         "quality": null, "timeout_ms": 30000}
+ *   响应 {"id": 1, "ok": true, "data": "<base64>", "elapsed_ms": 120}
+ * op 还支持 ping / stats。页面使用 RENDER_PAGE_MAX_USES 次或JS堆超过 RENDER_PAGE_MAX_HEAP_MB 后重建，
+ * 浏览器累计渲染 RENDER_BROWSER_MAX_RENDERS 次后换新进程（旧进程在其页面全部归还后关闭）。
+ * 并发渲染数不超过页面池大小，多余任务排队，队列超过 RENDER_QUEUE_LIMIT 时直接拒绝。
+ *
+ * 由 app/services/html_renderer.py 按需拉起；RENDER_EXIT_WITH_PARENT=1 时标准输入关闭（父进程退出）即退出。
+ * 同一 socket 已有渲染进程在监听时直接退出（多个worker共用一个渲染进程），只清理无人监听的遗留socket文件。
+ */
+
+const fs = require('fs');
+const net = require('net');
+const puppeteer = require('puppeteer');
+
+const SOCKET_PATH = process.env.RENDER_SOCKET_PATH || '/tmp/html-renderer.sock';
+const POOL_SIZE = parseInt(process.env.RENDER_POOL_SIZE || '4', 10);
+const PAGE_MAX_USES = parseInt(process.env.RENDER_PAGE_MAX_USES || '100', 10);
+const PAGE_MAX_HEAP_MB = parseFloat(process.env.RENDER_PAGE_MAX_HEAP_MB || '256');
+const BROWSER_MAX_RENDERS = parseInt(process.env.RENDER_BROWSER_MAX_RENDERS || '2000', 10);
+const QUEUE_LIMIT = parseInt(process.env.RENDER_QUEUE_LIMIT || '100', 10);
+
+let browser = null;
+let launching = null;
+let browserRenders = 0;
+const openPages = new Map();  // browser -> 打开的页面数
+
+const slots = Array.from({ length: POOL_SIZE }, (_, i) => ({ index: i, page: null, browser: null, uses: 0 }));
+const idle = [...slots];
+const waiters = [];
+
+const stats = { renders: 0, errors: 0, rejected: 0, page_recycles: 0, browser_restarts: 0, started_at: Date.now() };
+
+function log(message) {
+  console.log(`${new Date().toISOString()} - render_server - ${message}`);
+}
+
+async function getBrowser() {
+  if (browser && browser.isConnected()) return browser;
+  if (!launching) {
+    launching = puppeteer.launch({
+      headless: true,
+      args: ['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
+    }).then((b) => {
+      browser = b;
+      browserRenders = 0;
+      b.on('disconnected', () => {
+        openPages.delete(b);
+        if (browser === b) browser = null;
+      });
+      return b;
+    }).finally(() => {
+      launching = null;
+    });
+  }
+  return launching;
+}
+
+function retireBrowser() {
+  // 新任务改用新浏览器；旧浏览器在最后一个页面关闭时退出
+  const old = browser;
+  browser = null;
+  browserRenders = 0;
+  stats.browser_restarts += 1;
+  if (old && !openPages.get(old)) old.close().catch(() => {});
+  log(`♻️ 浏览器达到 ${BROWSER_MAX_RENDERS} 次渲染，切换新进程`);
+}
+
+async function openPage(slot) {
+  const b = await getBrowser();
+  slot.page = await b.newPage();
+  slot.browser = b;
+  slot.uses = 0;
+  openPages.set(b, (openPages.get(b) || 0) + 1);
+}
+
+async function closePage(slot) {
+  const { page, browser: b } = slot;
+  slot.page = null;
+  slot.browser = null;
+  if (!page) return;
+  try {
+    await page.close();
+  } catch (e) {
+    // 浏览器已退出时页面随之关闭
+  }
+  const left = (openPages.get(b) || 1) - 1;
+  if (left > 0) {
+    openPages.set(b, left);
+  } else {
+    openPages.delete(b);
+    if (b !== browser && b.isConnected()) b.close().catch(() => {});
+  }
+}
+
+function acquire() {
+  if (idle.length) return Promise.resolve(idle.pop());
+  if (waiters.length >= QUEUE_LIMIT) {
+    stats.rejected += 1;
+    return Promise.reject(new Error('render queue full'));
+  }
+  return new Promise((resolve) => waiters.push(resolve));
+}
+
+function release(slot) {
+  const next = waiters.shift();
+  if (next) next(slot);
+  else idle.push(slot);
+}
+
+async function heapMb(page) {
+  try {
+    const metrics = await page.metrics();
+    return metrics.JSHeapUsedSize / (1024 * 1024);
+  } catch (e) {
+    return 0;
+  }
+}
+
+async function render(job) {
+  const width = job.width || 375;
+  const height = job.height || 600;
+  const type = job.format === 'jpg' || job.format === 'jpeg' ? 'jpeg' : (job.format === 'webp' ? 'webp' : 'png');
+  const timeout = job.timeout_ms || 30000;
+  const deviceScaleFactor = job.device_scale || 1;
+
+  const slot = await acquire();
+  try {
+    if (!slot.page || slot.page.isClosed() || !slot.browser.isConnected() || slot.browser !== browser) {
+      await closePage(slot);
+      await openPage(slot);
+    }
+    const page = slot.page;
+    await page.setViewport({ width, height, deviceScaleFactor });
+    await page.setContent(job.html, { waitUntil: 'networkidle0', timeout });
+    const options = { type, encoding: 'base64', fullPage: false, clip: { x: 0, y: 0, width, height } };
+    if (type !== 'png' && job.quality) options.quality = job.quality;
+    const data = await page.screenshot(options);
+
+    slot.uses += 1;
+    stats.renders += 1;
+    // 只统计当前浏览器的渲染次数，已退役浏览器上的收尾任务不再触发切换
+    const current = slot.browser === browser;
+    if (slot.uses >= PAGE_MAX_USES || (await heapMb(page)) > PAGE_MAX_HEAP_MB) {
+      stats.page_recycles += 1;
+      await closePage(slot);
+    }
+    if (current && ++browserRenders >= BROWSER_MAX_RENDERS) retireBrowser();
+    return data;
+  } catch (e) {
+    stats.errors += 1;
+    // 出错的页面状态不可信，直接丢弃
+    await closePage(slot);
+    throw e;
+  } finally {
+    release(slot);
+  }
+}
+
+function reply(socket, body) {
+  if (!socket.destroyed) socket.write(JSON.stringify(body) + '\n');
+}
+
+async function handle(socket, line) {
+  let request;
+  try {
+    request = JSON.parse(line);
+  } catch (e) {
+    reply(socket, { ok: false, error: 'invalid json' });
+    return;
+  }
+
+  const id = request.id;
+  const op = request.op || 'render';
+  if (op === 'ping') {
+    reply(socket, { id, ok: true });
+    return;
+  }
+  if (op === 'stats') {
+    reply(socket, {
+      id,
+      ok: true,
+      stats: Object.assign({}, stats, {
+        pool_size: POOL_SIZE,
+        idle: idle.length,
+        queued: waiters.length,
+        browser_renders: browserRenders,
+        rss_mb: Math.round(process.memoryUsage().rss / (1024 * 1024))
+      })
+    });
+    return;
+  }
+
+  const started = Date.now();
+  try {
+    const data = await render(request);
+    reply(socket, { id, ok: true, data, elapsed_ms: Date.now() - started });
+  } catch (e) {
+    reply(socket, { id, ok: false, error: e.message, elapsed_ms: Date.now() - started });
+  }
+}
+
+const server = net.createServer((socket) => {
+  let buffer = '';
+  socket.setEncoding('utf8');
+  socket.on('data', (chunk) => {
+    buffer += chunk;
+    let newline;
+    while ((newline = buffer.indexOf('\n')) >= 0) {
+      const line = buffer.slice(0, newline);
+      buffer = buffer.slice(newline + 1);
+      if (line.trim()) handle(socket, line);
+    }
+  });
+  socket.on('error', () => {});
+});
+
+let listening = false;
+
+async function shutdown() {
+  log('🛑 渲染进程退出');
+  server.close();
+  // 只清理自己监听的socket，未能监听（其他渲染进程在服务）时不动它
+  if (listening) {
+    try {
+      fs.unlinkSync(SOCKET_PATH);
+    } catch (e) {
+      // 已被清理
+    }
+  }
+  const browsers = new Set(openPages.keys());
+  if (browser) browsers.add(browser);
+  await Promise.all([...browsers].map((b) => b.close().catch(() => {})));
+  process.exit(0);
+}
+
+process.on('SIGTERM', shutdown);
+process.on('SIGINT', shutdown);
+if (process.env.RENDER_EXIT_WITH_PARENT === '1') {
+  process.stdin.on('end', shutdown);
+  process.stdin.resume();
+}
+
+// socket 上是否有渲染进程在接受连接（连接被拒绝或文件不存在说明是上次异常退出遗留的文件或没有文件）
+function socketAlive() {
+  return new Promise((resolve) => {
+    const probe = net.connect(SOCKET_PATH);
+    probe.once('connect', () => {
+      probe.destroy();
+      resolve(true);
+    });
+    probe.once('error', () => resolve(false));
+  });
+}
+
+function listen() {
+  return new Promise((resolve, reject) => {
+    server.once('error', reject);
+    server.listen(SOCKET_PATH, () => {
+      server.removeListener('error', reject);
+      resolve();
+    });
+  });
+}
+
+async function alreadyServed() {
+  if (!(await socketAlive())) return false;
+  // 多个worker几乎同时拉起渲染进程时，先监听的进程继续服务，后到者退出而不抢占其socket
+  log(`ℹ️ 已有渲染进程在监听 ${SOCKET_PATH}，本进程退出`);
+  await shutdown();
+  return true;
+}
+
+(async () => {
+  if (await alreadyServed()) return;
+
+  // 预热页面池，首个请求无需等待浏览器冷启动
+  await Promise.all(slots.map((slot) => openPage(slot)));
+
+  try {
+    await listen();
+  } catch (e) {
+    if (e.code !== 'EADDRINUSE') throw e;
+    if (await alreadyServed()) return;
+    // 无人监听：清理上次异常退出遗留的socket文件后重新监听
+    fs.unlinkSync(SOCKET_PATH);
+    await listen();
+  }
+  listening = true;
+  fs.chmodSync(SOCKET_PATH, 0o600);
+  log(`✅ 渲染进程就绪: socket=${SOCKET_PATH} pool=${POOL_SIZE} page_max_uses=${PAGE_MAX_USES}`);
+})().catch((e) => {
+  log(`❌ 渲染进程启动失败: ${e.message}`);
+  process.exit(1);
+});
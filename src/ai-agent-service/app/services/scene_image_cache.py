@@ -0,0 +1,333 @@
+"""
+场景背景图语义缓存
+把 art_direction / oracle_theme 中的场景、配色与光影描述规范化为视觉键，每个键保存若干张已生成的背景图，
+按配置比例直接复用缓存图而不调用图片模型；预热任务按需求热度为常见视觉键补齐变体。
+
+运行预热：python -m app.services.scene_image_cache --limit 20 --variants 2
+"""
+
+import argparse
+import asyncio
+import colorsys
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_KEY_PREFIX = "scene:variants:"
+DEMAND_KEY = "scene:demand"
+PARAMS_KEY = "scene:params"
+STATS_KEY = "scene:stats"
+EXPIRY_KEY = "scene:expiry"
+WARM_LOCK_KEY = "scene:warm:lock"
+
+# 认领一批过期视觉键：取出并移除（多实例并发清理也不会重复处理）
+CLAIM_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #expired > 0 then
+    redis.call('ZREM', KEYS[1], unpack(expired))
+end
+return expired
+"""
+
+HUE_NAMES = [
+    "red", "orange", "yellow", "lime", "green", "teal",
+    "cyan", "azure", "blue", "violet", "magenta", "rose"
+]
+
+# 光影/天气描述归并为有限的氛围词
+MOOD_KEYWORDS = {
+    "dawn": ["晨", "曦", "日出", "朝", "黎明"],
+    "dusk": ["夕", "黄昏", "落日", "晚霞", "暮"],
+    "night": ["夜", "月", "星"],
+    "rain": ["雨"],
+    "snow": ["雪", "霜"],
+    "mist": ["雾", "霭", "朦", "模糊", "烟"],
+    "wind": ["风"],
+    "glow": ["光", "晕", "阳", "暖"],
+}
+
+
+# 场景描述（大模型自由文本）归并为有限的场景类别，视觉键不包含原文
+SCENE_KEYWORDS = {
+    "mountain": ["山", "峰", "岭", "崖", "峦"],
+    "water": ["湖", "河", "江", "溪", "泉", "瀑", "池", "潭", "水"],
+    "sea": ["海", "浪", "潮", "岸", "沙滩"],
+    "forest": ["林", "森", "树", "竹", "松"],
+    "flower": ["花", "樱", "梅", "荷", "莲"],
+    "field": ["田", "野", "草", "原", "麦"],
+    "sky": ["天", "云", "虹", "空"],
+    "garden": ["园", "庭", "院", "径", "石"],
+    "city": ["城", "街", "巷", "楼", "桥", "灯"],
+    "indoor": ["窗", "室", "屋", "茶", "书", "桌"],
+}
+
+
+def scene_categories(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKC", str(text or ""))
+    categories = [name for name, words in SCENE_KEYWORDS.items() if any(word in text for word in words)]
+    return sorted(categories) or ["open"]
+
+
+def color_family(hex_color: str) -> str:
+    """将十六进制颜色归入 色相-明度 档位（如 azure-pale），低饱和度归为 neutral"""
+    value = str(hex_color or "").strip().lstrip("#")
+    if len(value) == 3:
+        value = "".join(ch * 2 for ch in value)
+    try:
+        r, g, b = (int(value[i:i + 2], 16) / 255.0 for i in (0, 2, 4))
+    except ValueError:
+        return "unknown"
+
+    hue, lightness, saturation = colorsys.rgb_to_hls(r, g, b)
+    band = "dark" if lightness < 0.35 else "pale" if lightness > 0.75 else "mid"
+    if saturation < 0.15:
+        return f"neutral-{band}"
+    return f"{HUE_NAMES[int(((hue * 360) + 15) % 360 // 30)]}-{band}"
+
+
+def mood_tokens(text: str) -> List[str]:
+    text = str(text or "")
+    tokens = [mood for mood, words in MOOD_KEYWORDS.items() if any(word in text for word in words)]
+    return sorted(tokens) or ["plain"]
+
+
+class SceneImageCache:
+    """场景背景图缓存（Redis）"""
+
+    def __init__(self):
+        self.enabled = os.getenv("SCENE_CACHE", "off") == "on"
+        # 视觉键已有足够变体时，按该比例直接复用缓存图
+        self.serve_rate = float(os.getenv("SCENE_CACHE_SERVE_RATE", "0.3"))
+        self.min_variants = int(os.getenv("SCENE_CACHE_MIN_VARIANTS", "2"))
+        self.max_variants = int(os.getenv("SCENE_CACHE_MAX_VARIANTS", "4"))
+        self.ttl = int(os.getenv("SCENE_CACHE_TTL", str(30 * 86400)))
+        # 后台预热间隔（秒），0表示只通过命令行手动预热
+        self.warm_interval = int(os.getenv("SCENE_CACHE_WARM_INTERVAL", "0"))
+        self.warm_limit = int(os.getenv("SCENE_CACHE_WARM_LIMIT", "20"))
+        # 过期视觉键清理间隔（秒）：释放其变体图片引用并删除需求/参数记录
+        self.sweep_interval = int(os.getenv("SCENE_CACHE_SWEEP_INTERVAL", "3600"))
+        self.sweep_batch = int(os.getenv("SCENE_CACHE_SWEEP_BATCH", "200"))
+
+        self._claim_script = None
+
+    def visual_params(self, natural_scene: str, palette: List[str], animation_hint: str) -> Dict[str, Any]:
+        return {
+            "natural_scene": natural_scene,
+            "palette": list(palette or [])[:3],
+            "animation_hint": animation_hint
+        }
+
+    def visual_key(self, params: Dict[str, Any]) -> str:
+        """规范化视觉参数：场景文本归入场景类别、配色归入色系（与顺序无关）、光影归并为氛围词"""
+        normalized = {
+            "scene": scene_categories(params.get("natural_scene")),
+            "palette": sorted(color_family(c) for c in params.get("palette", [])),
+            "mood": mood_tokens(f"{params.get('natural_scene', '')}{params.get('animation_hint', '')}")
+        }
+        digest = hashlib.sha1(json.dumps(normalized, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        return digest[:20]
+
+    async def lookup(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """记录需求热度；视觉键变体充足时按比例返回一个缓存变体"""
+        if not self.enabled:
+            return None
+        vkey = self.visual_key(params)
+        try:
+            from ..utils.redis_client import get_async_redis_client
+
+            pipe = get_async_redis_client().pipeline(transaction=False)
+            pipe.zincrby(DEMAND_KEY, 1, vkey)
+            pipe.hsetnx(PARAMS_KEY, vkey, json.dumps(params, ensure_ascii=False))
+            pipe.lrange(f"{VARIANTS_KEY_PREFIX}{vkey}", 0, -1)
+            pipe.hincrby(STATS_KEY, "lookups", 1)
+            # 最近一次需求后 ttl 秒内无访问则由清理任务整体删除
+            pipe.zadd(EXPIRY_KEY, {vkey: time.time() + self.ttl})
+            _, _, raw_variants, _, _ = await pipe.execute()
+
+            if len(raw_variants) < self.min_variants or random.random() >= self.serve_rate:
+                return None
+
+            entry = json.loads(random.choice(raw_variants))
+            await get_async_redis_client().hincrby(STATS_KEY, "hits", 1)
+            logger.info(f"⚡ 场景图缓存命中: {vkey}（{len(raw_variants)} 个变体）")
+            return entry
+        except Exception as e:
+            logger.warning(f"⚠️ 场景图缓存查询失败: {e}")
+            return None
+
+    async def store(self, params: Dict[str, Any], entry: Dict[str, Any]):
+        """保存一张真实生成的背景图为该视觉键的变体，超出上限时淘汰最旧的变体"""
+        if not self.enabled or not entry.get("image_url"):
+            return
+        vkey = self.visual_key(params)
+        owner = f"scene-cache:{vkey}"
+        try:
+            from ..utils.redis_client import get_async_redis_client
+            from ..storage import get_content_store
+
+            entry = dict(entry, created_at=time.time())
+            list_key = f"{VARIANTS_KEY_PREFIX}{vkey}"
+            pipe = get_async_redis_client().pipeline(transaction=False)
+            pipe.lpush(list_key, json.dumps(entry, ensure_ascii=False))
+            pipe.lrange(list_key, self.max_variants, -1)
+            pipe.ltrim(list_key, 0, self.max_variants - 1)
+            pipe.zadd(EXPIRY_KEY, {vkey: time.time() + self.ttl})
+            pipe.hsetnx(PARAMS_KEY, vkey, json.dumps(params, ensure_ascii=False))
+            pipe.hincrby(STATS_KEY, "stored", 1)
+            _, evicted, *_ = await pipe.execute()
+
+            # 缓存自身持有对图片的引用，避免被存储GC回收；淘汰或视觉键过期时释放
+            store = get_content_store()
+            await store.add_references(owner, store.keys_in(entry))
+            if evicted:
+                await store.remove_references(owner, store.keys_in([json.loads(item) for item in evicted]))
+        except Exception as e:
+            logger.warning(f"⚠️ 场景图缓存写入失败: {e}")
+
+    async def sweep_expired(self) -> int:
+        """删除超过 ttl 未被访问的视觉键：变体列表、需求热度与参数记录，并释放变体图片的引用，返回清理的键数"""
+        from ..utils.redis_client import get_async_redis_client
+        from ..storage import get_content_store
+
+        client = get_async_redis_client()
+        if self._claim_script is None:
+            self._claim_script = client.register_script(CLAIM_SCRIPT)
+        store = get_content_store()
+        swept = 0
+        while True:
+            expired = await self._claim_script(keys=[EXPIRY_KEY], args=[time.time(), self.sweep_batch])
+            vkeys = [k.decode("utf-8") if isinstance(k, bytes) else k for k in expired or []]
+            if not vkeys:
+                break
+            pipe = client.pipeline(transaction=False)
+            pipe.delete(*[f"{VARIANTS_KEY_PREFIX}{vkey}" for vkey in vkeys])
+            pipe.zrem(DEMAND_KEY, *vkeys)
+            pipe.hdel(PARAMS_KEY, *vkeys)
+            await pipe.execute()
+            for vkey in vkeys:
+                await store.release_owner(f"scene-cache:{vkey}")
+            swept += len(vkeys)
+        if swept:
+            logger.info(f"🧹 场景图缓存清理: 删除 {swept} 个过期视觉键")
+        return swept
+
+    async def run_sweep_loop(self):
+        """后台清理循环：定期删除过期视觉键并释放其图片引用"""
+        if not self.enabled or self.sweep_interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.sweep_interval * random.uniform(0.8, 1.2))
+            try:
+                await self.sweep_expired()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ 场景图缓存清理失败: {e}")
+
+    async def variant_count(self, vkey: str) -> int:
+        from ..utils.redis_client import get_async_redis_client
+
+        return await get_async_redis_client().llen(f"{VARIANTS_KEY_PREFIX}{vkey}")
+
+    async def warm(
+        self,
+        generate: Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]],
+        limit: int = 20,
+        target_variants: Optional[int] = None
+    ) -> int:
+        """按需求热度为最常见的视觉键补齐变体，返回新生成的图片数"""
+        from ..utils.redis_client import get_async_redis_client
+
+        client = get_async_redis_client()
+        target_variants = target_variants or self.min_variants
+        generated = 0
+
+        for raw_key in await client.zrevrange(DEMAND_KEY, 0, limit - 1):
+            vkey = raw_key.decode("utf-8") if isinstance(raw_key, bytes) else raw_key
+            raw_params = await client.hget(PARAMS_KEY, vkey)
+            if not raw_params:
+                continue
+            params = json.loads(raw_params)
+
+            missing = target_variants - await self.variant_count(vkey)
+            for _ in range(max(0, missing)):
+                entry = await generate(params)
+                if not entry:
+                    break
+                await self.store(params, entry)
+                generated += 1
+
+        logger.info(f"🔥 场景图缓存预热完成: 新增 {generated} 张")
+        return generated
+
+    async def run_warm_loop(self):
+        """后台预热循环：多实例通过Redis锁保证同一时间只有一个实例在预热"""
+        if not self.enabled or self.warm_interval <= 0:
+            return
+        from ..utils.redis_client import get_async_redis_client
+        from ..orchestrator.steps.image_generator import ImageGenerator
+
+        generator = ImageGenerator()
+        logger.info(f"🔥 场景图缓存预热已启动: interval={self.warm_interval}s, limit={self.warm_limit}")
+        while True:
+            await asyncio.sleep(self.warm_interval * random.uniform(0.8, 1.2))
+            try:
+                if await get_async_redis_client().set(WARM_LOCK_KEY, os.getpid(), nx=True, ex=self.warm_interval):
+                    await self.warm(generator.generate_scene_entry, limit=self.warm_limit)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ 场景图缓存预热失败: {e}")
+
+    async def get_stats(self) -> Dict[str, Any]:
+        from ..utils.redis_client import get_async_redis_client
+
+        client = get_async_redis_client()
+        raw = await client.hgetall(STATS_KEY)
+        stats = {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()}
+        lookups = stats.get("lookups", 0)
+        stats["hit_rate"] = round(stats.get("hits", 0) / lookups, 3) if lookups else 0.0
+        stats["keys"] = await client.zcard(DEMAND_KEY)
+        return stats
+
+
+_scene_cache: Optional[SceneImageCache] = None
+
+
+def get_scene_image_cache() -> SceneImageCache:
+    """获取进程级场景图缓存单例"""
+    global _scene_cache
+    if _scene_cache is None:
+        _scene_cache = SceneImageCache()
+    return _scene_cache
+
+
+async def _run_warm(limit: int, variants: int):
+    from ..orchestrator.steps.image_generator import ImageGenerator
+
+    cache = get_scene_image_cache()
+    cache.enabled = True
+    generator = ImageGenerator()
+    await cache.warm(generator.generate_scene_entry, limit=limit, target_variants=variants)
+    print(json.dumps(await cache.get_stats(), ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="场景背景图缓存预热")
+    parser.add_argument("--limit", type=int, default=20, help="按需求热度预热的视觉键数量")
+    parser.add_argument("--variants", type=int, default=None, help="每个视觉键的目标变体数")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(_run_warm(args.limit, args.variants))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+# 生成产物存储
+
+from .base import StorageBackend
+from .factory import create_storage_backend, get_storage, close_storage
+from .content_store import ContentStore, UploadTooLarge, get_content_store
+from .expiry_index import ExpiryIndex, get_expiry_index
+
+__all__ = [
+    'StorageBackend',
+    'create_storage_backend',
+    'get_storage',
+    'close_storage',
+    'ContentStore',
+    'UploadTooLarge',
+    'get_content_store',
+    'ExpiryIndex',
+    'get_expiry_index',
+]
@@ -0,0 +1,95 @@
+"""
+对象存储后端接口
+"""
+
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, Optional
+
+
+class StorageBackend(ABC):
+    """对象存储后端基类
+
+    对象键为 "/" 分隔的相对路径（如 cas/ab/cd/<sha256>.png、images/xxx.png），
+    服务实例不持有任何本地状态，多实例共享同一后端即可水平扩展。
+    只有本地后端的对象有本机路径（local_path），其余后端的读取一律经 get/stream。
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @abstractmethod
+    async def put(self, key: str, data: bytes, content_type: Optional[str] = None):
+        """写入对象（覆盖同名对象）"""
+        pass
+
+    @abstractmethod
+    async def put_file(self, key: str, source_path: str, content_type: Optional[str] = None):
+        """写入本地文件并删除源文件（按块传输，不整体读入内存）"""
+        pass
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        """读取完整对象，不存在返回None"""
+        pass
+
+    @abstractmethod
+    def stream(self, key: str, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """按块异步读取对象（不存在时抛出 FileNotFoundError）"""
+        pass
+
+    @abstractmethod
+    async def stat(self, key: str) -> Optional[Dict[str, Any]]:
+        """对象元信息 {"size", "modified", "content_type"}，不存在返回None"""
+        pass
+
+    async def exists(self, key: str) -> bool:
+        return await self.stat(key) is not None
+
+    @abstractmethod
+    async def delete(self, key: str) -> bool:
+        """删除对象，返回是否实际删除"""
+        pass
+
+    @abstractmethod
+    def url_for(self, key: str) -> str:
+        """对象的公开访问URL（经 ai-agent-service 的 /static/generated 路由）"""
+        pass
+
+    @abstractmethod
+    def signed_url(self, key: str, expires_in: int = 3600) -> str:
+        """带时效的直连URL（不经过服务实例）"""
+        pass
+
+    def local_path(self, key: str) -> Optional[str]:
+        """对象在本机磁盘上的路径，供子进程或文件响应直接读取（免一次拷贝）
+
+        S3等非本地后端返回None，写入结果中的 "path" 与接口返回的 image_path 随之为None，
+        调用方必须回退为 get/stream 读取内容（ContentStore.read_source 已封装该回退）。
+        本地路径对应的文件也可能已被GC删除，使用前同样需要处理文件不存在。
+        """
+        return None
+
+    async def close(self):
+        pass
+
+
+def guess_content_type(key: str) -> str:
+    import mimetypes
+
+    content_type, _ = mimetypes.guess_type(key)
+    if content_type:
+        return content_type
+    if key.endswith(".webp"):
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def normalize_key(key: str) -> str:
+    """规范化对象键并拒绝目录穿越"""
+    parts = [p for p in key.replace("\\", "/").split("/") if p not in ("", ".")]
+    if not parts or any(p == ".." for p in parts):
+        raise ValueError(f"非法的对象键: {key}")
+    return "/".join(parts)
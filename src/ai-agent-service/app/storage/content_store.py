@@ -0,0 +1,442 @@
+"""
+内容寻址存储
+生成图片、HTML截图和上传图片按内容哈希命名并分散到哈希前缀子目录，相同内容只存一份；
+Redis记录明信片任务对对象的引用，后台GC分批回收无引用对象。对象实际读写经由存储后端（本地磁盘/S3）。
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Set, Union
+
+from .factory import get_storage
+
+logger = logging.getLogger(__name__)
+
+CAS_PREFIX = "cas"
+
+# Redis键约定（postcard-service 删除明信片时向 RELEASED_OWNERS_KEY 写入 task_id）
+REFS_KEY_PREFIX = "cas:refs:"          # 集合：对象键 -> 引用它的任务ID
+OWNER_KEY_PREFIX = "cas:owner:"        # 集合：任务ID -> 其引用的对象键
+GC_CANDIDATES_KEY = "cas:gc"           # 有序集合：对象键 -> 可回收时间戳
+RELEASED_OWNERS_KEY = "cas:released_owners"
+DELETING_KEY_PREFIX = "cas:deleting:"  # 字符串（带过期）：GC已认领、尚未删除完成的对象键
+
+# 上传内容的不透明引用（blob:<sha256>.<ext>），任务消息只携带引用，由worker从存储读取原始字节
+BLOB_REF_PREFIX = "blob:"
+
+# 流式暂存时攒够该字节数再写盘（线程池中执行）
+STAGE_FLUSH_SIZE = 1024 * 1024
+
+KEY_PATTERN = re.compile(r"/generated/(" + CAS_PREFIX + r"/(?:[0-9a-f]{2}/)*[0-9a-f]{64}\.[a-z0-9]{1,8})(?![a-z0-9])")
+
+# 解除某任务的全部引用，引用归零的对象进入GC候选（GT：不缩短已登记的保留期）
+RELEASE_SCRIPT = """
+local owner_key = KEYS[1]
+local gc_key = KEYS[2]
+local refs_prefix = ARGV[1]
+local owner = ARGV[2]
+local eligible_at = ARGV[3]
+
+local members = redis.call('SMEMBERS', owner_key)
+for _, key in ipairs(members) do
+    local refs_key = refs_prefix .. key
+    redis.call('SREM', refs_key, owner)
+    if redis.call('SCARD', refs_key) == 0 then
+        redis.call('ZADD', gc_key, 'GT', eligible_at, key)
+    end
+end
+redis.call('DEL', owner_key)
+return #members
+"""
+
+# 认领一批到期候选：出队并返回其中仍无引用的对象键（多实例并发执行也不会重复删除）；
+# 认领的对象标记为删除中，写入方在标记清除前不会把它当作已存在内容复用
+CLAIM_SCRIPT = """
+local gc_key = KEYS[1]
+local now = tonumber(ARGV[1])
+local batch = tonumber(ARGV[2])
+local refs_prefix = ARGV[3]
+local deleting_prefix = ARGV[4]
+local deleting_ttl = tonumber(ARGV[5])
+
+local candidates = redis.call('ZRANGEBYSCORE', gc_key, '-inf', now, 'LIMIT', 0, batch)
+local orphans = {}
+for _, key in ipairs(candidates) do
+    redis.call('ZREM', gc_key, key)
+    if redis.call('SCARD', refs_prefix .. key) == 0 then
+        redis.call('SET', deleting_prefix .. key, '1', 'EX', deleting_ttl)
+        table.insert(orphans, key)
+    end
+end
+return orphans
+"""
+
+
+class UploadTooLarge(Exception):
+    """流式写入超过大小上限（已读取的部分已丢弃）"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"内容超过大小上限 {max_size} 字节")
+        self.max_size = max_size
+
+
+class ContentStore:
+    """内容寻址存储
+
+    对象键形如 cas/ab/cd/<sha256>.<ext>，通过 /static/generated 或 /generated 对外访问。
+    新写入对象先登记为GC候选（宽限期内不回收），被任务引用后GC认领时会跳过。
+    复用已有内容时先登记再确认存在：登记之后GC不会再认领该对象，已被认领的等待删除完成后重新写入。
+    """
+
+    def __init__(self):
+        self.backend = get_storage()
+        self.shard_depth = int(os.getenv("CONTENT_STORE_SHARD_DEPTH", "2"))
+
+        self.refs_enabled = os.getenv("CONTENT_STORE_REFS", "on") == "on"
+        # 未被任何任务引用的新对象保留时长
+        self.gc_grace = int(os.getenv("CONTENT_STORE_GC_GRACE", "86400"))
+        # 引用全部解除后再保留的时长（便于误删恢复、CDN回源）
+        self.release_grace = int(os.getenv("CONTENT_STORE_RELEASE_GRACE", "3600"))
+        self.gc_interval = float(os.getenv("CONTENT_STORE_GC_INTERVAL", "300"))
+        self.gc_batch = int(os.getenv("CONTENT_STORE_GC_BATCH", "200"))
+        # 单批对象删除的时间上限：删除中标记的过期时间，也是写入方等待删除完成的上限
+        self.gc_delete_timeout = int(os.getenv("CONTENT_STORE_GC_DELETE_TIMEOUT", "30"))
+        # 流式上传的暂存目录：本地后端放在存储根目录下，提交时同盘rename
+        self.staging_dir = os.getenv("CONTENT_STORE_STAGING_DIR") or os.path.join(
+            getattr(self.backend, "root", None) or tempfile.gettempdir(), ".staging"
+        )
+
+        self._release_script = None
+        self._claim_script = None
+
+    # ---------- 键与路径 ----------
+
+    def key_for(self, digest: str, ext: str) -> str:
+        # 扩展名可能来自客户端输入，只保留字母数字
+        ext = "".join(c for c in ext.lower() if c.isalnum())[:8] or "bin"
+        shards = [digest[i * 2:i * 2 + 2] for i in range(self.shard_depth)]
+        return "/".join([CAS_PREFIX, *shards, f"{digest}.{ext}"])
+
+    def key_for_name(self, filename: str) -> Optional[str]:
+        """由 <sha256>.<ext> 形式的文件名还原对象键"""
+        digest, _, ext = filename.partition(".")
+        if len(digest) != 64 or not ext or any(c not in "0123456789abcdef" for c in digest):
+            return None
+        return self.key_for(digest, ext)
+
+    @staticmethod
+    def blob_ref(key: str) -> str:
+        """对象键对应的不透明引用（不暴露存储布局与URL）"""
+        return BLOB_REF_PREFIX + key.rsplit("/", 1)[-1]
+
+    def key_from_blob_ref(self, ref: str) -> Optional[str]:
+        """由不透明引用还原对象键，格式不合法时返回None"""
+        if not ref or not ref.startswith(BLOB_REF_PREFIX):
+            return None
+        return self.key_for_name(ref[len(BLOB_REF_PREFIX):])
+
+    def path_for(self, key: str) -> Optional[str]:
+        """对象的本地路径（仅本地后端可用，其余后端为None，见 StorageBackend.local_path）"""
+        return self.backend.local_path(key)
+
+    def url_for(self, key: str) -> str:
+        return self.backend.url_for(key)
+
+    @staticmethod
+    def key_from_url(url: str) -> Optional[str]:
+        """从 /static/generated/cas/... 或 /generated/cas/... 形式的URL中提取对象键"""
+        match = KEY_PATTERN.search(url)
+        return match.group(1) if match else None
+
+    def keys_in(self, value: Any) -> Set[str]:
+        """递归收集结果数据（含HTML、结构化数据）中引用的对象键"""
+        keys: Set[str] = set()
+        if isinstance(value, str):
+            # HTML/代码字段中可能内嵌多个URL
+            keys.update(match.group(1) for match in KEY_PATTERN.finditer(value))
+        elif isinstance(value, dict):
+            for item in value.values():
+                keys |= self.keys_in(item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                keys |= self.keys_in(item)
+        return keys
+
+    # ---------- 写入 ----------
+
+    async def put_bytes(self, data: bytes, ext: str, retention: Optional[int] = None) -> Dict[str, Any]:
+        """写入字节内容；已存在相同内容时直接复用
+
+        Returns:
+            {"key", "hash", "path"(非本地后端为None), "url", "size", "deduplicated"}
+        """
+        loop = asyncio.get_event_loop()
+        digest = await loop.run_in_executor(None, lambda: hashlib.sha256(data).hexdigest())
+        key = self.key_for(digest, ext)
+        deduplicated = await self.retain(key, retention if retention is not None else self.gc_grace)
+        if not deduplicated:
+            await self.backend.put(key, data)
+        return self._stored(key, digest, len(data), deduplicated)
+
+    async def put_file(self, source_path: str, ext: Optional[str] = None, retention: Optional[int] = None) -> Dict[str, Any]:
+        """将已落盘的临时文件移入存储（本地后端同盘rename，不复制）"""
+        ext = ext or os.path.splitext(source_path)[1].lstrip(".") or "bin"
+        loop = asyncio.get_event_loop()
+        digest, size = await loop.run_in_executor(None, self._hash_file, source_path)
+        key = self.key_for(digest, ext)
+        deduplicated = await self.retain(key, retention if retention is not None else self.gc_grace)
+        if deduplicated:
+            os.unlink(source_path)
+        else:
+            await self.backend.put_file(key, source_path)
+        return self._stored(key, digest, size, deduplicated)
+
+    @contextlib.asynccontextmanager
+    async def stage_stream(self, chunks: AsyncIterator[bytes], max_size: int):
+        """把流式内容写入暂存文件：边读边计算SHA-256，超过 max_size 立即中止（抛出 UploadTooLarge）
+
+        产出 {"path": 暂存文件路径, "hash", "size"}，退出上下文时删除暂存文件（已被移走的除外）。
+        """
+        loop = asyncio.get_event_loop()
+        handle = await loop.run_in_executor(None, self._open_staging_file)
+        staged_path = handle.name
+        # 进程异常退出时残留的暂存文件由过期索引回收
+        from .expiry_index import get_expiry_index
+        await get_expiry_index().register(staged_path, ttl=3600)
+
+        sha = hashlib.sha256()
+        size = 0
+        # 小块先在内存中合并，攒够后在线程池中计算哈希并写盘，不占用事件循环
+        pending = bytearray()
+        try:
+            try:
+                try:
+                    async for chunk in chunks:
+                        size += len(chunk)
+                        if size > max_size:
+                            raise UploadTooLarge(max_size)
+                        pending += chunk
+                        if len(pending) >= STAGE_FLUSH_SIZE:
+                            block, pending = bytes(pending), bytearray()
+                            await loop.run_in_executor(None, self._stage_block, sha, handle, block)
+                    if pending:
+                        await loop.run_in_executor(None, self._stage_block, sha, handle, bytes(pending))
+                finally:
+                    await loop.run_in_executor(None, handle.close)
+            finally:
+                if hasattr(chunks, "aclose"):
+                    # 提前中止时停止读取剩余请求体
+                    await chunks.aclose()
+
+            yield {"path": staged_path, "hash": sha.hexdigest(), "size": size}
+        finally:
+            try:
+                os.unlink(staged_path)
+            except FileNotFoundError:
+                pass
+
+    def _open_staging_file(self):
+        os.makedirs(self.staging_dir, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=self.staging_dir, suffix=".upload", delete=False)
+
+    @staticmethod
+    def _stage_block(sha, handle, block: bytes):
+        sha.update(block)
+        handle.write(block)
+
+    @staticmethod
+    def _hash_file(source_path: str):
+        sha = hashlib.sha256()
+        size = 0
+        with open(source_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+                size += len(chunk)
+        return sha.hexdigest(), size
+
+    async def get_bytes(self, key: str) -> Optional[bytes]:
+        return await self.backend.get(key)
+
+    async def read_source(self, key: str) -> Optional[Union[str, bytes]]:
+        """读取对象供解码：本地文件存在时返回路径（进程池只传路径），
+        非本地后端或文件已缺失时回退为 get_bytes 读取的字节；对象不存在返回None
+        """
+        path = self.path_for(key)
+        if path and os.path.isfile(path):
+            return path
+        return await self.get_bytes(key)
+
+    async def exists(self, key: str) -> bool:
+        """对象是否存在；GC正在删除该对象时等待删除完成，超时按不存在处理（调用方重新写入）"""
+        if self.refs_enabled:
+            try:
+                from ..utils.redis_client import get_async_redis_client
+
+                client = get_async_redis_client()
+                loop = asyncio.get_event_loop()
+                deadline = loop.time() + self.gc_delete_timeout
+                while await client.exists(f"{DELETING_KEY_PREFIX}{key}"):
+                    if loop.time() >= deadline:
+                        logger.warning(f"⚠️ 等待GC删除超时，按不存在处理: {key}")
+                        return False
+                    await asyncio.sleep(0.05)
+            except Exception as e:
+                logger.warning(f"⚠️ 查询GC删除标记失败: {key} - {e}")
+        return await self.backend.exists(key)
+
+    def _stored(self, key: str, digest: str, size: int, deduplicated: bool) -> Dict[str, Any]:
+        if deduplicated:
+            logger.info(f"♻️ 内容已存在，复用: {key}")
+        return {
+            "key": key,
+            "hash": digest,
+            "path": self.path_for(key),
+            "url": self.url_for(key),
+            "size": size,
+            "deduplicated": deduplicated
+        }
+
+    async def retain(self, key: str, retention: int) -> bool:
+        """保证无引用对象至少再保留 retention 秒（只会推迟回收时间），返回对象是否仍存在
+
+        先登记后确认：返回True时对象在保留期内不会被GC删除。
+        """
+        await self._register_candidate(key, retention)
+        return await self.exists(key)
+
+    async def _register_candidate(self, key: str, retention: int):
+        if not self.refs_enabled:
+            return
+        try:
+            from ..utils.redis_client import get_async_redis_client
+
+            # GT：重复写入只会推迟回收时间
+            await get_async_redis_client().zadd(GC_CANDIDATES_KEY, {key: time.time() + retention}, gt=True)
+        except Exception as e:
+            logger.warning(f"⚠️ 登记GC候选失败: {key} - {e}")
+
+    # ---------- 引用计数 ----------
+
+    async def add_references(self, owner: str, keys: Iterable[str]):
+        """记录任务对对象的引用（幂等）"""
+        keys = [k for k in set(keys) if k]
+        if not self.refs_enabled or not owner or not keys:
+            return
+        try:
+            from ..utils.redis_client import get_async_redis_client
+
+            pipe = get_async_redis_client().pipeline(transaction=False)
+            for key in keys:
+                pipe.sadd(f"{REFS_KEY_PREFIX}{key}", owner)
+            pipe.sadd(f"{OWNER_KEY_PREFIX}{owner}", *keys)
+            await pipe.execute()
+            logger.info(f"🔗 记录存储引用: {owner} -> {len(keys)} 个对象")
+        except Exception as e:
+            logger.warning(f"⚠️ 记录存储引用失败: {owner} - {e}")
+
+    async def remove_references(self, owner: str, keys: Iterable[str]):
+        """解除某个引用方对部分对象的引用，引用归零的对象进入GC候选"""
+        keys = [k for k in set(keys) if k]
+        if not self.refs_enabled or not owner or not keys:
+            return
+        try:
+            from ..utils.redis_client import get_async_redis_client
+
+            client = get_async_redis_client()
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.srem(f"{REFS_KEY_PREFIX}{key}", owner)
+                pipe.scard(f"{REFS_KEY_PREFIX}{key}")
+            pipe.srem(f"{OWNER_KEY_PREFIX}{owner}", *keys)
+            results = await pipe.execute()
+
+            orphaned = [key for key, count in zip(keys, results[1::2]) if count == 0]
+            if orphaned:
+                eligible_at = time.time() + self.release_grace
+                await client.zadd(GC_CANDIDATES_KEY, {key: eligible_at for key in orphaned}, gt=True)
+        except Exception as e:
+            logger.warning(f"⚠️ 解除存储引用失败: {owner} - {e}")
+
+    async def release_owner(self, owner: str) -> int:
+        """解除任务的全部引用，返回涉及的对象数"""
+        from ..utils.redis_client import get_async_redis_client
+
+        client = get_async_redis_client()
+        if self._release_script is None:
+            self._release_script = client.register_script(RELEASE_SCRIPT)
+        released = await self._release_script(
+            keys=[f"{OWNER_KEY_PREFIX}{owner}", GC_CANDIDATES_KEY],
+            args=[REFS_KEY_PREFIX, owner, time.time() + self.release_grace]
+        )
+        return int(released or 0)
+
+    # ---------- 垃圾回收 ----------
+
+    async def collect_garbage(self) -> int:
+        """处理已删除明信片的引用释放，并回收一批到期的无引用对象，返回删除数"""
+        from ..utils.redis_client import get_async_redis_client
+
+        client = get_async_redis_client()
+
+        owners = await client.spop(RELEASED_OWNERS_KEY, self.gc_batch) or []
+        for owner in owners:
+            owner = owner.decode("utf-8") if isinstance(owner, bytes) else owner
+            await self.release_owner(owner)
+
+        if self._claim_script is None:
+            self._claim_script = client.register_script(CLAIM_SCRIPT)
+        orphans = await self._claim_script(
+            keys=[GC_CANDIDATES_KEY],
+            args=[time.time(), self.gc_batch, REFS_KEY_PREFIX, DELETING_KEY_PREFIX, self.gc_delete_timeout]
+        )
+        orphans = [k.decode("utf-8") if isinstance(k, bytes) else k for k in orphans or []]
+        if not orphans:
+            return 0
+
+        deleted = 0
+        for key in orphans:
+            try:
+                deleted += int(await self.backend.delete(key))
+            except Exception as e:
+                logger.warning(f"⚠️ 删除对象失败: {key} - {e}")
+            finally:
+                # 删除完成后写入方才能重新写入同一内容
+                await client.delete(f"{DELETING_KEY_PREFIX}{key}")
+        logger.info(f"🧹 存储GC: 释放 {len(owners)} 个任务引用，删除 {deleted}/{len(orphans)} 个无引用对象")
+        return deleted
+
+    async def run_gc_loop(self):
+        """后台GC循环：每轮处理一批，积压时立即继续下一轮"""
+        if not self.refs_enabled:
+            return
+        logger.info(f"🧹 存储GC已启动: interval={self.gc_interval}s, batch={self.gc_batch}")
+        while True:
+            try:
+                deleted = await self.collect_garbage()
+                if deleted >= self.gc_batch:
+                    await asyncio.sleep(0)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ 存储GC执行失败: {e}")
+            # 加入抖动，避免多个实例同时扫描
+            await asyncio.sleep(self.gc_interval * random.uniform(0.8, 1.2))
+
+
+_content_store: Optional[ContentStore] = None
+
+
+def get_content_store() -> ContentStore:
+    """获取进程级内容存储单例"""
+    global _content_store
+    if _content_store is None:
+        _content_store = ContentStore()
+    return _content_store
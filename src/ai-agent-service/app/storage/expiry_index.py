@@ -0,0 +1,203 @@
+"""
+本地生成产物过期索引
+内容寻址存储之外直接写入磁盘的文件（单次Puppeteer截图、降级占位图、历史平铺目录中的图片）
+在写入时登记到 Redis 有序集合（成员为文件路径，分数为过期时间戳；另一个有序集合记录写入时间），
+后台回收器按批认领已过期条目并在线程中删除文件；按文件年龄的手动清理使用写入时间，不受各文件保留期不同的影响。
+清理开销只与过期文件数有关，不再扫描整个输出目录。
+
+历史文件可执行一次回填（按文件修改时间登记过期时间）：
+    python -m app.storage.expiry_index --backfill /app/app/static/generated/images
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_KEY = "artifacts:expiry"
+WRITTEN_KEY = "artifacts:written"
+
+# 认领一批分数不大于 cutoff 的条目：从两个索引中同时移除（多实例并发执行也不会重复删除）
+CLAIM_SCRIPT = """
+local key = KEYS[1]
+local other_key = KEYS[2]
+local cutoff = tonumber(ARGV[1])
+local batch = tonumber(ARGV[2])
+
+local expired = redis.call('ZRANGEBYSCORE', key, '-inf', cutoff, 'LIMIT', 0, batch)
+if #expired > 0 then
+    redis.call('ZREM', key, unpack(expired))
+    redis.call('ZREM', other_key, unpack(expired))
+end
+return expired
+"""
+
+
+def _delete_files(paths: List[str]) -> int:
+    """线程池任务：删除一批文件，返回实际删除数（已不存在的文件跳过）"""
+    deleted = 0
+    for path in paths:
+        try:
+            os.unlink(path)
+            deleted += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"⚠️ 删除过期文件失败: {path} - {e}")
+    return deleted
+
+
+class ExpiryIndex:
+    """生成产物过期索引与回收器"""
+
+    def __init__(self):
+        self.enabled = os.getenv("ARTIFACT_EXPIRY", "on") == "on"
+        self.default_ttl = int(os.getenv("ARTIFACT_TTL", str(24 * 3600)))
+        self.reap_interval = float(os.getenv("ARTIFACT_REAP_INTERVAL", "60"))
+        self.reap_batch = int(os.getenv("ARTIFACT_REAP_BATCH", "500"))
+
+        self._claim_script = None
+
+    async def register(self, path: str, ttl: Optional[int] = None):
+        """登记文件在 ttl 秒后过期（重复登记以最后一次为准）"""
+        await self.register_many({path: time.time() + (ttl if ttl is not None else self.default_ttl)})
+
+    async def register_many(self, expiries: Dict[str, float], written: Optional[Dict[str, float]] = None):
+        """批量登记 {文件路径: 过期时间戳}，written 为 {文件路径: 写入时间戳}（缺省为当前时间）"""
+        if not self.enabled or not expiries:
+            return
+        try:
+            from ..utils.redis_client import get_async_redis_client
+
+            now = time.time()
+            written = written or {}
+            pipe = get_async_redis_client().pipeline(transaction=False)
+            pipe.zadd(EXPIRY_KEY, {os.path.abspath(p): t for p, t in expiries.items()})
+            pipe.zadd(WRITTEN_KEY, {os.path.abspath(p): written.get(p, now) for p in expiries})
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ 登记文件过期时间失败: {e}")
+
+    @staticmethod
+    def _index(written_before: Optional[float]):
+        """按写入时间清理时在写入时间索引上认领，否则在过期索引上认领"""
+        if written_before is not None:
+            return WRITTEN_KEY, EXPIRY_KEY, written_before
+        return EXPIRY_KEY, WRITTEN_KEY, None
+
+    async def reap(self, before: Optional[float] = None, written_before: Optional[float] = None) -> int:
+        """认领并删除一批文件，返回删除数
+
+        默认删除在 before（默认当前时间）之前过期的文件；指定 written_before 时改为删除在该时间之前写入的文件。
+        """
+        from ..utils.redis_client import get_async_redis_client
+
+        client = get_async_redis_client()
+        if self._claim_script is None:
+            self._claim_script = client.register_script(CLAIM_SCRIPT)
+        key, other_key, cutoff = self._index(written_before)
+        expired = await self._claim_script(
+            keys=[key, other_key],
+            args=[cutoff if cutoff is not None else (before if before is not None else time.time()), self.reap_batch]
+        )
+        paths = [p.decode("utf-8") if isinstance(p, bytes) else p for p in expired or []]
+        if not paths:
+            return 0
+
+        loop = asyncio.get_event_loop()
+        deleted = await loop.run_in_executor(None, _delete_files, paths)
+        logger.info(f"🧹 过期文件回收: 认领 {len(paths)} 条，删除 {deleted} 个文件")
+        return deleted
+
+    async def reap_all(self, before: Optional[float] = None, written_before: Optional[float] = None) -> int:
+        """连续回收直到没有符合条件的条目（参数同 reap）"""
+        total = 0
+        while await self.pending(before, written_before):
+            total += await self.reap(before, written_before)
+        return total
+
+    async def pending(self, before: Optional[float] = None, written_before: Optional[float] = None) -> int:
+        from ..utils.redis_client import get_async_redis_client
+
+        key, _, cutoff = self._index(written_before)
+        return await get_async_redis_client().zcount(
+            key, "-inf", cutoff if cutoff is not None else (before if before is not None else time.time())
+        )
+
+    async def run_reaper_loop(self):
+        """后台回收循环：每轮认领一批，积压时立即继续下一轮"""
+        if not self.enabled:
+            return
+        logger.info(f"🧹 过期文件回收已启动: interval={self.reap_interval}s, batch={self.reap_batch}")
+        while True:
+            try:
+                if await self.pending():
+                    await self.reap()
+                    if await self.pending():
+                        await asyncio.sleep(0)
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ 过期文件回收失败: {e}")
+            # 加入抖动，避免多个实例同时认领
+            await asyncio.sleep(self.reap_interval * random.uniform(0.8, 1.2))
+
+    async def backfill(self, directories: Iterable[str], ttl: Optional[int] = None) -> int:
+        """一次性登记目录中已有的文件（过期时间 = 修改时间 + ttl），返回登记数"""
+        ttl = ttl if ttl is not None else self.default_ttl
+        total = 0
+        for directory in directories:
+            batch: Dict[str, float] = {}
+            for entry in os.scandir(directory):
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                batch[entry.path] = entry.stat().st_mtime
+                if len(batch) >= 1000:
+                    await self.register_many({p: t + ttl for p, t in batch.items()}, batch)
+                    total += len(batch)
+                    batch = {}
+            await self.register_many({p: t + ttl for p, t in batch.items()}, batch)
+            total += len(batch)
+        return total
+
+
+_expiry_index: Optional[ExpiryIndex] = None
+
+
+def get_expiry_index() -> ExpiryIndex:
+    """获取进程级过期索引单例"""
+    global _expiry_index
+    if _expiry_index is None:
+        _expiry_index = ExpiryIndex()
+    return _expiry_index
+
+
+async def _run(args):
+    index = get_expiry_index()
+    if args.backfill:
+        count = await index.backfill(args.backfill, args.ttl)
+        print(f"已登记 {count} 个文件")
+    if args.reap:
+        print(f"已删除 {await index.reap_all()} 个过期文件")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地生成产物过期索引维护")
+    parser.add_argument("--backfill", nargs="+", metavar="DIR", help="登记目录中已有的文件")
+    parser.add_argument("--ttl", type=int, default=None, help="回填文件的保留秒数（从修改时间算起）")
+    parser.add_argument("--reap", action="store_true", help="立即回收全部已过期文件")
+    args = parser.parse_args()
+    if not args.backfill and not args.reap:
+        parser.error("需要 --backfill 或 --reap")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+存储后端工厂
+"""
+
+import logging
+import os
+from typing import Optional
+
+from .base import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+
+def create_storage_backend(backend_type: Optional[str] = None) -> StorageBackend:
+    """按 STORAGE_BACKEND 创建存储后端: local / s3"""
+    backend_type = (backend_type or os.getenv("STORAGE_BACKEND", "local")).lower()
+
+    if backend_type == "local":
+        from .local_backend import LocalStorageBackend
+        return LocalStorageBackend()
+    elif backend_type == "s3":
+        from .s3_backend import S3StorageBackend
+        return S3StorageBackend()
+    else:
+        raise ValueError(f"不支持的存储后端: {backend_type}")
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """获取进程级存储后端单例"""
+    global _storage
+    if _storage is None:
+        _storage = create_storage_backend()
+        logger.info(f"✅ 存储后端: {_storage.name}")
+    return _storage
+
+
+async def close_storage():
+    global _storage
+    if _storage is not None:
+        await _storage.close()
+        _storage = None
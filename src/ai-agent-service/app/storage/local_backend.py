@@ -0,0 +1,105 @@
+"""
+本地磁盘存储后端（单实例或共享卷部署）
+"""
+
+import asyncio
+import os
+import random
+from typing import Any, AsyncIterator, Dict, Optional
+
+from .base import StorageBackend, guess_content_type, normalize_key
+
+
+class LocalStorageBackend(StorageBackend):
+    """本地磁盘后端：对象键直接映射为 root 下的相对路径"""
+
+    name = "local"
+
+    def __init__(self, root: Optional[str] = None, public_base: Optional[str] = None):
+        super().__init__()
+        self.root = root or os.getenv("STORAGE_LOCAL_ROOT", "/app/app/static/generated")
+        self.public_base = (public_base or os.getenv("AI_AGENT_PUBLIC_URL", "http://ai-agent-service:8000")).rstrip("/")
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, normalize_key(key))
+
+    async def put(self, key: str, data: bytes, content_type: Optional[str] = None):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._write, self._path(key), data)
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子替换，读者不会看到半个文件
+        tmp_path = f"{path}.{os.getpid()}.{random.getrandbits(32):08x}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    async def put_file(self, key: str, source_path: str, content_type: Optional[str] = None):
+        path = self._path(key)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._move, source_path, path)
+
+    @staticmethod
+    def _move(source_path: str, path: str):
+        import shutil
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(source_path, path)
+        except OSError:
+            # 跨文件系统时退化为复制
+            shutil.move(source_path, path)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(None, self._read, path)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def stream(self, key: str, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        path = self._path(key)
+        loop = asyncio.get_event_loop()
+        f = await loop.run_in_executor(None, open, path, "rb")
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, f.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            f.close()
+
+    async def stat(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            st = os.stat(self._path(key))
+        except (FileNotFoundError, ValueError):
+            return None
+        return {"size": st.st_size, "modified": st.st_mtime, "content_type": guess_content_type(key)}
+
+    async def delete(self, key: str) -> bool:
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, os.unlink, self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def url_for(self, key: str) -> str:
+        return f"{self.public_base}/static/generated/{normalize_key(key)}"
+
+    def signed_url(self, key: str, expires_in: int = 3600) -> str:
+        # 本地文件由服务实例公开提供，无需签名
+        return self.url_for(key)
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self._path(key)
@@ -0,0 +1,159 @@
+"""
+S3协议存储后端（纯Python SigV4签名 + aiohttp）
+兼容 AWS S3、MinIO、腾讯云COS/阿里云OSS的S3兼容端点，以及本地替身服务 app.storage.s3_server。
+"""
+
+import asyncio
+import hashlib
+import os
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, Optional
+
+import aiohttp
+
+from .base import StorageBackend, guess_content_type, normalize_key
+from .sigv4 import EMPTY_SHA256, encode_key_path, presign_url, sign_request
+
+
+def _hash_file(path: str):
+    sha = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+            size += len(chunk)
+    return sha.hexdigest(), size
+
+
+class S3StorageBackend(StorageBackend):
+    """S3兼容对象存储后端（path-style寻址）"""
+
+    name = "s3"
+
+    def __init__(self):
+        super().__init__()
+        self.endpoint = os.getenv("STORAGE_S3_ENDPOINT", "http://object-storage:9000").rstrip("/")
+        # 预签名URL中的host参与签名，客户端访问地址与内网地址不同时需单独配置
+        self.presign_endpoint = (os.getenv("STORAGE_S3_PUBLIC_ENDPOINT") or self.endpoint).rstrip("/")
+        self.bucket = os.getenv("STORAGE_S3_BUCKET", "ai-postcard")
+        self.region = os.getenv("STORAGE_S3_REGION", "us-east-1")
+        self.access_key = os.getenv("STORAGE_S3_ACCESS_KEY", "")
+        self.secret_key = os.getenv("STORAGE_S3_SECRET_KEY", "")
+        self.create_bucket = os.getenv("STORAGE_S3_CREATE_BUCKET", "on") == "on"
+        self.timeout = float(os.getenv("STORAGE_S3_TIMEOUT", "30"))
+        self.public_base = os.getenv("AI_AGENT_PUBLIC_URL", "http://ai-agent-service:8000").rstrip("/")
+
+        if not self.access_key or not self.secret_key:
+            raise ValueError("STORAGE_S3_ACCESS_KEY / STORAGE_S3_SECRET_KEY 未配置")
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._bucket_ready = False
+        self._bucket_lock = asyncio.Lock()
+
+        self.logger.info(f"✅ S3存储后端: {self.endpoint}/{self.bucket}")
+
+    def _object_url(self, key: str, endpoint: Optional[str] = None) -> str:
+        return f"{endpoint or self.endpoint}/{self.bucket}/{encode_key_path(normalize_key(key))}"
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        data: Any = b"",
+        headers: Optional[Dict[str, str]] = None,
+        payload_hash: Optional[str] = None
+    ):
+        """data 为字节或文件对象（文件对象需同时给出 payload_hash，由aiohttp按块发送）"""
+        if payload_hash is None:
+            payload_hash = hashlib.sha256(data).hexdigest() if data else EMPTY_SHA256
+        signed = sign_request(method, url, headers or {}, payload_hash, self.access_key, self.secret_key, self.region)
+        session = await self._get_session()
+        return session.request(method, url, data=data or None, headers=signed)
+
+    async def _ensure_bucket(self):
+        if self._bucket_ready or not self.create_bucket:
+            return
+        async with self._bucket_lock:
+            if self._bucket_ready:
+                return
+            async with await self._request("PUT", f"{self.endpoint}/{self.bucket}") as response:
+                # 409 BucketAlreadyOwnedByYou / BucketAlreadyExists
+                if response.status not in (200, 409):
+                    text = await response.text()
+                    raise RuntimeError(f"创建存储桶失败: HTTP {response.status} {text[:200]}")
+            self._bucket_ready = True
+
+    async def put(self, key: str, data: bytes, content_type: Optional[str] = None):
+        await self._ensure_bucket()
+        headers = {"content-type": content_type or guess_content_type(key)}
+        async with await self._request("PUT", self._object_url(key), data, headers) as response:
+            if response.status != 200:
+                text = await response.text()
+                raise RuntimeError(f"S3写入失败 {key}: HTTP {response.status} {text[:200]}")
+
+    async def put_file(self, key: str, source_path: str, content_type: Optional[str] = None):
+        await self._ensure_bucket()
+        loop = asyncio.get_event_loop()
+        payload_hash, size = await loop.run_in_executor(None, _hash_file, source_path)
+        headers = {"content-type": content_type or guess_content_type(key), "content-length": str(size)}
+        with open(source_path, "rb") as f:
+            async with await self._request("PUT", self._object_url(key), f, headers, payload_hash) as response:
+                if response.status != 200:
+                    text = await response.text()
+                    raise RuntimeError(f"S3写入失败 {key}: HTTP {response.status} {text[:200]}")
+        os.unlink(source_path)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        async with await self._request("GET", self._object_url(key)) as response:
+            if response.status == 404:
+                return None
+            if response.status != 200:
+                raise RuntimeError(f"S3读取失败 {key}: HTTP {response.status}")
+            return await response.read()
+
+    async def stream(self, key: str, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        async with await self._request("GET", self._object_url(key)) as response:
+            if response.status == 404:
+                raise FileNotFoundError(key)
+            if response.status != 200:
+                raise RuntimeError(f"S3读取失败 {key}: HTTP {response.status}")
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+
+    async def stat(self, key: str) -> Optional[Dict[str, Any]]:
+        async with await self._request("HEAD", self._object_url(key)) as response:
+            if response.status == 404:
+                return None
+            if response.status != 200:
+                raise RuntimeError(f"S3查询失败 {key}: HTTP {response.status}")
+            modified = response.headers.get("Last-Modified")
+            return {
+                "size": int(response.headers.get("Content-Length", 0)),
+                "modified": parsedate_to_datetime(modified).timestamp() if modified else None,
+                "content_type": response.headers.get("Content-Type", guess_content_type(key))
+            }
+
+    async def delete(self, key: str) -> bool:
+        async with await self._request("DELETE", self._object_url(key)) as response:
+            if response.status not in (200, 204, 404):
+                raise RuntimeError(f"S3删除失败 {key}: HTTP {response.status}")
+            return response.status != 404
+
+    def url_for(self, key: str) -> str:
+        # 对外URL保持经服务转发的稳定形式，不随存储后端/签名过期变化
+        return f"{self.public_base}/static/generated/{normalize_key(key)}"
+
+    def signed_url(self, key: str, expires_in: int = 3600) -> str:
+        return presign_url(
+            "GET", self._object_url(key, self.presign_endpoint),
+            self.access_key, self.secret_key, self.region, expires_in
+        )
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
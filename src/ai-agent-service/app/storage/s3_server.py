@@ -0,0 +1,161 @@
+"""
+本地 S3 兼容替身服务
+实现 S3 协议的最小子集（建桶、PUT/GET/HEAD/DELETE 对象、SigV4 请求头签名与预签名URL校验），
+用于本地开发与多实例部署验证，无需引入 MinIO 等外部组件。
+
+运行：python -m app.storage.s3_server --port 9000 --root /data/object-storage
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import random
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from urllib.parse import parse_qsl
+
+from aiohttp import web
+
+from .base import guess_content_type
+from .sigv4 import UNSIGNED_PAYLOAD, verify_request
+
+logger = logging.getLogger(__name__)
+
+
+def _error(status: int, code: str, message: str, resource: str = "") -> web.Response:
+    body = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f"<Error><Code>{code}</Code><Message>{message}</Message><Resource>{resource}</Resource></Error>"
+    )
+    return web.Response(status=status, body=body.encode("utf-8"), content_type="application/xml")
+
+
+class S3StandInServer:
+    """S3 替身服务：对象以文件形式保存在 root/<bucket>/<key>"""
+
+    def __init__(self, root: str, credentials: Dict[str, str], region: str):
+        self.root = os.path.abspath(root)
+        self.credentials = credentials
+        self.region = region
+        os.makedirs(self.root, exist_ok=True)
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024, middlewares=[self._auth_middleware])
+        app.router.add_route("PUT", "/{bucket}", self.create_bucket)
+        app.router.add_route("PUT", "/{bucket}/{key:.+}", self.put_object)
+        app.router.add_route("GET", "/{bucket}/{key:.+}", self.get_object)
+        app.router.add_route("HEAD", "/{bucket}/{key:.+}", self.head_object)
+        app.router.add_route("DELETE", "/{bucket}/{key:.+}", self.delete_object)
+        return app
+
+    @web.middleware
+    async def _auth_middleware(self, request: web.Request, handler):
+        if self.credentials:
+            raw_path = request.raw_path.split("?", 1)[0]
+            query = parse_qsl(request.query_string, keep_blank_values=True)
+            headers = {k.lower(): v for k, v in request.headers.items()}
+            if not verify_request(request.method, raw_path, query, headers, self.credentials, self.region):
+                return _error(403, "SignatureDoesNotMatch", "签名校验失败", request.path)
+        return await handler(request)
+
+    def _bucket_path(self, bucket: str) -> Optional[str]:
+        if not bucket or bucket in (".", "..") or "/" in bucket:
+            return None
+        return os.path.join(self.root, bucket)
+
+    def _object_path(self, bucket: str, key: str) -> Optional[str]:
+        bucket_path = self._bucket_path(bucket)
+        if bucket_path is None:
+            return None
+        path = os.path.abspath(os.path.join(bucket_path, key))
+        if not path.startswith(bucket_path + os.sep):
+            return None
+        return path
+
+    async def create_bucket(self, request: web.Request) -> web.Response:
+        bucket_path = self._bucket_path(request.match_info["bucket"])
+        if bucket_path is None:
+            return _error(400, "InvalidBucketName", "非法的存储桶名称")
+        if os.path.isdir(bucket_path):
+            return _error(409, "BucketAlreadyOwnedByYou", "存储桶已存在", request.path)
+        os.makedirs(bucket_path, exist_ok=True)
+        return web.Response(status=200)
+
+    async def put_object(self, request: web.Request) -> web.Response:
+        bucket = request.match_info["bucket"]
+        path = self._object_path(bucket, request.match_info["key"])
+        if path is None:
+            return _error(400, "InvalidArgument", "非法的对象键")
+        if not os.path.isdir(self._bucket_path(bucket)):
+            return _error(404, "NoSuchBucket", "存储桶不存在", bucket)
+
+        data = await request.read()
+        digest = hashlib.sha256(data).hexdigest()
+        declared = request.headers.get("x-amz-content-sha256")
+        if declared and declared != UNSIGNED_PAYLOAD and declared != digest:
+            return _error(400, "XAmzContentSHA256Mismatch", "请求体哈希与签名不一致", request.path)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{random.getrandbits(32):08x}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        etag = hashlib.md5(data).hexdigest()
+        return web.Response(status=200, headers={"ETag": f'"{etag}"'})
+
+    def _existing(self, request: web.Request) -> Optional[str]:
+        path = self._object_path(request.match_info["bucket"], request.match_info["key"])
+        if path and os.path.isfile(path) and not path.endswith(".tmp"):
+            return path
+        return None
+
+    async def get_object(self, request: web.Request):
+        path = self._existing(request)
+        if path is None:
+            return _error(404, "NoSuchKey", "对象不存在", request.path)
+        return web.FileResponse(path, headers={"Content-Type": guess_content_type(path)})
+
+    async def head_object(self, request: web.Request) -> web.Response:
+        path = self._existing(request)
+        if path is None:
+            return web.Response(status=404)
+        st = os.stat(path)
+        modified = datetime.fromtimestamp(st.st_mtime, tz=timezone.utc)
+        return web.Response(status=200, headers={
+            "Content-Length": str(st.st_size),
+            "Content-Type": guess_content_type(path),
+            "Last-Modified": modified.strftime("%a, %d %b %Y %H:%M:%S GMT")
+        })
+
+    async def delete_object(self, request: web.Request) -> web.Response:
+        path = self._existing(request)
+        if path is not None:
+            os.unlink(path)
+        # S3删除不存在的对象同样返回204
+        return web.Response(status=204)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 S3 兼容替身服务")
+    parser.add_argument("--host", default=os.getenv("S3_SERVER_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("S3_SERVER_PORT", "9000")))
+    parser.add_argument("--root", default=os.getenv("S3_SERVER_ROOT", "/data/object-storage"))
+    parser.add_argument("--region", default=os.getenv("STORAGE_S3_REGION", "us-east-1"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    access_key = os.getenv("STORAGE_S3_ACCESS_KEY", "")
+    secret_key = os.getenv("STORAGE_S3_SECRET_KEY", "")
+    credentials = {access_key: secret_key} if access_key and secret_key else {}
+    if not credentials:
+        logger.warning("⚠️ 未配置访问密钥，替身服务将不校验签名")
+
+    server = S3StandInServer(args.root, credentials, args.region)
+    logger.info(f"🪣 S3替身服务启动: http://{args.host}:{args.port} root={server.root}")
+    web.run_app(server.build_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+AWS Signature Version 4（S3）签名的纯Python实现
+供 S3 存储后端签名请求/生成预签名URL，以及本地 S3 替身服务校验请求。
+"""
+
+import hashlib
+import hmac
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, quote, urlsplit
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+SERVICE = "s3"
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def _uri_encode(value: str, safe: str = "-_.~") -> str:
+    return quote(value, safe=safe)
+
+
+def encode_key_path(path: str) -> str:
+    """按S3规则逐段编码路径（保留 "/"）"""
+    return "/".join(_uri_encode(segment) for segment in path.split("/"))
+
+
+def _canonical_query(params: Iterable[Tuple[str, str]]) -> str:
+    encoded = sorted((_uri_encode(k), _uri_encode(v)) for k, v in params)
+    return "&".join(f"{k}={v}" for k, v in encoded)
+
+
+def _signing_key(secret_key: str, date_stamp: str, region: str) -> bytes:
+    k_date = _hmac(f"AWS4{secret_key}".encode("utf-8"), date_stamp)
+    k_region = _hmac(k_date, region)
+    k_service = _hmac(k_region, SERVICE)
+    return _hmac(k_service, "aws4_request")
+
+
+def _signature(
+    method: str,
+    canonical_uri: str,
+    query: Iterable[Tuple[str, str]],
+    headers: Dict[str, str],
+    signed_headers: List[str],
+    payload_hash: str,
+    secret_key: str,
+    amz_date: str,
+    region: str
+) -> str:
+    canonical_headers = "".join(f"{name}:{' '.join(headers[name].split())}\n" for name in signed_headers)
+    canonical_request = "\n".join([
+        method.upper(),
+        canonical_uri or "/",
+        _canonical_query(query),
+        canonical_headers,
+        ";".join(signed_headers),
+        payload_hash
+    ])
+    date_stamp = amz_date[:8]
+    scope = f"{date_stamp}/{region}/{SERVICE}/aws4_request"
+    string_to_sign = "\n".join([
+        ALGORITHM,
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+    ])
+    return hmac.new(_signing_key(secret_key, date_stamp, region), string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def sign_request(
+    method: str,
+    url: str,
+    headers: Dict[str, str],
+    payload_hash: str,
+    access_key: str,
+    secret_key: str,
+    region: str,
+    now: Optional[datetime] = None
+) -> Dict[str, str]:
+    """返回加入 x-amz-date / x-amz-content-sha256 / Authorization 后的请求头"""
+    parts = urlsplit(url)
+    amz_date = (now or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+
+    signed = {k.lower(): str(v) for k, v in headers.items()}
+    signed["host"] = parts.netloc
+    signed["x-amz-date"] = amz_date
+    signed["x-amz-content-sha256"] = payload_hash
+    signed_headers = sorted(signed.keys())
+
+    signature = _signature(
+        method, parts.path, parse_qsl(parts.query, keep_blank_values=True),
+        signed, signed_headers, payload_hash, secret_key, amz_date, region
+    )
+    scope = f"{amz_date[:8]}/{region}/{SERVICE}/aws4_request"
+    signed["authorization"] = (
+        f"{ALGORITHM} Credential={access_key}/{scope}, "
+        f"SignedHeaders={';'.join(signed_headers)}, Signature={signature}"
+    )
+    signed.pop("host")
+    return signed
+
+
+def presign_url(
+    method: str,
+    url: str,
+    access_key: str,
+    secret_key: str,
+    region: str,
+    expires_in: int,
+    now: Optional[datetime] = None
+) -> str:
+    """生成查询串签名的预签名URL（仅签名host头）"""
+    parts = urlsplit(url)
+    amz_date = (now or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+    scope = f"{amz_date[:8]}/{region}/{SERVICE}/aws4_request"
+
+    query = parse_qsl(parts.query, keep_blank_values=True) + [
+        ("X-Amz-Algorithm", ALGORITHM),
+        ("X-Amz-Credential", f"{access_key}/{scope}"),
+        ("X-Amz-Date", amz_date),
+        ("X-Amz-Expires", str(int(expires_in))),
+        ("X-Amz-SignedHeaders", "host"),
+    ]
+    signature = _signature(
+        method, parts.path, query, {"host": parts.netloc}, ["host"],
+        UNSIGNED_PAYLOAD, secret_key, amz_date, region
+    )
+    return f"{parts.scheme}://{parts.netloc}{parts.path}?{_canonical_query(query)}&X-Amz-Signature={signature}"
+
+
+def verify_request(
+    method: str,
+    raw_path: str,
+    query: List[Tuple[str, str]],
+    headers: Dict[str, str],
+    credentials: Dict[str, str],
+    region: str,
+    now: Optional[datetime] = None
+) -> bool:
+    """校验请求头签名或预签名URL（服务端使用）
+
+    Args:
+        raw_path: 请求行中未解码的路径
+        query: 已解码的查询参数
+        headers: 小写键的请求头
+        credentials: access_key -> secret_key
+    """
+    now = now or datetime.now(timezone.utc)
+    params = dict(query)
+
+    if "X-Amz-Signature" in params:
+        try:
+            access_key, scope = params["X-Amz-Credential"].split("/", 1)
+            amz_date = params["X-Amz-Date"]
+            signed_at = datetime.strptime(amz_date, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+            if (now - signed_at).total_seconds() > int(params["X-Amz-Expires"]):
+                return False
+            signed_headers = params["X-Amz-SignedHeaders"].split(";")
+        except (KeyError, ValueError):
+            return False
+        secret_key = credentials.get(access_key)
+        if not secret_key or not scope.startswith(f"{amz_date[:8]}/{region}/"):
+            return False
+        unsigned_query = [(k, v) for k, v in query if k != "X-Amz-Signature"]
+        expected = _signature(
+            method, raw_path, unsigned_query, headers, signed_headers,
+            UNSIGNED_PAYLOAD, secret_key, amz_date, region
+        )
+        return hmac.compare_digest(expected, params["X-Amz-Signature"])
+
+    authorization = headers.get("authorization", "")
+    if not authorization.startswith(ALGORITHM + " "):
+        return False
+    try:
+        fields = dict(item.strip().split("=", 1) for item in authorization[len(ALGORITHM) + 1:].split(","))
+        access_key, scope = fields["Credential"].split("/", 1)
+        signed_headers = fields["SignedHeaders"].split(";")
+        amz_date = headers["x-amz-date"]
+        signed_at = datetime.strptime(amz_date, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+        payload_hash = headers["x-amz-content-sha256"]
+    except (KeyError, ValueError):
+        return False
+    # 与AWS一致：请求时间偏差超过15分钟视为无效
+    if abs((now - signed_at).total_seconds()) > 900:
+        return False
+    secret_key = credentials.get(access_key)
+    if not secret_key or not scope.startswith(f"{amz_date[:8]}/{region}/"):
+        return False
+    if any(name not in headers for name in signed_headers):
+        return False
+    expected = _signature(
+        method, raw_path, query, headers, signed_headers,
+        payload_hash, secret_key, amz_date, region
+    )
+    return hmac.compare_digest(expected, fields["Signature"])
@@ -1,54 +1,182 @@
 """
 签体曝光追踪器
 用于记录签体推荐历史和全局曝光统计
+
+写入先进入进程内缓冲区，每隔 N 毫秒或累计 M 条推荐后合并为一个 pipeline 异步刷入 Redis；
+读取优先使用短时本地快照（叠加尚未刷盘的缓冲数据），推荐路径上不等待任何写入。
 """
 
+import asyncio
 import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+HISTORY_LIMIT = 5
+HISTORY_TTL = 30 * 86400
+
+
 class CharmExposureTracker:
-    """签体曝光追踪器"""
+    """签体曝光追踪器（redis.asyncio）"""
 
     def __init__(self, redis_client):
         self.redis = redis_client
         self.global_key = "charm:exposure:global"
 
+        self.flush_interval = int(os.getenv("CHARM_EXPOSURE_FLUSH_MS", "200")) / 1000.0
+        self.flush_events = int(os.getenv("CHARM_EXPOSURE_FLUSH_EVENTS", "50"))
+        self.snapshot_ttl = int(os.getenv("CHARM_EXPOSURE_SNAPSHOT_MS", "1000")) / 1000.0
+
+        # 待刷盘缓冲：全局计数增量 + 每个用户按时间顺序追加的签体ID
+        self._pending_counts: Counter = Counter()
+        self._pending_history: Dict[str, List[str]] = {}
+        self._pending_events = 0
+        self._flush_tasks = set()
+
+        # 本地读快照：(读取时间, 数据)；全局快照额外缓存曝光总数，签体很多时不必每次求和
+        self._global_snapshot: Optional[Tuple[float, Dict[str, int], int]] = None
+        self._user_snapshots: Dict[str, Tuple[float, List[str]]] = {}
+
     def record_recommendation(self, user_id: str, charm_ids: list):
-        """记录推荐结果"""
+        """记录推荐结果（只写缓冲区，立即返回）"""
+        self._pending_counts.update(charm_ids)
+        if user_id:
+            self._pending_history.setdefault(user_id, []).extend(charm_ids)
+        self._pending_events += 1
+
+        if self._pending_events >= self.flush_events:
+            self._schedule_flush(0)
+        else:
+            self._schedule_flush(self.flush_interval)
+
+    def _schedule_flush(self, delay: float):
+        # 已有定时刷盘时只在达到条数阈值时追加一次立即刷盘；刷盘本身原子交换缓冲区，可并发执行
+        if delay > 0 and any(not task.done() for task in self._flush_tasks):
+            return
         try:
-            pipeline = self.redis.pipeline()
+            task = asyncio.get_running_loop().create_task(self._delayed_flush(delay))
+        except RuntimeError:
+            # 没有运行中的事件循环（同步调用场景），等待下次刷盘
+            return
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
 
-            # 更新全局计数
-            for charm_id in charm_ids:
-                pipeline.hincrby(self.global_key, charm_id, 1)
+    async def _delayed_flush(self, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.flush()
+
+    async def flush(self):
+        """将缓冲区合并为一个pipeline写入Redis"""
+        if not self._pending_events:
+            return
+        counts, self._pending_counts = self._pending_counts, Counter()
+        history, self._pending_history = self._pending_history, {}
+        self._pending_events = 0
+
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+
+            # 更新全局计数（同一签体的多次曝光合并为一次HINCRBY）
+            for charm_id, count in counts.items():
+                pipeline.hincrby(self.global_key, charm_id, count)
 
             # 更新用户历史
-            history_key = f"charm:history:{user_id}"
-            for charm_id in charm_ids:
-                pipeline.lpush(history_key, charm_id)
-            pipeline.ltrim(history_key, 0, 4)  # 只保留5个
-            pipeline.expire(history_key, 30 * 86400)
+            for user_id, charm_ids in history.items():
+                history_key = f"charm:history:{user_id}"
+                pipeline.lpush(history_key, *charm_ids)
+                pipeline.ltrim(history_key, 0, HISTORY_LIMIT - 1)  # 只保留5个
+                pipeline.expire(history_key, HISTORY_TTL)
 
-            pipeline.execute()
+            await pipeline.execute()
         except Exception as e:
+            # 计数合并回缓冲区下次重试；历史仅影响去重，丢弃即可
+            self._pending_counts.update(counts)
+            self._pending_events += 1
             logger.error(f"❌ 记录推荐失败: {e}")
+            return
+
+        # 已落盘的数据使本地快照失效，下次读取时重新加载
+        self._global_snapshot = None
+        for user_id in history:
+            self._user_snapshots.pop(user_id, None)
+
+    async def get_snapshot(self, user_id: str = None, limit: int = HISTORY_LIMIT) -> dict:
+        """获取推荐所需的曝光数据：用户近期历史 + 全局曝光统计
+
+        本地快照未过期时不访问Redis；否则一次pipeline往返取回，并叠加尚未刷盘的缓冲数据。
+        """
+        now = time.monotonic()
+        global_cached = self._global_snapshot
+        user_cached = self._user_snapshots.get(user_id) if user_id else (now, [])
+        need_global = global_cached is None or now - global_cached[0] > self.snapshot_ttl
+        need_user = user_cached is None or now - user_cached[0] > self.snapshot_ttl
+
+        if need_global or need_user:
+            try:
+                pipeline = self.redis.pipeline(transaction=False)
+                if need_user:
+                    pipeline.lrange(f"charm:history:{user_id}", 0, HISTORY_LIMIT - 1)
+                if need_global:
+                    pipeline.hgetall(self.global_key)
+                results = await pipeline.execute()
 
-    def get_global_stats(self) -> dict:
+                if need_user:
+                    user_cached = (now, [item.decode() for item in results[0]])
+                    self._user_snapshots[user_id] = user_cached
+                if need_global:
+                    counts = {k.decode(): int(v) for k, v in results[-1].items()}
+                    global_cached = (now, counts, sum(counts.values()))
+                    self._global_snapshot = global_cached
+            except Exception as e:
+                logger.error(f"❌ 获取曝光快照失败: {e}")
+                user_cached = user_cached or (now, [])
+                global_cached = global_cached or (now, {}, 0)
+
+        stats = Counter(global_cached[1])
+        stats.update(self._pending_counts)
+
+        recent = list(user_cached[1])
+        pending = self._pending_history.get(user_id) if user_id else None
+        if pending:
+            recent = list(reversed(pending)) + recent
+
+        total = global_cached[2] + sum(self._pending_counts.values())
+        return {"recent": recent[:limit], "global": dict(stats), "total": total}
+
+    async def get_global_stats(self) -> dict:
         """获取全局统计"""
-        try:
-            stats = self.redis.hgetall(self.global_key)
-            return {k.decode(): int(v) for k, v in stats.items()}
-        except Exception as e:
-            logger.error(f"❌ 获取统计失败: {e}")
-            return {}
+        return (await self.get_snapshot())["global"]
 
-    def get_user_recent(self, user_id: str, limit: int = 5) -> list:
+    async def get_user_recent(self, user_id: str, limit: int = HISTORY_LIMIT) -> list:
         """获取用户历史"""
-        try:
-            history_key = f"charm:history:{user_id}"
-            recent = self.redis.lrange(history_key, 0, limit - 1)
-            return [item.decode() for item in recent]
-        except Exception as e:
-            logger.error(f"❌ 获取历史失败: {e}")
-            return []
\ No newline at end of file
+        return (await self.get_snapshot(user_id, limit))["recent"]
+
+    async def close(self):
+        """刷出剩余缓冲（优雅退出时调用）"""
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        await self.flush()
+
+
+_exposure_tracker: Optional[CharmExposureTracker] = None
+
+
+def get_charm_exposure_tracker() -> CharmExposureTracker:
+    """获取进程级曝光追踪器单例（缓冲区与本地快照需跨任务共享）"""
+    global _exposure_tracker
+    if _exposure_tracker is None:
+        from .redis_client import get_async_redis_client
+
+        _exposure_tracker = CharmExposureTracker(get_async_redis_client())
+    return _exposure_tracker
+
+
+async def close_charm_exposure_tracker():
+    global _exposure_tracker
+    if _exposure_tracker is not None:
+        await _exposure_tracker.close()
+        _exposure_tracker = None
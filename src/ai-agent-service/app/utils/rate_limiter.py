@@ -0,0 +1,190 @@
+"""
+上游AI提供商客户端限流器
+Redis GCRA 实现集群级速率限制，进程内信号量限制并发；超限请求短暂排队而不是直接失败
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# GCRA：使用Redis服务器时间，返回需要等待的毫秒数（0表示放行并已占用配额）
+GCRA_SCRIPT = """
+local key = KEYS[1]
+local emission_interval = tonumber(ARGV[1])
+local burst_tolerance = tonumber(ARGV[2])
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local tat = tonumber(redis.call('GET', key))
+if tat == nil or tat < now then
+    tat = now
+end
+
+local wait = tat - now - burst_tolerance
+if wait > 0 then
+    return math.ceil(wait)
+end
+
+local new_tat = tat + emission_interval
+redis.call('SET', key, new_tat, 'PX', math.ceil(new_tat - now + emission_interval))
+return 0
+"""
+
+
+class RateLimitExceeded(Exception):
+    """排队等待超过上限仍未获得配额"""
+    pass
+
+
+class ProviderRateLimiter:
+    """单个上游提供商的限流器
+
+    配置（NAME为提供商名大写，如 GEMINI_TEXT）：
+        AI_RATE_LIMIT_{NAME}_RPM          每分钟请求数，0表示不限
+        AI_RATE_LIMIT_{NAME}_BURST        允许的突发请求数
+        AI_RATE_LIMIT_{NAME}_CONCURRENCY  本进程最大并发，0表示不限
+        AI_RATE_LIMIT_{NAME}_MAX_WAIT     最长排队秒数
+    未单独配置时使用 AI_RATE_LIMIT_DEFAULT_* 。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        env_name = name.upper()
+
+        def conf(key: str, default: str) -> str:
+            return os.getenv(f"AI_RATE_LIMIT_{env_name}_{key}", os.getenv(f"AI_RATE_LIMIT_DEFAULT_{key}", default))
+
+        self.rpm = float(conf("RPM", "0"))
+        self.burst = max(1, int(conf("BURST", "1")))
+        self.concurrency = int(conf("CONCURRENCY", "0"))
+        self.max_wait = float(conf("MAX_WAIT", "30"))
+        self.use_redis = os.getenv("AI_RATE_LIMIT_REDIS", "on") == "on"
+
+        self.redis_key = f"ratelimit:gcra:{name}"
+        self.emission_interval_ms = 60000.0 / self.rpm if self.rpm > 0 else 0.0
+        self.burst_tolerance_ms = self.emission_interval_ms * (self.burst - 1)
+
+        self._semaphore = asyncio.Semaphore(self.concurrency) if self.concurrency > 0 else None
+        self._script = None
+        self._local_tat = 0.0
+
+        # 运行指标
+        self.waiting = 0
+        self.in_flight = 0
+        self.total_wait_seconds = 0.0
+        self.rejected = 0
+
+        if self.rpm > 0 or self._semaphore:
+            logger.info(f"🚦 限流器 {name}: rpm={self.rpm}, burst={self.burst}, concurrency={self.concurrency}")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """获取一次调用配额，退出上下文时释放并发槽位"""
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        self.waiting += 1
+        try:
+            if self._semaphore:
+                try:
+                    await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+                except asyncio.TimeoutError:
+                    self.rejected += 1
+                    raise RateLimitExceeded(f"{self.name} 并发排队超过 {self.max_wait}s")
+
+            try:
+                await self._wait_for_token(deadline)
+            except BaseException:
+                if self._semaphore:
+                    self._semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        self.total_wait_seconds += waited
+        if waited > 0.5:
+            logger.info(f"🚦 {self.name} 排队 {waited:.2f}s 后放行")
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if self._semaphore:
+                self._semaphore.release()
+
+    async def _wait_for_token(self, deadline: float):
+        if self.emission_interval_ms <= 0:
+            return
+
+        while True:
+            wait_ms = await self._take_token()
+            if wait_ms <= 0:
+                return
+            # 加入抖动，避免多个等待者在同一时刻重新争抢
+            wait_seconds = wait_ms / 1000.0 * random.uniform(1.0, 1.2)
+            if time.monotonic() + wait_seconds > deadline:
+                self.rejected += 1
+                raise RateLimitExceeded(f"{self.name} 速率排队超过 {self.max_wait}s")
+            await asyncio.sleep(wait_seconds)
+
+    async def _take_token(self) -> float:
+        if self.use_redis:
+            try:
+                from .redis_client import get_async_redis_client
+
+                client = get_async_redis_client()
+                if self._script is None:
+                    self._script = client.register_script(GCRA_SCRIPT)
+                result = await self._script(
+                    keys=[self.redis_key],
+                    args=[self.emission_interval_ms, self.burst_tolerance_ms]
+                )
+                return float(result)
+            except Exception as e:
+                logger.warning(f"⚠️ Redis限流不可用，使用进程内限流: {e}")
+
+        return self._take_local_token()
+
+    def _take_local_token(self) -> float:
+        """进程内GCRA（Redis不可用时的降级）"""
+        now = time.monotonic() * 1000
+        tat = max(self._local_tat, now)
+        wait = tat - now - self.burst_tolerance_ms
+        if wait > 0:
+            return wait
+        self._local_tat = tat + self.emission_interval_ms
+        return 0.0
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            "rpm": self.rpm,
+            "concurrency": self.concurrency,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "total_wait_seconds": round(self.total_wait_seconds, 3),
+            "rejected": self.rejected
+        }
+
+
+_limiters: Dict[str, ProviderRateLimiter] = {}
+
+
+def get_rate_limiter(name: str) -> ProviderRateLimiter:
+    """获取指定提供商的进程级限流器"""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        limiter = ProviderRateLimiter(name)
+        _limiters[name] = limiter
+    return limiter
+
+
+def get_all_rate_limiter_stats() -> Dict[str, Dict[str, float]]:
+    return {name: limiter.get_stats() for name, limiter in _limiters.items()}
@@ -1,6 +1,6 @@
 """
 Redis Client 单例管理器
-提供同步Redis连接供签体曝光追踪器使用
+提供同步Redis连接供签体曝光追踪器使用，以及异步Redis连接供缓存等组件使用
 """
 
 import redis
@@ -10,6 +10,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 _redis_client = None
+_async_redis_client = None
 
 def get_redis_client():
     """获取Redis客户端单例（同步版本）"""
@@ -53,10 +54,36 @@ def get_redis_client():
 
     return _redis_client
 
+def get_async_redis_client():
+    """获取Redis客户端单例（异步版本，惰性连接）"""
+    global _async_redis_client
+
+    if _async_redis_client is None:
+        import redis.asyncio as aioredis
+
+        redis_url = os.getenv("REDIS_URL", "redis://redis:6379")
+        _async_redis_client = aioredis.from_url(
+            redis_url,
+            password=os.getenv("REDIS_PASSWORD", "redis"),
+            db=int(os.getenv("REDIS_DB", "0")),
+            decode_responses=False
+        )
+        logger.info(f"✅ Redis异步客户端已创建: {redis_url}")
+
+    return _async_redis_client
+
 def close_redis_client():
     """关闭Redis连接（优雅退出时调用）"""
     global _redis_client
     if _redis_client:
         _redis_client.close()
         _redis_client = None
-        logger.info("✅ Redis连接已关闭")
\ No newline at end of file
+        logger.info("✅ Redis连接已关闭")
+
+async def close_async_redis_client():
+    """关闭异步Redis连接（优雅退出时调用）"""
+    global _async_redis_client
+    if _async_redis_client:
+        await _async_redis_client.close()
+        _async_redis_client = None
+        logger.info("✅ Redis异步连接已关闭")
@@ -27,6 +27,11 @@ class Worker:
     def __init__(self):
         self.consumer = TaskConsumer()
         self.running = False
+        self.gc_task = None
+        self.reap_task = None
+        self.warm_task = None
+        self.sweep_task = None
+        self.health_task = None
     
     async def start(self):
         """启动工作进程"""
@@ -39,6 +44,23 @@ class Worker:
             # 设置信号处理
             self.setup_signal_handlers()
             
+            # 启动存储GC（回收未被明信片引用的生成产物）
+            from .storage import get_content_store
+            self.gc_task = asyncio.create_task(get_content_store().run_gc_loop())
+            
+            # 启动过期文件回收（内容寻址存储之外直接落盘的生成文件）
+            from .storage import get_expiry_index
+            self.reap_task = asyncio.create_task(get_expiry_index().run_reaper_loop())
+            
+            # 启动场景图缓存预热（SCENE_CACHE_WARM_INTERVAL>0时生效）
+            from .services.scene_image_cache import get_scene_image_cache
+            self.warm_task = asyncio.create_task(get_scene_image_cache().run_warm_loop())
+            self.sweep_task = asyncio.create_task(get_scene_image_cache().run_sweep_loop())
+            
+            # 启动提供商健康探测（结果供图片路由与 /health 读取）
+            from .providers.health_monitor import get_provider_health_monitor
+            self.health_task = asyncio.create_task(get_provider_health_monitor().run_loop())
+            
             # 开始消费任务
             self.running = True
             await self.consumer.start_consuming()
@@ -57,6 +79,43 @@ class Worker:
             logger.info("🔄 停止 AI Agent Worker")
             self.running = False
             await self.consumer.stop_consuming()
+            
+            if self.gc_task:
+                self.gc_task.cancel()
+            if self.reap_task:
+                self.reap_task.cancel()
+            if self.warm_task:
+                self.warm_task.cancel()
+            if self.sweep_task:
+                self.sweep_task.cancel()
+            if self.health_task:
+                self.health_task.cancel()
+            
+            # 关闭共享的上游HTTP会话
+            from .providers.laozhang_image_provider import LaoZhangImageProvider
+            await LaoZhangImageProvider.close_session()
+            
+            from .services.image_derivatives import get_image_derivative_service
+            get_image_derivative_service().shutdown()
+            
+            from .services.image_normalizer import get_image_normalizer
+            get_image_normalizer().shutdown()
+            
+            from .services.card_compositor import get_card_compositor
+            get_card_compositor().shutdown()
+            
+            # 停止本进程拉起的HTML渲染进程
+            from .services.render_scheduler import close_render_scheduler
+            await close_render_scheduler()
+            from .services.html_renderer import close_html_renderer
+            await close_html_renderer()
+            
+            # 刷出尚未写入Redis的签体曝光记录
+            from .utils.charm_exposure_tracker import close_charm_exposure_tracker
+            await close_charm_exposure_tracker()
+            
+            from .storage import close_storage
+            await close_storage()
     
     def setup_signal_handlers(self):
         """设置信号处理器"""
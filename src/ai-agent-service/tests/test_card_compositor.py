@@ -0,0 +1,134 @@
+"""
+卡片合成测试
+用等宽测试字体验证中文逐字断行、拉丁单词整体断行与避头尾规则，用仓库内的书法字体验证行宽不超限，并验证背景图来源限制
+"""
+
+import asyncio
+import os
+import sys
+
+import aiohttp
+import pytest
+from PIL import ImageFont
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.card_compositor import NO_LINE_END, NO_LINE_START, CardCompositor, wrap_text
+
+FONT_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "..", "resources", "font", "ma-shan-zheng-6500.woff")
+
+
+class MonoFont:
+    """每个字符宽10像素的测试字体"""
+
+    def getlength(self, text: str) -> float:
+        return 10.0 * len(text)
+
+
+FONT = MonoFont()
+
+
+class TestWrapText:
+    """换行与避头尾"""
+
+    def test_breaks_cjk_per_character(self):
+        assert wrap_text("春风十里不如你", FONT, 30) == ["春风十", "里不如", "你"]
+
+    def test_keeps_latin_words_whole(self):
+        assert wrap_text("hello world", FONT, 80) == ["hello", "world"]
+        assert wrap_text("心情 sunny 明天", FONT, 60) == ["心情", "sunny", "明天"]
+
+    def test_punctuation_not_at_line_start(self):
+        lines = wrap_text("一二三，四五", FONT, 30)
+
+        # 逗号带着前一个字一起换到下一行
+        assert lines == ["一二", "三，四", "五"]
+        assert all(line[0] not in NO_LINE_START for line in lines)
+
+    def test_consecutive_punctuation_hangs(self):
+        # 前一个字同样是行首禁用标点时，后一个标点悬挂在行尾
+        assert wrap_text("一二。”", FONT, 20) == ["一", "二。”"]
+
+    def test_opening_bracket_not_at_line_end(self):
+        lines = wrap_text("一二《三》", FONT, 30)
+
+        assert lines == ["一二", "《三》"]
+        assert all(line[-1] not in NO_LINE_END for line in lines)
+
+    def test_latin_punctuation_rules(self):
+        lines = wrap_text("abc (de) fg.", FONT, 40)
+
+        assert "".join(lines).replace(" ", "") == "abc(de)fg."
+        assert all(line and line[0] not in NO_LINE_START and line[-1] not in NO_LINE_END for line in lines)
+
+    def test_paragraphs_and_leading_spaces(self):
+        assert wrap_text("一\n  二", FONT, 30) == ["一", "二"]
+        assert wrap_text("", FONT, 30) == [""]
+
+    def test_max_lines_ellipsis(self):
+        lines = wrap_text("一二三四五六七八九", FONT, 30, max_lines=2)
+
+        assert lines == ["一二三", "四五…"]
+
+
+@pytest.mark.skipif(not os.path.isfile(FONT_PATH), reason="缺少书法字体资源")
+class TestWrapTextWithFont:
+    """真实字体下的行宽"""
+
+    def test_lines_fit_width(self):
+        font = ImageFont.truetype(FONT_PATH, 32)
+        text = "愿你在山风与海浪之间，找到属于自己的节奏。（慢一点也没关系）明天会更好！"
+
+        lines = wrap_text(text, font, 200)
+
+        assert len(lines) > 1
+        assert "".join(lines) == text
+        assert all(font.getlength(line) <= 200 + font.getlength("！") for line in lines)
+        assert all(line[0] not in NO_LINE_START and line[-1] not in NO_LINE_END for line in lines)
+
+
+class TestFontFallback:
+    """字体文件缺失时按字号回退到Pillow内置字体"""
+
+    def test_missing_font_uses_sized_default(self):
+        font = CardCompositor._load_font("/nonexistent/font.woff", 40)
+
+        assert font.getlength("字") > CardCompositor._load_font("/nonexistent/font.woff", 12).getlength("字")
+
+
+class TestBackgroundSource:
+    """背景图来源限制（/card-image 无需鉴权，不能代为请求任意URL）"""
+
+    KEY_URL = "/static/generated/cas/ab/cd/" + "0" * 64 + ".png"
+
+    @pytest.fixture
+    def compositor(self, monkeypatch):
+        monkeypatch.setenv("AI_AGENT_PUBLIC_URL", "https://card.example.com/")
+        monkeypatch.setenv("CARD_BACKGROUND_HOSTS", "images.example.com, CDN.example.com")
+        return CardCompositor()
+
+    def test_allowed_sources(self, compositor):
+        assert compositor.background_allowed(None)
+        assert compositor.background_allowed(self.KEY_URL)
+        assert compositor.background_allowed("https://card.example.com/static/banner.png")
+        assert compositor.background_allowed("https://cdn.example.com/bg.jpg")
+
+    def test_rejected_sources(self, compositor):
+        for url in (
+            "http://169.254.169.254/latest/meta-data/",
+            "http://localhost:6379/",
+            "https://card.example.com.evil.com/bg.png",
+            "https://card.example.com@evil.com/bg.png",
+            "file:///etc/passwd",
+            "/static/banner.png",
+            {"url": "https://cdn.example.com/bg.jpg"},
+        ):
+            assert not compositor.background_allowed(url), url
+
+    def test_rejected_source_not_fetched(self, compositor, monkeypatch):
+
+        sessions = []
+        monkeypatch.setattr(aiohttp, "ClientSession", lambda *args, **kwargs: sessions.append(args))
+
+        assert asyncio.run(compositor._fetch_background("http://10.0.0.1/admin")) is None
+        assert sessions == []
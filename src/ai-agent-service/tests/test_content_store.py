@@ -0,0 +1,239 @@
+"""
+内容寻址存储测试
+使用 fakeredis 与临时目录中的本地后端，验证内容去重、流式暂存、引用登记/解除、GC认领以及GC删除与去重写入的竞争
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+import time
+
+import fakeredis
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.storage.content_store as content_store
+import app.utils.redis_client as redis_client
+from app.storage.content_store import (
+    DELETING_KEY_PREFIX,
+    GC_CANDIDATES_KEY,
+    OWNER_KEY_PREFIX,
+    REFS_KEY_PREFIX,
+    ContentStore,
+    UploadTooLarge,
+)
+from app.storage.local_backend import LocalStorageBackend
+
+
+@pytest.fixture
+def run_store(tmp_path, monkeypatch):
+    """在独立事件循环中以 scenario(store, redis) 运行，每个场景使用全新的 fakeredis 与存储目录"""
+    monkeypatch.setenv("CONTENT_STORE_RELEASE_GRACE", "0")
+    monkeypatch.setenv("CONTENT_STORE_STAGING_DIR", str(tmp_path / "staging"))
+
+    def run(scenario):
+        async def main():
+            client = fakeredis.aioredis.FakeRedis()
+            monkeypatch.setattr(redis_client, "get_async_redis_client", lambda: client)
+            store = ContentStore()
+            store.backend = LocalStorageBackend(root=str(tmp_path / "objects"))
+            return await scenario(store, client)
+
+        return asyncio.run(main())
+
+    return run
+
+
+class TestDeduplication:
+    """相同内容只存一份"""
+
+    def test_put_bytes_reuses_existing_object(self, run_store):
+        async def scenario(store, client):
+            first = await store.put_bytes(b"same-content", "png")
+            second = await store.put_bytes(b"same-content", "png")
+
+            assert first["key"] == second["key"]
+            assert first["deduplicated"] is False
+            assert second["deduplicated"] is True
+            assert first["key"].startswith("cas/")
+            assert await store.get_bytes(first["key"]) == b"same-content"
+            # 新对象登记为GC候选，宽限期之后才可回收
+            assert await client.zscore(GC_CANDIDATES_KEY, first["key"]) > time.time()
+
+        run_store(scenario)
+
+    def test_put_file_moves_source_and_dedupes(self, run_store, tmp_path):
+        async def scenario(store, client):
+            paths = []
+            for name in ("a.bin", "b.bin"):
+                path = tmp_path / name
+                path.write_bytes(b"file-content")
+                paths.append(path)
+
+            first = await store.put_file(str(paths[0]), "bin")
+            second = await store.put_file(str(paths[1]), "bin")
+
+            assert first["key"] == second["key"]
+            assert second["deduplicated"] is True
+            assert not paths[0].exists() and not paths[1].exists()
+            assert await store.get_bytes(first["key"]) == b"file-content"
+
+        run_store(scenario)
+
+    def test_stage_stream_hashes_and_cleans_up(self, run_store, monkeypatch):
+        # 调小写盘阈值，覆盖分块写入与末尾剩余数据
+        monkeypatch.setattr(content_store, "STAGE_FLUSH_SIZE", 10)
+        chunks = [b"0123456", b"789abcd", b"ef"]
+
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+
+        async def scenario(store, client):
+            async with store.stage_stream(stream(), max_size=64) as staged:
+                with open(staged["path"], "rb") as f:
+                    assert f.read() == b"".join(chunks)
+                assert staged["hash"] == hashlib.sha256(b"".join(chunks)).hexdigest()
+                assert staged["size"] == 16
+            assert not os.path.exists(staged["path"])
+
+        run_store(scenario)
+
+    def test_stage_stream_rejects_oversized(self, run_store, tmp_path):
+        async def stream():
+            for _ in range(4):
+                yield b"x" * 10
+
+        async def scenario(store, client):
+            with pytest.raises(UploadTooLarge):
+                async with store.stage_stream(stream(), max_size=25):
+                    pass
+            # 中止后不留下暂存文件
+            assert os.listdir(tmp_path / "staging") == []
+
+        run_store(scenario)
+
+
+class TestReferences:
+    """引用登记、解除与按任务释放"""
+
+    def test_add_and_remove_references(self, run_store):
+        async def scenario(store, client):
+            stored = await store.put_bytes(b"referenced", "png", retention=0)
+            key = stored["key"]
+
+            await store.add_references("task-1", [key])
+            assert await client.smembers(f"{REFS_KEY_PREFIX}{key}") == {b"task-1"}
+            assert await client.smembers(f"{OWNER_KEY_PREFIX}task-1") == {key.encode()}
+
+            # 被引用的到期候选只出队不删除
+            assert await store.collect_garbage() == 0
+            assert await store.exists(key)
+
+            await store.remove_references("task-1", [key])
+            assert await client.scard(f"{REFS_KEY_PREFIX}{key}") == 0
+            assert await client.zscore(GC_CANDIDATES_KEY, key) is not None
+
+            assert await store.collect_garbage() == 1
+            assert not await store.exists(key)
+
+        run_store(scenario)
+
+    def test_release_owner(self, run_store):
+        async def scenario(store, client):
+            keys = [(await store.put_bytes(data, "png", retention=0))["key"] for data in (b"one", b"two")]
+            await store.add_references("task-1", keys)
+            await store.add_references("task-2", keys[:1])
+
+            assert await store.release_owner("task-1") == 2
+            assert not await client.exists(f"{OWNER_KEY_PREFIX}task-1")
+
+            # 仍被 task-2 引用的对象保留
+            assert await store.collect_garbage() == 1
+            assert await store.exists(keys[0])
+            assert not await store.exists(keys[1])
+
+        run_store(scenario)
+
+    def test_release_keeps_longer_retention(self, run_store):
+        async def scenario(store, client):
+            stored = await store.put_bytes(b"uploaded", "webp", retention=3600)
+            await store.add_references("task-1", [stored["key"]])
+            await store.release_owner("task-1")
+
+            # 引用解除不会缩短上传时登记的保留期
+            assert await client.zscore(GC_CANDIDATES_KEY, stored["key"]) > time.time() + 3000
+            assert await store.collect_garbage() == 0
+
+        run_store(scenario)
+
+
+class TestGarbageCollection:
+    """GC认领与去重写入的竞争"""
+
+    def test_retain_postpones_claim(self, run_store):
+        async def scenario(store, client):
+            stored = await store.put_bytes(b"cached", "png", retention=0)
+            assert await store.retain(stored["key"], 3600) is True
+
+            assert await store.collect_garbage() == 0
+            assert await store.exists(stored["key"])
+
+        run_store(scenario)
+
+    def test_concurrent_collectors_delete_once(self, run_store):
+        async def scenario(store, client):
+            for data in (b"a", b"b", b"c"):
+                await store.put_bytes(data, "png", retention=0)
+
+            other = ContentStore()
+            other.backend = store.backend
+            results = await asyncio.gather(store.collect_garbage(), other.collect_garbage())
+
+            assert sum(results) == 3
+            assert await client.zcard(GC_CANDIDATES_KEY) == 0
+            assert not await client.keys(f"{DELETING_KEY_PREFIX}*")
+
+        run_store(scenario)
+
+    def test_dedupe_during_delete_rewrites_object(self, run_store):
+        async def scenario(store, client):
+            stored = await store.put_bytes(b"racing", "png", retention=0)
+            key = stored["key"]
+
+            claimed = asyncio.Event()
+            backend_delete = store.backend.delete
+
+            async def slow_delete(target):
+                claimed.set()
+                await asyncio.sleep(0.2)
+                return await backend_delete(target)
+
+            store.backend.delete = slow_delete
+            gc_task = asyncio.create_task(store.collect_garbage())
+            await claimed.wait()
+
+            # GC已认领、尚未删除：写入方不能复用即将被删除的对象
+            assert await client.exists(f"{DELETING_KEY_PREFIX}{key}")
+            again = await store.put_bytes(b"racing", "png")
+
+            assert await gc_task == 1
+            assert again["deduplicated"] is False
+            assert await store.get_bytes(key) == b"racing"
+            assert not await client.exists(f"{DELETING_KEY_PREFIX}{key}")
+
+        run_store(scenario)
+
+    def test_claim_skips_candidate_registered_after_due(self, run_store):
+        async def scenario(store, client):
+            stored = await store.put_bytes(b"revived", "png", retention=0)
+            # 候选已到期，但去重写入在GC认领前重新登记
+            again = await store.put_bytes(b"revived", "png")
+
+            assert again["deduplicated"] is True
+            assert await store.collect_garbage() == 0
+            assert await store.get_bytes(stored["key"]) == b"revived"
+
+        run_store(scenario)
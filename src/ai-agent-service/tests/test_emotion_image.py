@@ -0,0 +1,104 @@
+"""
+任务情绪图片测试
+使用 fakeredis 与临时目录中的本地后端（规范化改用线程池），验证按引用传递的图片登记任务引用，
+旧版内联 emotion_image_base64 规范化后转存为引用，无效图片不影响任务继续
+"""
+
+import asyncio
+import base64
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import fakeredis
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.queue.consumer as consumer_module
+import app.services.image_normalizer as image_normalizer
+import app.storage as storage
+import app.utils.redis_client as redis_client
+from app.storage.content_store import REFS_KEY_PREFIX, ContentStore
+from app.storage.local_backend import LocalStorageBackend
+
+
+def _png_base64() -> str:
+    buffer = BytesIO()
+    Image.new("RGB", (2048, 1024), (120, 160, 200)).save(buffer, "PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+@pytest.fixture
+def run_consumer(tmp_path, monkeypatch):
+    """在独立事件循环中以 scenario(consumer, store, redis) 运行"""
+    monkeypatch.setenv("CONTENT_STORE_STAGING_DIR", str(tmp_path / "staging"))
+    monkeypatch.setattr(consumer_module, "PostcardWorkflow", lambda: None)
+
+    normalizer = image_normalizer.ImageNormalizer()
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(normalizer, "_get_pool", lambda: pool)
+    monkeypatch.setattr(image_normalizer, "_image_normalizer", normalizer)
+
+    def run(scenario):
+        async def main():
+            client = fakeredis.aioredis.FakeRedis()
+            monkeypatch.setattr(redis_client, "get_async_redis_client", lambda: client)
+            store = ContentStore()
+            store.backend = LocalStorageBackend(root=str(tmp_path / "objects"))
+            monkeypatch.setattr(storage, "get_content_store", lambda: store)
+            return await scenario(consumer_module.TaskConsumer(), store, client)
+
+        return asyncio.run(main())
+
+    yield run
+    pool.shutdown(wait=True)
+
+
+class TestEmotionImage:
+    """情绪图片引用与旧版内联图片"""
+
+    def test_inline_base64_is_normalized_and_referenced(self, run_consumer):
+        async def scenario(consumer, store, client):
+            task = {"task_id": "t1", "emotion_image_ref": None, "emotion_image_base64": _png_base64()}
+            await consumer._reference_emotion_image(task)
+
+            # 任务数据不再携带base64，改为指向规范化后图片的引用
+            assert "emotion_image_base64" not in task
+            key = store.key_from_blob_ref(task["emotion_image_ref"])
+            assert key and key.endswith(".webp")
+            assert await client.sismember(f"{REFS_KEY_PREFIX}{key}", "t1")
+            image = Image.open(BytesIO(await store.get_bytes(key)))
+            assert (image.format, image.size) == ("WEBP", (1024, 512))
+
+            # 同一原图再次内联时复用已保存的规范化结果
+            again = {"task_id": "t2", "emotion_image_base64": _png_base64()}
+            await consumer._reference_emotion_image(again)
+            assert again["emotion_image_ref"] == task["emotion_image_ref"]
+
+        run_consumer(scenario)
+
+    def test_ref_takes_precedence_over_inline(self, run_consumer):
+        async def scenario(consumer, store, client):
+            stored = await store.put_bytes(b"uploaded", "webp")
+            ref = store.blob_ref(stored["key"])
+            task = {"task_id": "t1", "emotion_image_ref": ref, "emotion_image_base64": _png_base64()}
+            await consumer._reference_emotion_image(task)
+
+            assert task["emotion_image_ref"] == ref
+            assert "emotion_image_base64" not in task
+            assert await client.sismember(f"{REFS_KEY_PREFIX}{stored['key']}", "t1")
+
+        run_consumer(scenario)
+
+    def test_invalid_inline_image_is_ignored(self, run_consumer):
+        async def scenario(consumer, store, client):
+            task = {"task_id": "t1", "emotion_image_base64": base64.b64encode(b"not an image").decode("ascii")}
+            await consumer._reference_emotion_image(task)
+
+            assert "emotion_image_base64" not in task
+            assert not task.get("emotion_image_ref")
+
+        run_consumer(scenario)
@@ -0,0 +1,89 @@
+"""
+生成产物过期索引测试
+使用 fakeredis 与临时文件，验证按过期时间回收、按写入时间清理（不误删保留期较短的在用文件）与历史文件回填
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import fakeredis
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.utils.redis_client as redis_client
+from app.storage.expiry_index import EXPIRY_KEY, WRITTEN_KEY, ExpiryIndex
+
+
+@pytest.fixture
+def run_index(monkeypatch):
+    """在独立事件循环中以 scenario(index, redis) 运行"""
+    monkeypatch.setenv("ARTIFACT_TTL", str(24 * 3600))
+
+    def run(scenario):
+        async def main():
+            client = fakeredis.aioredis.FakeRedis()
+            monkeypatch.setattr(redis_client, "get_async_redis_client", lambda: client)
+            return await scenario(ExpiryIndex(), client)
+
+        return asyncio.run(main())
+
+    return run
+
+
+def _touch(path, age: float = 0) -> str:
+    path.write_bytes(b"x")
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+    return str(path)
+
+
+class TestExpiryIndex:
+    """过期回收与按年龄清理"""
+
+    def test_reap_expired_only(self, run_index, tmp_path):
+        expired, fresh = _touch(tmp_path / "expired.png"), _touch(tmp_path / "fresh.png")
+
+        async def scenario(index, client):
+            await index.register(expired, ttl=-1)
+            await index.register(fresh)
+            assert await index.reap_all() == 1
+            # 两个索引中的条目同时移除
+            assert await client.zcard(EXPIRY_KEY) == 1
+            assert await client.zcard(WRITTEN_KEY) == 1
+
+        run_index(scenario)
+        assert not os.path.exists(expired)
+        assert os.path.exists(fresh)
+
+    def test_age_cleanup_keeps_short_ttl_files(self, run_index, tmp_path):
+        old, staged = _touch(tmp_path / "old.png"), _touch(tmp_path / "staged.upload")
+
+        async def scenario(index, client):
+            await index.register_many({old: time.time() + 3600}, {old: time.time() - 25 * 3600})
+            # 刚写入、保留期只有1小时的暂存文件不能按"24小时前写入"清理掉
+            await index.register(staged, ttl=3600)
+            assert await index.reap_all(written_before=time.time() - 24 * 3600) == 1
+            assert await client.zscore(EXPIRY_KEY, os.path.abspath(staged)) is not None
+
+        run_index(scenario)
+        assert not os.path.exists(old)
+        assert os.path.exists(staged)
+
+    def test_backfill_uses_mtime(self, run_index, tmp_path):
+        old = _touch(tmp_path / "old.png", age=30 * 3600)
+        recent = _touch(tmp_path / "recent.png", age=3600)
+
+        async def scenario(index, client):
+            assert await index.backfill([str(tmp_path)]) == 2
+            # 30小时前写入、保留24小时的文件已过期
+            assert await index.pending() == 1
+            assert await index.pending(written_before=time.time() - 2 * 3600) == 1
+            assert await index.reap_all() == 1
+
+        run_index(scenario)
+        assert not os.path.exists(old)
+        assert os.path.exists(recent)
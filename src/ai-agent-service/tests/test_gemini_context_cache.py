@@ -0,0 +1,113 @@
+"""
+Gemini上下文缓存测试
+用记录调用的假客户端替换 genai.Client，验证生成步骤的真实静态前缀会创建并复用上下文缓存、
+过短前缀直接发送完整prompt，以及缓存被拒绝时作废条目并用完整prompt重试
+"""
+
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors as genai_errors
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.orchestrator.steps.two_stage_analyzer import TwoStageAnalyzer
+from app.orchestrator.steps.two_stage_generator import TwoStageGenerator
+from app.providers.gemini_text_provider import GeminiTextProvider
+
+
+class FakeGenaiClient:
+    """记录 caches.create 与 models.generate_content 调用的假客户端"""
+
+    def __init__(self, reject_cache: bool = False):
+        self.created = []
+        self.generated = []
+        self.reject_cache = reject_cache
+        self.caches = SimpleNamespace(create=self._create_cache, update=lambda **kwargs: None)
+        self.models = SimpleNamespace(generate_content=self._generate_content)
+
+    def _create_cache(self, model, config):
+        self.created.append(config)
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+    def _generate_content(self, model, contents, config=None):
+        cache_name = getattr(config, "cached_content", None)
+        self.generated.append({"contents": contents, "cached_content": cache_name})
+        if cache_name and self.reject_cache:
+            raise genai_errors.ClientError(404, {"error": {"code": 404, "message": "cache not found", "status": "NOT_FOUND"}})
+        part = SimpleNamespace(text="{}")
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+
+@pytest.fixture
+def make_provider(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("GEMINI_CONTEXT_CACHE", "on")
+    monkeypatch.setenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024")
+    monkeypatch.setenv("AI_RATE_LIMIT_GEMINI_TEXT_RPM", "0")
+    monkeypatch.setattr(GeminiTextProvider, "_context_caches", {})
+    monkeypatch.setattr(GeminiTextProvider, "_context_cache_locks", {})
+
+    def make(**kwargs):
+        provider = GeminiTextProvider()
+        provider.client = FakeGenaiClient(**kwargs)
+        return provider
+
+    return make
+
+
+class TestContextCache:
+    """静态前缀的上下文缓存"""
+
+    def test_generation_prefix_is_cached(self, make_provider):
+        provider = make_provider()
+        prefix = TwoStageGenerator.generation_prompt_prefix()
+        # 含签体目录的生成前缀超过模型最小可缓存长度
+        assert provider._estimate_tokens(prefix) >= provider.context_cache_min_tokens
+
+        async def scenario():
+            for _ in range(2):
+                await provider.generate_text("## 分析报告\n情绪状态: 平静", cached_prefix=prefix)
+
+        asyncio.run(scenario())
+
+        client = provider.client
+        assert len(client.created) == 1
+        assert client.created[0].contents == [prefix]
+        # 两次请求都只发送动态后缀并引用同一缓存
+        assert [call["cached_content"] for call in client.generated] == ["cachedContents/1"] * 2
+        assert all(call["contents"] == "## 分析报告\n情绪状态: 平静" for call in client.generated)
+
+    def test_short_prefix_sends_full_prompt(self, make_provider):
+        provider = make_provider()
+        prefix = TwoStageAnalyzer.ANALYSIS_PROMPT_PREFIX
+        assert provider._estimate_tokens(prefix) < provider.context_cache_min_tokens
+
+        asyncio.run(provider.generate_text("用户输入: 今天很开心", cached_prefix=prefix))
+
+        assert provider.client.created == []
+        assert provider.client.generated == [
+            {"contents": provider.compose_prompt("用户输入: 今天很开心", prefix), "cached_content": None}
+        ]
+
+    def test_rejected_cache_retries_with_full_prompt(self, make_provider):
+        provider = make_provider(reject_cache=True)
+        prefix = TwoStageGenerator.generation_prompt_prefix()
+
+        result = asyncio.run(provider.generate_text("动态部分", cached_prefix=prefix))
+
+        assert result == "{}"
+        assert [call["cached_content"] for call in provider.client.generated] == ["cachedContents/1", None]
+        assert provider.client.generated[1]["contents"] == provider.compose_prompt("动态部分", prefix)
+        # 被拒绝的缓存条目已作废，下次请求重新创建
+        assert GeminiTextProvider._context_caches == {}
+
+    def test_prefix_follows_catalog_version(self):
+        prefix = TwoStageGenerator.generation_prompt_prefix()
+        assert prefix.startswith(TwoStageGenerator.GENERATION_PROMPT_PREFIX)
+        assert "## 签体目录" in prefix
+        # 同一目录版本复用同一前缀对象（缓存键稳定）
+        assert TwoStageGenerator.generation_prompt_prefix() is prefix
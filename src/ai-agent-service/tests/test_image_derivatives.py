@@ -0,0 +1,115 @@
+"""
+派生图后处理测试
+用线程池代替进程池、用假存储注入写入失败（S3后端下的派生图见 test_s3_storage），验证派生图生成/写入失败时只放弃派生图，原图照常返回
+"""
+
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.services.image_derivatives as image_derivatives
+import app.services.scene_image_cache as scene_image_cache
+from app.orchestrator.steps.image_generator import ImageGenerator
+from app.providers.base_provider import BaseImageProvider
+from app.providers.provider_factory import ProviderFactory
+
+ORIGINAL_KEY = "cas/ab/cd/original.png"
+ORIGINAL_URL = f"/generated/{ORIGINAL_KEY}"
+
+
+def _png_bytes() -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (64, 48), (200, 180, 150)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class FakeStore:
+    """原图以字节返回（与S3后端一致），put_bytes 按需抛出存储错误"""
+
+    def __init__(self, fail_writes: bool):
+        self.fail_writes = fail_writes
+        self.written = []
+
+    async def read_source(self, key):
+        return _png_bytes() if key == ORIGINAL_KEY else None
+
+    async def put_bytes(self, data, ext, retention=None):
+        if self.fail_writes:
+            raise ConnectionError("存储不可用")
+        key = f"cas/00/00/{len(self.written)}.{ext}"
+        self.written.append(key)
+        return {"key": key, "url": f"/generated/{key}"}
+
+
+class StoredImageProvider(BaseImageProvider):
+    """返回已写入存储的原图"""
+
+    async def generate_image(self, prompt, size=None, quality=None, **kwargs):
+        return {"image_url": ORIGINAL_URL, "metadata": {"provider": "stored", "storage_key": ORIGINAL_KEY}}
+
+    async def health_check(self) -> bool:
+        return True
+
+
+@pytest.fixture
+def make_generator(monkeypatch):
+    """以 fail_writes 构造使用假存储的图片生成器"""
+    monkeypatch.delenv("AI_PROVIDER_MODE", raising=False)
+    monkeypatch.setenv("IMAGE_PROVIDER_TYPE", "stored")
+    monkeypatch.setenv("IMAGE_PROVIDER_ROUTER", "off")
+    monkeypatch.setenv("SCENE_CACHE", "off")
+    monkeypatch.setenv("IMAGE_DERIVATIVE_SIZES", "thumb:16")
+    monkeypatch.setitem(ProviderFactory._image_providers, "stored", StoredImageProvider)
+    monkeypatch.setattr(scene_image_cache, "_scene_cache", None)
+
+    service = image_derivatives.ImageDerivativeService()
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(service, "_get_pool", lambda: pool)
+    monkeypatch.setattr(image_derivatives, "_derivative_service", service)
+
+    def make(fail_writes: bool):
+        store = FakeStore(fail_writes)
+        monkeypatch.setattr(image_derivatives, "get_content_store", lambda: store)
+        return ImageGenerator(), store
+
+    yield make
+    pool.shutdown(wait=True)
+
+
+def _context():
+    return {"task": {"task_id": "t1"}, "results": {"structured_data": {"oracle_theme": {"title": "山间小径"}}}}
+
+
+class TestDerivatives:
+    """派生图生成与失败降级"""
+
+    def test_variants_attached(self, make_generator):
+        generator, store = make_generator(fail_writes=False)
+
+        context = asyncio.run(generator.execute(_context()))
+
+        results = context["results"]
+        assert results["image_url"] == ORIGINAL_URL
+        assert set(results["image_variants"]) == {"hash", "thumb", "full"}
+        assert results["image_variants"]["thumb"]["width"] == 16
+        assert results["structured_data"]["visual"]["background_image_variants"] == results["image_variants"]
+        assert len(store.written) == 4
+
+    def test_storage_error_keeps_original(self, make_generator):
+        generator, store = make_generator(fail_writes=True)
+
+        context = asyncio.run(generator.execute(_context()))
+
+        # 派生图写入失败不影响主流程：保留原图，不替换为兜底图
+        results = context["results"]
+        assert results["image_url"] == ORIGINAL_URL
+        assert not results["image_metadata"].get("fallback")
+        assert "image_variants" not in results
+        assert "visual" not in results["structured_data"]
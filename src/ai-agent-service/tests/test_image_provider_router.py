@@ -0,0 +1,259 @@
+"""
+图片提供商路由器测试
+使用按脚本返回结果的假提供商，验证熔断（打开/半开探测/恢复）、失败切换、健康度排序与p95对冲
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.providers.base_provider import BaseImageProvider
+from app.providers.image_provider_router import ImageProviderRouter, ProviderStats
+from app.providers.provider_factory import ProviderFactory
+
+
+class ScriptedImageProvider(BaseImageProvider):
+    """按顺序执行预设结果的图片提供商：("ok"|"fallback"|"error", 延迟秒数)，用完后重复最后一项"""
+
+    def __init__(self, name: str, script):
+        super().__init__()
+        self.name = name
+        self.script = list(script)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def generate_image(self, prompt, size=None, quality=None, **kwargs):
+        outcome, delay = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if outcome == "error":
+            raise RuntimeError(f"{self.name} 上游错误")
+        if outcome == "fallback":
+            # 与真实提供商一致：内部吞掉异常并返回占位图
+            return {"image_url": "/static/placeholder.png", "metadata": {"provider": self.name, "fallback": True}}
+        return {"image_url": f"/generated/{self.name}.png", "metadata": {"provider": self.name}}
+
+    async def health_check(self) -> bool:
+        return True
+
+
+@pytest.fixture
+def make_router(monkeypatch):
+    """以 {名称: 脚本} 构造路由器（按字典顺序为配置顺序），返回 (router, providers)"""
+    monkeypatch.delenv("AI_PROVIDER_MODE", raising=False)
+    monkeypatch.setenv("IMAGE_ROUTER_FAILURE_THRESHOLD", "2")
+    monkeypatch.setenv("IMAGE_ROUTER_COOLDOWN", "60")
+
+    def make(scripts, **env):
+        for key, value in env.items():
+            monkeypatch.setenv(key, str(value))
+        providers = {name: ScriptedImageProvider(name, script) for name, script in scripts.items()}
+        for name, provider in providers.items():
+            monkeypatch.setitem(ProviderFactory._image_providers, name, lambda provider=provider: provider)
+        return ImageProviderRouter(list(scripts)), providers
+
+    return make
+
+
+class TestCircuitBreaker:
+    """熔断状态机"""
+
+    def test_opens_after_consecutive_failures(self):
+        stats = ProviderStats(window_size=10, failure_threshold=3, cooldown=60)
+        stats.record(0.1, False)
+        stats.record(0.1, False)
+        assert stats.state == ProviderStats.CLOSED
+        assert stats.allow_request()
+
+        stats.record(0.1, False)
+        assert stats.state == ProviderStats.OPEN
+        assert not stats.allow_request()
+
+    def test_success_resets_failure_count(self):
+        stats = ProviderStats(window_size=10, failure_threshold=2, cooldown=60)
+        stats.record(0.1, False)
+        stats.record(0.1, True)
+        stats.record(0.1, False)
+        assert stats.state == ProviderStats.CLOSED
+
+    def test_half_open_allows_single_probe(self):
+        stats = ProviderStats(window_size=10, failure_threshold=1, cooldown=60)
+        stats.record(0.1, False)
+        stats.opened_at = time.monotonic() - 61
+
+        assert stats.allow_request()
+        assert stats.state == ProviderStats.HALF_OPEN
+        stats.mark_dispatched()
+        # 探测请求在途时不再放行
+        assert not stats.allow_request()
+
+        stats.record(0.2, True)
+        assert stats.state == ProviderStats.CLOSED
+        assert stats.allow_request()
+
+    def test_failed_probe_reopens(self):
+        stats = ProviderStats(window_size=10, failure_threshold=3, cooldown=60)
+        for _ in range(3):
+            stats.record(0.1, False)
+        stats.opened_at = time.monotonic() - 61
+        assert stats.allow_request()
+        stats.mark_dispatched()
+
+        # 半开状态下一次失败即重新打开并重新计时
+        stats.record(0.1, False)
+        assert stats.state == ProviderStats.OPEN
+        assert not stats.allow_request()
+
+
+class TestFailover:
+    """失败切换与熔断跳过"""
+
+    def test_fallback_result_switches_provider(self, make_router):
+        router, providers = make_router({"primary": [("fallback", 0)], "secondary": [("ok", 0)]})
+
+        result = asyncio.run(router.generate_image("山间小径"))
+
+        assert result["image_url"] == "/generated/secondary.png"
+        assert result["metadata"]["routed_provider"] == "secondary"
+        assert providers["primary"].calls == 1
+        assert router.stats["primary"].consecutive_failures == 1
+
+    def test_exception_switches_provider(self, make_router):
+        router, providers = make_router({"primary": [("error", 0)], "secondary": [("ok", 0)]})
+
+        result = asyncio.run(router.generate_image("山间小径"))
+
+        assert result["metadata"]["routed_provider"] == "secondary"
+        assert router.stats["primary"].error_rate() == 1.0
+
+    def test_failed_provider_ranked_last(self, make_router):
+        router, providers = make_router({"primary": [("error", 0)], "secondary": [("ok", 0)]})
+
+        async def scenario():
+            for _ in range(3):
+                await router.generate_image("山间小径")
+
+        asyncio.run(scenario())
+        # 只有失败样本的提供商得分最差，后续请求优先路由到备用提供商
+        assert providers["primary"].calls == 1
+        assert providers["secondary"].calls == 3
+
+    def test_open_breaker_skips_provider(self, make_router):
+        router, providers = make_router({"primary": [("ok", 0)], "secondary": [("fallback", 0)]})
+        for _ in range(2):
+            router.stats["primary"].record(0.1, False)
+        assert router.stats["primary"].state == ProviderStats.OPEN
+
+        result = asyncio.run(router.generate_image("山间小径"))
+
+        # 熔断中的提供商即使其余提供商全部失败也不调用
+        assert providers["primary"].calls == 0
+        assert result["metadata"]["provider"] == "secondary"
+
+    def test_half_open_probe_recovers_provider(self, make_router):
+        router, providers = make_router({"primary": [("ok", 0)], "secondary": [("fallback", 0)]})
+        for _ in range(2):
+            router.stats["primary"].record(0.1, False)
+        router.stats["primary"].opened_at = time.monotonic() - 61
+
+        result = asyncio.run(router.generate_image("山间小径"))
+
+        # 冷却结束后放行探测请求，成功即关闭熔断
+        assert result["metadata"]["routed_provider"] == "primary"
+        assert router.stats["primary"].state == ProviderStats.CLOSED
+
+    def test_all_failed_returns_last_fallback(self, make_router):
+        router, providers = make_router({"primary": [("error", 0)], "secondary": [("fallback", 0)]})
+
+        result = asyncio.run(router.generate_image("山间小径"))
+
+        assert result["metadata"]["fallback"] is True
+        assert result["metadata"]["provider"] == "secondary"
+
+    def test_all_open_returns_placeholder(self, make_router):
+        router, providers = make_router({"primary": [("error", 0)], "secondary": [("error", 0)]})
+
+        async def scenario():
+            for _ in range(2):
+                await router.generate_image("山间小径")
+            return await router.generate_image("山间小径")
+
+        result = asyncio.run(scenario())
+        assert result["metadata"]["reason"] == "all_providers_circuit_open"
+        assert providers["primary"].calls == 2
+        assert not asyncio.run(router.health_check())
+
+    def test_prefers_faster_provider(self, make_router):
+        router, providers = make_router({"slow": [("ok", 0)], "fast": [("ok", 0)]})
+        for _ in range(5):
+            router.stats["slow"].record(3.0, True)
+            router.stats["fast"].record(1.0, True)
+
+        result = asyncio.run(router.generate_image("山间小径"))
+
+        assert result["metadata"]["routed_provider"] == "fast"
+        assert providers["slow"].calls == 0
+
+
+class TestHedging:
+    """p95对冲请求"""
+
+    def test_hedges_after_p95(self, make_router):
+        router, providers = make_router(
+            {"primary": [("ok", 1.0)], "secondary": [("ok", 0.01)]},
+            IMAGE_ROUTER_HEDGING="on",
+            IMAGE_ROUTER_HEDGE_MIN_SAMPLES=3,
+            IMAGE_ROUTER_HEDGE_MIN_DELAY=0.05
+        )
+        for _ in range(3):
+            router.stats["primary"].record(0.05, True)
+            router.stats["secondary"].record(0.5, True)
+
+        async def scenario():
+            started = time.monotonic()
+            result = await router.generate_image("山间小径")
+            elapsed = time.monotonic() - started
+            # 等待被取消的主请求退出
+            await asyncio.sleep(0.05)
+            return result, elapsed
+
+        result, elapsed = asyncio.run(scenario())
+        assert result["metadata"]["routed_provider"] == "secondary"
+        assert elapsed < 0.5
+        # 落败的主请求被取消，不计入统计
+        assert providers["primary"].cancelled == 1
+        assert len(router.stats["primary"].samples) == 3
+        assert router.stats["primary"].state == ProviderStats.CLOSED
+
+    def test_no_hedge_without_enough_samples(self, make_router):
+        router, providers = make_router(
+            {"primary": [("ok", 0.1)], "secondary": [("ok", 0)]},
+            IMAGE_ROUTER_HEDGING="on",
+            IMAGE_ROUTER_HEDGE_MIN_SAMPLES=3,
+            IMAGE_ROUTER_HEDGE_MIN_DELAY=0.01
+        )
+
+        result = asyncio.run(router.generate_image("山间小径"))
+
+        assert result["metadata"]["routed_provider"] == "primary"
+        assert providers["secondary"].calls == 0
+
+    def test_hedging_disabled_by_default(self, make_router):
+        router, providers = make_router({"primary": [("ok", 0.1)], "secondary": [("ok", 0)]})
+        for _ in range(5):
+            router.stats["primary"].record(0.01, True)
+            router.stats["secondary"].record(0.5, True)
+
+        result = asyncio.run(router.generate_image("山间小径"))
+
+        assert result["metadata"]["routed_provider"] == "primary"
+        assert providers["secondary"].calls == 0
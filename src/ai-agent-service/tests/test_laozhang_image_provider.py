@@ -0,0 +1,84 @@
+"""
+老张AI图片提取测试
+用构造的聊天补全响应字节验证各种包裹形式（JSON字符串、markdown图片、"/"被转义）下的base64数据段提取
+"""
+
+import asyncio
+import base64
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.providers.laozhang_image_provider as laozhang_image_provider
+from app.providers.laozhang_image_provider import LaoZhangImageProvider
+
+# 足够长、编码结果含 "/" 且无填充（数据段后混入的字符不会被 "=" 截断）的图片字节
+IMAGE_BYTES = (bytes(range(256)) * 4)[:1023]
+B64 = base64.b64encode(IMAGE_BYTES).decode("ascii")
+assert "/" in B64 and not B64.endswith("=")
+
+
+class FakeStore:
+    """记录写入的图片字节"""
+
+    def __init__(self):
+        self.saved = []
+
+    async def put_bytes(self, data, ext, retention=None):
+        self.saved.append((bytes(data), ext))
+        key = f"cas/00/00/image.{ext}"
+        return {"key": key, "url": f"/generated/{key}", "size": len(data)}
+
+
+@pytest.fixture
+def extract(monkeypatch):
+    """以原始响应字节运行 _extract_and_save_image，返回 (结果, 写入的字节与扩展名)"""
+    def run(raw: bytes):
+        store = FakeStore()
+        monkeypatch.setattr(laozhang_image_provider, "get_content_store", lambda: store)
+        result = asyncio.run(LaoZhangImageProvider()._extract_and_save_image(raw))
+        return result, store.saved
+
+    return run
+
+
+def _response(content: str, escape_slashes: bool = False) -> bytes:
+    body = json.dumps({"choices": [{"message": {"content": content}}]})
+    if escape_slashes:
+        body = body.replace("/", "\\/")
+    return body.encode("utf-8")
+
+
+class TestExtractImage:
+    """base64数据段定位与解码"""
+
+    def test_plain_data_uri(self, extract):
+        result, saved = extract(_response(f"data:image/png;base64,{B64}"))
+
+        assert result == ("/generated/cas/00/00/image.png", "cas/00/00/image.png")
+        assert saved == [(IMAGE_BYTES, "png")]
+
+    def test_markdown_wrapped(self, extract):
+        _, saved = extract(_response(f"已生成：\n![image](data:image/png;base64,{B64}) 祝你愉快"))
+
+        assert saved == [(IMAGE_BYTES, "png")]
+
+    def test_markdown_wrapped_with_escaped_slashes(self, extract):
+        raw = _response(f"![image](data:image/jpeg;base64,{B64})\n希望你喜欢", escape_slashes=True)
+        assert b"data:image\\/jpeg" in raw
+
+        result, saved = extract(raw)
+
+        # 去转义后截到 ")" 为止，不把markdown括号与后续说明文字混入base64
+        assert result is not None
+        assert saved == [(IMAGE_BYTES, "jpeg")]
+
+    def test_missing_image_returns_none(self, extract):
+        result, saved = extract(_response("抱歉，暂时无法生成图片"))
+
+        assert result is None
+        assert saved == []
@@ -0,0 +1,110 @@
+"""
+截图渲染缓存测试
+使用 fakeredis 验证并发相同请求只渲染一次，以及首个请求的渲染结果/异常/取消如何传给等待者
+"""
+
+import asyncio
+import os
+import sys
+
+import fakeredis
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.utils.redis_client as redis_client
+from app.services.render_cache import RenderCache
+from app.services.render_scheduler import RenderRejected
+
+
+@pytest.fixture
+def run_cache(monkeypatch):
+    """在独立事件循环中以 scenario(cache) 运行"""
+    def run(scenario):
+        async def main():
+            client = fakeredis.aioredis.FakeRedis()
+            monkeypatch.setattr(redis_client, "get_async_redis_client", lambda: client)
+            return await scenario(RenderCache())
+
+        return asyncio.run(main())
+
+    return run
+
+
+class TestCoalescing:
+    """同一进程内并发相同请求的合并"""
+
+    def test_failed_render_returns_none_to_waiters(self, run_cache):
+        calls = []
+
+        async def render():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return None
+
+        async def scenario(cache):
+            return await asyncio.gather(*(cache.get_or_render("card", render) for _ in range(3)))
+
+        results = run_cache(scenario)
+        assert len(calls) == 1
+        assert all(result == (None, False) for result in results)
+
+    def test_rejection_propagates_to_waiters(self, run_cache):
+        calls = []
+
+        async def render():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            raise RenderRejected("渲染队列已满")
+
+        async def scenario(cache):
+            return await asyncio.gather(
+                *(cache.get_or_render("card", render) for _ in range(3)),
+                return_exceptions=True
+            )
+
+        results = run_cache(scenario)
+        assert len(calls) == 1
+        assert all(isinstance(result, RenderRejected) for result in results)
+
+    def test_next_request_renders_again_after_rejection(self, run_cache):
+        outcomes = [RenderRejected("渲染队列已满"), None]
+
+        async def render():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        async def scenario(cache):
+            with pytest.raises(RenderRejected):
+                await cache.get_or_render("card", render)
+            return await cache.get_or_render("card", render)
+
+        assert run_cache(scenario) == (None, False)
+        assert outcomes == []
+
+    def test_waiters_render_again_when_first_request_cancelled(self, run_cache):
+        calls = []
+
+        async def render():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"key": f"cas/00/00/{len(calls)}.png"}
+
+        async def scenario(cache):
+            # 首个请求在渲染完成前超时
+            first = asyncio.create_task(asyncio.wait_for(cache.get_or_render("card", render), 0.01))
+            await asyncio.sleep(0)
+            waiters = [asyncio.create_task(cache.get_or_render("card", render)) for _ in range(2)]
+            with pytest.raises(asyncio.TimeoutError):
+                await first
+            return await asyncio.gather(*waiters)
+
+        results = run_cache(scenario)
+        # 等待者没有拿到None，而是合并为一次新的渲染
+        assert len(calls) == 2
+        assert sorted(results, key=lambda result: result[1]) == [
+            ({"key": "cas/00/00/2.png"}, False),
+            ({"key": "cas/00/00/2.png"}, True)
+        ]
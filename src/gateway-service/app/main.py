@@ -6,7 +6,7 @@ import os
 import logging
 from logging.handlers import RotatingFileHandler
 import asyncio
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict, Optional
 
 app = FastAPI(
     title="Gateway Service",
@@ -46,6 +46,24 @@ SERVICES = {
     "ai-agent-service": os.getenv("AI_AGENT_SERVICE_URL", "http://ai-agent-service:8000")
 }
 
+# 上传请求体上限（base64上传的JSON约为图片原始大小的4/3，另加multipart余量）
+UPLOAD_MAX_BODY = int(os.getenv("GATEWAY_UPLOAD_MAX_BODY", str(7 * 1024 * 1024)))
+
+
+class BodyTooLarge(Exception):
+    """转发中的请求体超过上限"""
+    pass
+
+
+async def _limited_stream(request: Request, max_size: int) -> AsyncIterator[bytes]:
+    """按块转发请求体，累计超过 max_size 时中止"""
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_size:
+            raise BodyTooLarge()
+        yield chunk
+
 @app.get("/")
 async def read_root():
     return {
@@ -69,9 +87,14 @@ async def proxy_request(
     method: str,
     path: str,
     request: Request,
-    timeout: int = 30
+    timeout: int = 30,
+    max_body_size: Optional[int] = None
 ) -> Response:
-    """代理HTTP请求到目标服务"""
+    """代理HTTP请求到目标服务
+
+    指定 max_body_size 时请求体不在网关缓存：声明长度超限直接返回413，否则按块流式转发。
+    """
+    too_large = JSONResponse(status_code=413, content={"code": 413, "message": "请求体过大", "data": None})
     try:
         # 构建完整URL
         full_url = f"{target_url}{path}"
@@ -80,7 +103,7 @@ async def proxy_request(
         headers = dict(request.headers)
         # 移除会导致上游与实际转发内容不一致的头部
         headers.pop("host", None)  # 移除原始host头
-        headers.pop("content-length", None)
+        content_length = headers.pop("content-length", None)
         headers.pop("transfer-encoding", None)
         # 对于无请求体的方法，不转发 content-type，避免误导上游
         if method.upper() not in ["POST", "PUT", "PATCH"]:
@@ -91,7 +114,16 @@ async def proxy_request(
         # 获取请求体
         body = None
         if method.upper() in ["POST", "PUT", "PATCH"]:
-            body = await request.body()
+            if max_body_size is None:
+                body = await request.body()
+            else:
+                if content_length and content_length.isdigit():
+                    if int(content_length) > max_body_size:
+                        logger.warning(f"请求体超过上限，已拒绝: {path} ({content_length} 字节)")
+                        return too_large
+                    # 保留声明长度，上游可据此提前拒绝
+                    headers["content-length"] = content_length
+                body = _limited_stream(request, max_body_size)
         
         # 发起请求
         async with httpx.AsyncClient(timeout=timeout) as client:
@@ -122,6 +154,9 @@ async def proxy_request(
     except httpx.TimeoutException:
         logger.error(f"请求超时: {target_url}{path}")
         return JSONResponse(status_code=504, content={"code": 504, "message": "服务请求超时", "data": None})
+    except BodyTooLarge:
+        logger.warning(f"请求体超过上限，已中止转发: {path}")
+        return too_large
     except Exception as e:
         logger.error(f"代理请求失败: {str(e)}")
         return JSONResponse(status_code=502, content={"code": 502, "message": f"服务暂时不可用: {str(e)}", "data": None})
@@ -171,6 +206,18 @@ async def miniprogram_ai_proxy(path: str, request: Request):
         timeout=120  # AI服务需要更长超时时间
     )
 
+# 情绪图片上传路由（含二进制上传，返回存储引用）
+@app.api_route("/api/v1/upload/{path:path}", methods=["GET", "POST"])
+async def upload_proxy(path: str, request: Request):
+    """图片上传服务代理（请求体流式转发，不在网关缓存）"""
+    return await proxy_request(
+        SERVICES["ai-agent-service"],
+        request.method,
+        f"/api/v1/upload/{path}",
+        request,
+        max_body_size=UPLOAD_MAX_BODY
+    )
+
 # 小程序健康检查
 @app.get("/api/v1/miniprogram/health")
 async def miniprogram_health():
@@ -1236,6 +1236,65 @@ Page({
     }
   },
 
+  /**
+   * 将canvas导出为临时图片文件
+   */
+  getCanvasTempFile() {
+    return new Promise((resolve, reject) => {
+      wx.canvasToTempFilePath({
+        canvas: this.canvas,
+        success: (res) => resolve(res.tempFilePath),
+        fail: (error) => {
+          envConfig.error('Canvas转临时文件失败:', error);
+          reject(new Error(`Canvas转图片失败: ${error.errMsg || error.message || '未知错误'}`));
+        }
+      });
+    });
+  },
+
+  /**
+   * 以二进制请求体上传情绪图片（不做base64编码），返回不透明的存储引用 blob_ref
+   */
+  async uploadEmotionImageBlob(tempFilePath) {
+    const userToken = wx.getStorageSync('userToken');
+    if (!userToken) {
+      throw new Error('用户未登录');
+    }
+
+    const buffer = await new Promise((resolve, reject) => {
+      wx.getFileSystemManager().readFile({
+        filePath: tempFilePath,
+        success: (res) => resolve(res.data),
+        fail: (error) => reject(new Error(`读取canvas图片数据失败: ${error.errMsg || '未知错误'}`))
+      });
+    });
+    envConfig.log('开始上传情绪图片二进制数据，字节数:', buffer.byteLength);
+
+    return new Promise((resolve, reject) => {
+      wx.request({
+        url: envConfig.getApiUrl('/upload/emotion-blob'),
+        method: 'POST',
+        header: {
+          'Authorization': `Bearer ${userToken}`,
+          'Content-Type': 'image/png'
+        },
+        data: buffer,
+        success: (res) => {
+          const data = res.data || {};
+          if (res.statusCode === 200 && data.success && data.data && data.data.blob_ref) {
+            envConfig.log('情绪图片二进制上传成功:', data.data.blob_ref);
+            resolve(data.data.blob_ref);
+          } else {
+            reject(new Error(`HTTP ${res.statusCode}: ${JSON.stringify(res.data) || '上传失败'}`));
+          }
+        },
+        fail: (error) => {
+          reject(new Error(`网络请求失败: ${error.errMsg || error.message || '未知错误'}`));
+        }
+      });
+    });
+  },
+
   /**
    * 分析绘画轨迹数据，提供详细的绘制特征分析 - 心象签专用版本
    */
@@ -1879,8 +1938,9 @@ Page({
     }
 
     try {
-      // Step 1: 获取情绪墨迹的base64数据（直接传给生成接口）
+      // Step 1: 上传情绪墨迹图片（二进制），生成接口只传存储引用；上传失败时退回内联base64
       // 注意：为避免原生 canvas 层级遮挡加载层，先完成截图再进入生成状态
+      let emotionImageRef = null;
       let emotionImageBase64 = null;
       try {
         // 检查是否有绘制内容
@@ -1888,10 +1948,16 @@ Page({
           envConfig.log('没有足够的绘制内容，跳过图片处理');
         } else {
           // 先行截图，完成后再显示加载遮罩
-          const imageData = await this.getCanvasBase64Data();
-          const fmt = (imageData && imageData.format) ? imageData.format : 'png';
-          emotionImageBase64 = `data:image/${fmt};base64,${imageData.base64}`;
-          envConfig.log('情绪墨迹base64数据提取成功，数据长度:', emotionImageBase64.length);
+          try {
+            const tempFilePath = await this.getCanvasTempFile();
+            emotionImageRef = await this.uploadEmotionImageBlob(tempFilePath);
+          } catch (uploadError) {
+            envConfig.warn('情绪图片二进制上传失败，改为内联base64:', uploadError);
+            const imageData = await this.getCanvasBase64Data();
+            const fmt = (imageData && imageData.format) ? imageData.format : 'png';
+            emotionImageBase64 = `data:image/${fmt};base64,${imageData.base64}`;
+            envConfig.log('情绪墨迹base64数据提取成功，数据长度:', emotionImageBase64.length);
+          }
         }
       } catch (imageError) {
         envConfig.warn('情绪图片数据提取失败，继续使用轨迹分析:', imageError);
@@ -1984,7 +2050,8 @@ Page({
           trajectory: this.emotionPath || [],
           analysis: drawingAnalysis
         },
-        // 🆕 直接传递base64编码的情绪图片数据
+        // 情绪图片：优先只传存储引用，二进制上传失败时才内联base64
+        emotion_image_ref: emotionImageRef,
         emotion_image_base64: emotionImageBase64,
         // 🔮 传递心境速测问答数据
         quiz_answers: this.data.quizAnswers || []
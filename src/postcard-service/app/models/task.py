@@ -3,6 +3,9 @@ from typing import Dict, Any, Optional, List, Union
 from enum import Enum
 from datetime import datetime
 
+# 情绪图片引用格式（与 ai-agent-service 内容存储的 blob 引用一致）
+EMOTION_IMAGE_REF_PATTERN = r"^blob:[0-9a-f]{64}\.[a-z0-9]{1,8}$"
+
 class TaskType(str, Enum):
     POSTCARD_GENERATION = "postcard_generation"
 
@@ -27,6 +30,8 @@ class PostcardGenerationTask(BaseModel):
     created_at: str
     # 🆕 版本3.0新增：直接包含base64编码的情绪图片数据
     emotion_image_base64: Optional[str] = None
+    # 情绪图片的不透明存储引用（替代内联base64，由 ai-agent-service 按引用读取）
+    emotion_image_ref: Optional[str] = None
     # 🆕 心象签新增：问答数据
     quiz_answers: Optional[List[QuizAnswer]] = Field(default_factory=list)
     metadata: Dict[str, Any] = Field(default_factory=dict)
@@ -38,6 +43,8 @@ class PostcardRequest(BaseModel):
     user_id: Optional[str] = None
     # 🆕 版本3.0新增：直接接收base64编码的情绪图片数据
     emotion_image_base64: Optional[str] = None
+    # 情绪图片二进制上传接口返回的引用（blob:<sha256>.<ext>），优先于base64
+    emotion_image_ref: Optional[str] = Field(None, pattern=EMOTION_IMAGE_REF_PATTERN)
     # 🆕 心象签新增：问答数据
     quiz_answers: Optional[List[QuizAnswer]] = Field(default_factory=list)
 
@@ -13,8 +13,12 @@ from urllib.parse import urlparse, quote
 import bleach
 from pydantic import BaseModel, field_validator, ValidationInfo
 
+from ..models.task import EMOTION_IMAGE_REF_PATTERN
+
 logger = logging.getLogger(__name__)
 
+EMOTION_IMAGE_REF_RE = re.compile(EMOTION_IMAGE_REF_PATTERN)
+
 
 class InputValidationConfig:
     """输入验证配置"""
@@ -206,6 +210,21 @@ class InputValidationService:
         
         return result
     
+    def validate_emotion_image_ref(self, image_ref: str) -> Dict[str, Any]:
+        """验证情绪图片存储引用（二进制上传接口返回的 blob:<sha256>.<ext>）"""
+        result = {
+            "is_valid": True,
+            "errors": [],
+            "warnings": []
+        }
+        
+        # 情绪图片是可选的
+        if image_ref and not EMOTION_IMAGE_REF_RE.match(image_ref):
+            result["is_valid"] = False
+            result["errors"].append("图片引用格式不正确")
+        
+        return result
+    
     def _detect_malicious_patterns(self, text: str) -> Optional[str]:
         """检测恶意模式"""
         for pattern in self.config.MALICIOUS_PATTERNS:
@@ -324,6 +343,15 @@ class RequestValidationMiddleware:
                 result["sanitized_data"]["emotion_image_base64"] = request_data.get('emotion_image_base64', '')
                 result["warnings"].extend(image_data_result["warnings"])
             
+            image_ref_result = self.validator.validate_emotion_image_ref(
+                request_data.get('emotion_image_ref') or ''
+            )
+            if not image_ref_result["is_valid"]:
+                result["is_valid"] = False
+                result["errors"].extend(image_ref_result["errors"])
+            elif request_data.get('emotion_image_ref'):
+                result["sanitized_data"]["emotion_image_ref"] = request_data['emotion_image_ref']
+            
         except Exception as e:
             logger.error(f"❌ 请求验证失败: {str(e)}")
             result["is_valid"] = False
@@ -96,8 +96,9 @@ class PostcardService:
                 theme=request.theme,
                 user_id=request.user_id,
                 created_at=china_now().isoformat(),
-                # 🆕 传递base64编码的情绪图片数据
-                emotion_image_base64=request.emotion_image_base64,
+                # 情绪图片：有二进制上传引用时只传引用，不再内联base64
+                emotion_image_ref=request.emotion_image_ref,
+                emotion_image_base64=None if request.emotion_image_ref else request.emotion_image_base64,
                 # 🔮 传递心象签问答数据
                 quiz_answers=request.quiz_answers or []
             )
@@ -331,10 +332,14 @@ class PostcardService:
             
             # 保存用户ID用于配额恢复
             user_id = postcard.user_id
+            task_id = postcard.task_id
             
             self.db.delete(postcard)
             self.db.commit()
             
+            # 解除明信片对生成图片等产物的引用
+            await self.queue_service.release_storage_references(task_id)
+            
             # 🔥 释放今日卡片位置（不恢复生成次数）（自动选择服务）
             quota_service = self._get_quota_service()
             if hasattr(quota_service, 'release_card_position_safe'):
@@ -72,6 +72,15 @@ class QueueService:
             logger.error(f"❌ 发布任务失败: {task.task_id} - {e}")
             raise
 
+    async def release_storage_references(self, task_id: str):
+        """通知AI服务释放该任务对生成产物的引用（由其存储GC异步回收）"""
+        try:
+            client = await self.get_redis_client()
+            await client.sadd("cas:released_owners", task_id)
+        except Exception as e:
+            # 释放失败只会让文件晚些回收，不影响删除操作
+            logger.warning(f"⚠️ 释放存储引用失败: {task_id} - {e}")
+
     async def create_consumer_group(self):
         """创建消费者组（如果不存在）"""
         try: